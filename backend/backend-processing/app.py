@@ -2,6 +2,7 @@ from flask import Flask, jsonify
 from flask_cors import CORS
 from routes import all_blueprints
 from config import initialize_firebase
+from utils.schema_registry import get_schema_registry
 import os
 
 # Initialize Flask app
@@ -13,6 +14,9 @@ CORS(app)
 # Initialize Firebase
 initialize_firebase()
 
+# Load and validate every summary schema version before the first request
+get_schema_registry()
+
 # Register all route blueprints
 for bp in all_blueprints:
     app.register_blueprint(bp)
@@ -37,9 +41,12 @@ def root():
             'POST /appointments': 'Create an empty appointment',
             'POST /appointments/{id}/upload-recording-new': 'Upload recording to GCS (no processing)',
             'POST /appointments/{id}/upload-notes': 'Store plain text notes on appointment',
-            'POST /appointments/{id}/upload-document': 'Upload PDF document to GCS',
+            'POST /appointments/{id}/upload-document': 'Upload PDF document to GCS (text extracted in the background)',
+            'POST /appointments/{id}/upload-sessions': 'Start a direct-to-GCS resumable upload',
+            'POST /appointments/{id}/upload-sessions/complete': 'Link a directly uploaded file to the appointment',
             'POST /appointments/{id}/process': 'Process appointment (transcribe, extract PDF, summarize)',
             'POST /appointments/{id}/audio-chunks': 'Upload audio chunk for transcription',
+            'WS /appointments/{id}/live-transcription': 'Stream audio and receive live transcripts',
             'POST /appointments/{id}/generate-questions': 'Generate patient questions',
             'POST /appointments/{id}/finalize': 'Finalize appointment with full audio',
             'POST /appointments/{id}/upload-recording': 'Upload and process full audio (legacy)',
@@ -48,6 +55,7 @@ def root():
             'POST /appointments/generate-questions-try': 'Generate questions (no auth)',
             'POST /appointments/upload-recording-try': 'Upload recording + SOAP (no auth)',
             'POST /appointments/upload-notes-try': 'Notes to SOAP (no auth)',
+            'GET /summary-schemas': 'List available summary schema versions',
         }
     }), 200
 
@@ -31,3 +31,138 @@ GCP_BUCKET_NAME = os.getenv('GCP_BUCKET_NAME')
 GCP_LOCATION = os.getenv('GCP_LOCATION', 'us-central1')
 VERTEX_AI_MODEL = os.getenv('VERTEX_AI_MODEL', 'gemini-1.5-pro')
 FIRESTORE_DATABASE_ID = os.getenv('FIRESTORE_DATABASE_ID', '(default)')
+
+# Speech-to-Text Configuration
+STT_MAX_CONCURRENCY = int(os.getenv('STT_MAX_CONCURRENCY', '8'))
+STT_CHUNK_MAX_RETRIES = int(os.getenv('STT_CHUNK_MAX_RETRIES', '2'))
+STT_RETRY_BACKOFF_SECONDS = float(os.getenv('STT_RETRY_BACKOFF_SECONDS', '1.0'))
+
+# Audio segmentation: 'vad' cuts segments at pauses and skips silence, 'fixed' uses 30 s slices
+STT_SEGMENTER = os.getenv('STT_SEGMENTER', 'vad')
+VAD_ENERGY_THRESHOLD = int(os.getenv('VAD_ENERGY_THRESHOLD', '300'))
+VAD_MIN_SPEECH_MS = int(os.getenv('VAD_MIN_SPEECH_MS', '300'))
+VAD_MAX_SEGMENT_SECONDS = float(os.getenv('VAD_MAX_SEGMENT_SECONDS', '30'))
+
+# Transcription mode: 'chunked' transcribes segments concurrently, 'long' feeds one
+# continuous stream through a few long recognition sessions with automatic rollover
+STT_TRANSCRIPTION_MODE = os.getenv('STT_TRANSCRIPTION_MODE', 'chunked')
+STT_STREAM_MAX_SECONDS = float(os.getenv('STT_STREAM_MAX_SECONDS', '290'))
+STT_STREAM_OVERLAP_SECONDS = float(os.getenv('STT_STREAM_OVERLAP_SECONDS', '2'))
+
+# Live transcription: persist final results in batches
+LIVE_PERSIST_BATCH_SIZE = int(os.getenv('LIVE_PERSIST_BATCH_SIZE', '5'))
+LIVE_PERSIST_INTERVAL_SECONDS = float(os.getenv('LIVE_PERSIST_INTERVAL_SECONDS', '10'))
+# Each open live session holds one of gunicorn's --threads=8 handler threads for its whole
+# duration; sessions beyond this limit are refused so HTTP routes always keep free threads
+LIVE_MAX_SESSIONS = int(os.getenv('LIVE_MAX_SESSIONS', '4'))
+
+# Transcription cache ('memory', 'disk', 'gcs' or 'none'), keyed by audio hash + STT config
+TRANSCRIPT_CACHE_BACKEND = os.getenv('TRANSCRIPT_CACHE_BACKEND', 'memory')
+TRANSCRIPT_CACHE_MAX_BYTES = int(os.getenv('TRANSCRIPT_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+TRANSCRIPT_CACHE_DIR = os.getenv('TRANSCRIPT_CACHE_DIR', '/tmp/transcript-cache')
+
+# Streaming uploads: bytes per resumable upload request (multiple of 256 KB)
+GCS_UPLOAD_CHUNK_SIZE = int(os.getenv('GCS_UPLOAD_CHUNK_SIZE', str(8 * 1024 * 1024)))
+
+# Background PDF text extraction after upload-document
+PDF_EXTRACTION_WORKERS = int(os.getenv('PDF_EXTRACTION_WORKERS', '2'))
+
+# PDF extraction engine
+PDF_EXTRACT_PROCESSES = int(os.getenv('PDF_EXTRACT_PROCESSES', '2'))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', '8'))
+PDF_PAGE_TIMEOUT_SECONDS = float(os.getenv('PDF_PAGE_TIMEOUT_SECONDS', '10'))
+PDF_DOCUMENT_TIMEOUT_SECONDS = float(os.getenv('PDF_DOCUMENT_TIMEOUT_SECONDS', '90'))
+PDF_WORKER_MEMORY_MB = int(os.getenv('PDF_WORKER_MEMORY_MB', '768'))
+PDF_MAX_PAGES = int(os.getenv('PDF_MAX_PAGES', '300'))
+PDF_MAX_CHARS = int(os.getenv('PDF_MAX_CHARS', '500000'))
+
+# Cross-instance extraction marker: how long an in-progress extraction holds a
+# document before another instance may take it over, and how often a waiting
+# instance checks for the stored text
+DOCUMENT_EXTRACTION_LEASE_SECONDS = float(os.getenv('DOCUMENT_EXTRACTION_LEASE_SECONDS', str(PDF_DOCUMENT_TIMEOUT_SECONDS + 30)))
+DOCUMENT_EXTRACTION_POLL_SECONDS = float(os.getenv('DOCUMENT_EXTRACTION_POLL_SECONDS', '2'))
+
+# Prompt text reduction: repeated PDF page lines and near-duplicate passages across documents
+PDF_BOILERPLATE_MIN_PAGE_RATIO = float(os.getenv('PDF_BOILERPLATE_MIN_PAGE_RATIO', '0.5'))
+DOCUMENT_DEDUP_SIMILARITY = float(os.getenv('DOCUMENT_DEDUP_SIMILARITY', '0.85'))
+
+# Transcript compaction before prompting (fillers, false starts, chunk-join repeats)
+TRANSCRIPT_COMPACTION_ENABLED = os.getenv('TRANSCRIPT_COMPACTION_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+TRANSCRIPT_FILLER_WORDS = frozenset(
+    w.strip().lower() for w in os.getenv('TRANSCRIPT_FILLER_WORDS', 'um,umm,uh,uhh,uhm,erm,hmm').split(',') if w.strip()
+)
+TRANSCRIPT_COMPACTION_MAX_NGRAM = int(os.getenv('TRANSCRIPT_COMPACTION_MAX_NGRAM', '8'))
+
+# SOAP response cache ('memory', 'disk', 'gcs', 'redis' or 'none'), keyed by assembled prompt + model + generation config
+SOAP_CACHE_BACKEND = os.getenv('SOAP_CACHE_BACKEND', 'memory')
+SOAP_CACHE_MAX_BYTES = int(os.getenv('SOAP_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+SOAP_CACHE_TTL_SECONDS = int(os.getenv('SOAP_CACHE_TTL_SECONDS', str(24 * 3600)))
+SOAP_CACHE_DIR = os.getenv('SOAP_CACHE_DIR', '/tmp/soap-cache')
+SOAP_CACHE_REDIS_URL = os.getenv('SOAP_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+
+# Summary schema registry: 'full' keeps the commented schema, 'compact' strips comments to save prompt tokens
+SUMMARY_SCHEMA_VARIANT = os.getenv('SUMMARY_SCHEMA_VARIANT', 'full')
+SUMMARY_SCHEMA_HOT_RELOAD = os.getenv('SUMMARY_SCHEMA_HOT_RELOAD', 'false').lower() in ('1', 'true', 'yes')
+SUMMARY_SCHEMA_RELOAD_INTERVAL_SECONDS = float(os.getenv('SUMMARY_SCHEMA_RELOAD_INTERVAL_SECONDS', '2'))
+
+# Map-reduce summarization for inputs beyond the single-call budget (token counts are estimates)
+SUMMARY_MAP_REDUCE_THRESHOLD_TOKENS = int(os.getenv('SUMMARY_MAP_REDUCE_THRESHOLD_TOKENS', '120000'))
+SUMMARY_WINDOW_TOKENS = int(os.getenv('SUMMARY_WINDOW_TOKENS', '24000'))
+SUMMARY_MAP_CONCURRENCY = int(os.getenv('SUMMARY_MAP_CONCURRENCY', '4'))
+
+# Streamed summary generation: write each finished section to processedSummaryDraft as it arrives
+SOAP_STREAM_SECTIONS = os.getenv('SOAP_STREAM_SECTIONS', 'true').lower() in ('1', 'true', 'yes')
+SOAP_DRAFT_FLUSH_SECONDS = float(os.getenv('SOAP_DRAFT_FLUSH_SECONDS', '1.0'))
+
+# Structured output: send a response schema and JSON MIME type so the model returns bare JSON
+VERTEX_STRUCTURED_OUTPUT = os.getenv('VERTEX_STRUCTURED_OUTPUT', 'true').lower() in ('1', 'true', 'yes')
+
+# Vertex AI call layer: deadlines, retries with jittered backoff, optional hedging, circuit breaker
+VERTEX_CALL_DEADLINE_SECONDS = float(os.getenv('VERTEX_CALL_DEADLINE_SECONDS', '240'))
+VERTEX_ATTEMPT_TIMEOUT_SECONDS = float(os.getenv('VERTEX_ATTEMPT_TIMEOUT_SECONDS', '150'))
+VERTEX_MAX_ATTEMPTS = int(os.getenv('VERTEX_MAX_ATTEMPTS', '4'))
+VERTEX_BACKOFF_BASE_SECONDS = float(os.getenv('VERTEX_BACKOFF_BASE_SECONDS', '1.0'))
+VERTEX_BACKOFF_MAX_SECONDS = float(os.getenv('VERTEX_BACKOFF_MAX_SECONDS', '20'))
+VERTEX_HEDGE_ENABLED = os.getenv('VERTEX_HEDGE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+VERTEX_HEDGE_PERCENTILE = float(os.getenv('VERTEX_HEDGE_PERCENTILE', '95'))
+VERTEX_HEDGE_MIN_SAMPLES = int(os.getenv('VERTEX_HEDGE_MIN_SAMPLES', '20'))
+VERTEX_BREAKER_FAILURE_THRESHOLD = int(os.getenv('VERTEX_BREAKER_FAILURE_THRESHOLD', '5'))
+VERTEX_BREAKER_RESET_SECONDS = float(os.getenv('VERTEX_BREAKER_RESET_SECONDS', '30'))
+VERTEX_CALL_WORKERS = int(os.getenv('VERTEX_CALL_WORKERS', '16'))
+
+# Request timeout: the Cloud Run --timeout that ends a request. The deploy workflow passes the
+# same value to the service, and the Dockerfile uses it for gunicorn --timeout (with gthread
+# workers that is only a worker heartbeat, so Cloud Run's limit is the one that applies).
+REQUEST_TIMEOUT_SECONDS = float(os.getenv('REQUEST_TIMEOUT_SECONDS', '3600'))
+# Time /process keeps after its input branches: one SOAP call (VERTEX_CALL_DEADLINE_SECONDS) plus
+# PROCESS_RESPONSE_MARGIN_SECONDS for Firestore writes and the response
+PROCESS_RESPONSE_MARGIN_SECONDS = float(os.getenv('PROCESS_RESPONSE_MARGIN_SECONDS', '60'))
+
+# /process fan-out: per-branch timeouts for the recording and each document. They default to the
+# request budget left after the SOAP step (3600 - 240 - 60 = 3300 s), so a branch times out while
+# the request can still report it. A timed-out branch thread is abandoned, not cancelled.
+PROCESS_BRANCH_BUDGET_SECONDS = max(REQUEST_TIMEOUT_SECONDS - VERTEX_CALL_DEADLINE_SECONDS - PROCESS_RESPONSE_MARGIN_SECONDS, 60)
+PROCESS_AUDIO_TIMEOUT_SECONDS = float(os.getenv('PROCESS_AUDIO_TIMEOUT_SECONDS', str(PROCESS_BRANCH_BUDGET_SECONDS)))
+PROCESS_DOCUMENT_TIMEOUT_SECONDS = float(os.getenv('PROCESS_DOCUMENT_TIMEOUT_SECONDS', str(min(120, PROCESS_BRANCH_BUDGET_SECONDS))))
+
+# Token-budget planning: 'estimate' (local ~4 chars/token), 'api' (Vertex AI count_tokens), or 'auto'
+# (count via the API only when the estimate is within TOKEN_COUNT_MARGIN of a decision threshold)
+TOKEN_COUNT_MODE = os.getenv('TOKEN_COUNT_MODE', 'auto')
+TOKEN_COUNT_MARGIN = float(os.getenv('TOKEN_COUNT_MARGIN', '0.25'))
+# Optional cheaper model for small prompts (empty: always use VERTEX_AI_MODEL)
+VERTEX_AI_FAST_MODEL = os.getenv('VERTEX_AI_FAST_MODEL', '')
+VERTEX_FAST_MODEL_MAX_INPUT_TOKENS = int(os.getenv('VERTEX_FAST_MODEL_MAX_INPUT_TOKENS', '8000'))
+
+# Incremental question generation: send only the transcript added since the last call plus a rolling digest
+QUESTIONS_INCREMENTAL = os.getenv('QUESTIONS_INCREMENTAL', 'true').lower() in ('1', 'true', 'yes')
+QUESTIONS_MIN_NEW_CHARACTERS = int(os.getenv('QUESTIONS_MIN_NEW_CHARACTERS', '400'))
+QUESTIONS_DIGEST_MAX_WORDS = int(os.getenv('QUESTIONS_DIGEST_MAX_WORDS', '250'))
+
+# Rolling summary: update a partial summary in the background while transcript segments arrive,
+# so /finalize only reconciles it with the rest of the transcript
+ROLLING_SUMMARY_ENABLED = os.getenv('ROLLING_SUMMARY_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+ROLLING_SUMMARY_DEBOUNCE_SECONDS = float(os.getenv('ROLLING_SUMMARY_DEBOUNCE_SECONDS', '20'))
+ROLLING_SUMMARY_MIN_NEW_CHARACTERS = int(os.getenv('ROLLING_SUMMARY_MIN_NEW_CHARACTERS', '1500'))
+ROLLING_SUMMARY_CONTEXT_CHARACTERS = int(os.getenv('ROLLING_SUMMARY_CONTEXT_CHARACTERS', '3000'))
+ROLLING_SUMMARY_FINALIZE_WAIT_SECONDS = float(os.getenv('ROLLING_SUMMARY_FINALIZE_WAIT_SECONDS', '15'))
+ROLLING_SUMMARY_WORKERS = int(os.getenv('ROLLING_SUMMARY_WORKERS', '2'))
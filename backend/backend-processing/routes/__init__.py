@@ -7,16 +7,25 @@ Modules:
 - audio.py             — Audio upload, chunking, transcription, finalize
 - processing.py        — AI processing, questions, notes, documents
 - try_endpoints.py     — Unauthenticated demo endpoints
+- live.py              — Live transcription over WebSocket
+- uploads.py           — Direct-to-GCS resumable upload sessions
+- schemas.py           — Summary schema version listing
 """
 
 from routes.appointments_crud import appointments_crud_bp
 from routes.audio import audio_bp
 from routes.processing import processing_bp
 from routes.try_endpoints import try_bp
+from routes.live import live_bp
+from routes.uploads import uploads_bp
+from routes.schemas import schemas_bp
 
 all_blueprints = [
     appointments_crud_bp,
     audio_bp,
     processing_bp,
     try_bp,
+    live_bp,
+    uploads_bp,
+    schemas_bp,
 ]
@@ -11,7 +11,14 @@ Endpoints:
 from flask import Blueprint, request, jsonify
 from datetime import datetime
 from utils.auth import verify_firebase_token
-from routes.services import db, get_services
+from routes.services import (
+    db,
+    get_services,
+    get_appointment_ref,
+    delete_transcript_segments,
+    delete_document_texts,
+    service_metrics,
+)
 
 appointments_crud_bp = Blueprint('appointments_crud', __name__)
 
@@ -20,12 +27,14 @@ appointments_crud_bp = Blueprint('appointments_crud', __name__)
 def health_check():
     """
     GET /health
-    Quick health check endpoint to verify service is online.
+    Quick health check endpoint to verify service is online. Includes
+    cache and call-coalescing counters of the services initialized so far.
     """
     return jsonify({
         'status': 'healthy',
         'service': 'backend-processing',
-        'timestamp': datetime.utcnow().isoformat()
+        'timestamp': datetime.utcnow().isoformat(),
+        'metrics': service_metrics(),
     }), 200
 
 
@@ -67,7 +76,8 @@ def create_appointment(user_id):
 def delete_appointment(user_id, appointment_id):
     """
     DELETE /appointments/{appointmentId}
-    Deletes all associated storage files (recordings + chunks) for the appointment.
+    Deletes all associated storage files (recordings, chunks, extracted document
+    text) and the transcript segment / document text records for the appointment.
     """
     try:
         _, storage_svc, _ = get_services()
@@ -80,12 +90,27 @@ def delete_appointment(user_id, appointment_id):
         chunks_deleted = storage_svc.delete_folder(f"chunks/{appointment_id}/")
         print(f"[Delete Appointment] Deleted {chunks_deleted} files from chunks/{appointment_id}/")
 
+        # Delete extracted document text (derived from the uploaded PDFs)
+        extracted_deleted = storage_svc.delete_folder(f"documents/{appointment_id}/extracted/")
+        print(f"[Delete Appointment] Deleted {extracted_deleted} files from documents/{appointment_id}/extracted/")
+
+        # Delete transcript segments and document text records
+        # (subcollections are not removed with the parent document)
+        appointment_ref = get_appointment_ref(user_id, appointment_id)
+        segments_deleted = delete_transcript_segments(appointment_ref)
+        print(f"[Delete Appointment] Deleted {segments_deleted} transcript segments")
+        document_texts_deleted = delete_document_texts(appointment_ref)
+        print(f"[Delete Appointment] Deleted {document_texts_deleted} document text records")
+
         return jsonify({
             'message': 'Storage files deleted successfully',
             'appointmentId': appointment_id,
             'filesDeleted': {
                 'recordings': recordings_deleted,
-                'chunks': chunks_deleted
+                'chunks': chunks_deleted,
+                'extractedDocumentText': extracted_deleted,
+                'transcriptSegments': segments_deleted,
+                'documentTexts': document_texts_deleted,
             }
         }), 200
 
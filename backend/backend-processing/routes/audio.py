@@ -12,14 +12,21 @@ from flask import Blueprint, request, jsonify
 from datetime import datetime
 from utils.auth import verify_firebase_token
 from utils.constants import Constants
+from utils.audio_pipeline import encode_pcm_to_webm, PushStream, TeeReader
+from utils.vad import create_segmenter
 from routes.services import (
     get_services,
     get_appointment_or_404,
     set_appointment_error,
     detect_file_extension,
-    split_audio_to_webm_chunks,
+    split_audio_to_pcm_segments,
     generate_soap_and_finalize,
+    append_transcript_segment,
+    materialize_transcript,
+    parse_force_regenerate,
+    schedule_rolling_summary,
 )
+from concurrent.futures import ThreadPoolExecutor
 import uuid
 
 audio_bp = Blueprint('audio', __name__)
@@ -30,7 +37,15 @@ audio_bp = Blueprint('audio', __name__)
 def upload_audio_chunk(user_id, appointment_id):
     """
     POST /appointments/{appointmentId}/audio-chunks
-    Processes a single audio chunk, transcribes it, and appends to rawTranscript.
+    Processes a single audio chunk, transcribes it, and stores the text as an
+    append-only transcript segment. Accepts an optional integer 'sequence' form
+    field to order segments; otherwise arrival order is used.
+
+    When the client sends 'startMs' (position of the chunk in the recording),
+    the segment records which part of the recording it covers so /process can
+    skip that audio. Without it the segment is stored untimed: concurrent or
+    out-of-order chunks make any inferred position unreliable, and /process
+    then transcribes the full recording instead of trusting the segments.
     """
     try:
         if 'audioChunk' not in request.files:
@@ -54,8 +69,10 @@ def upload_audio_chunk(user_id, appointment_id):
             print(f"[Audio Chunk] Uploaded to GCS: {gcs_uri}")
 
             print(f"[Audio Chunk] Starting transcription with inline audio ({len(audio_content)} bytes)...")
-            new_transcript_text = stt_service.transcribe_audio_chunk(audio_content, use_gcs=False, gcs_uri=None)
-            print(f"[Audio Chunk] Transcription completed")
+            new_transcript_text, duration_ms = stt_service.transcribe_audio_chunk_timed(
+                audio_content, input_format=detect_file_extension(audio_file.filename),
+            )
+            print(f"[Audio Chunk] Transcription completed ({duration_ms / 1000:.2f}s of audio)")
         except Exception as e:
             set_appointment_error(appointment_ref)
             print(f"[Audio Chunk] Transcription error: {str(e)}")
@@ -63,26 +80,25 @@ def upload_audio_chunk(user_id, appointment_id):
 
         print(f"[Audio Chunk] New transcript text length: {len(new_transcript_text)}")
 
-        # Re-fetch to avoid stale reads
-        appointment_doc = appointment_ref.get()
-        appointment_data = appointment_doc.to_dict()
-        current_transcript = appointment_data.get('rawTranscript', '')
-        print(f"[Audio Chunk] Current transcript length: {len(current_transcript)}")
-
-        updated_transcript = (current_transcript + '\n' + new_transcript_text) if current_transcript else new_transcript_text
-        print(f"[Audio Chunk] Updated transcript length: {len(updated_transcript)}")
-
-        appointment_ref.update({
-            'rawTranscript': updated_transcript,
-            'lastUpdated': datetime.utcnow().isoformat()
-        })
+        # Append-only: one small segment write, independent of transcript length
+        sequence = request.form.get('sequence', type=int)
+        start_ms = request.form.get('startMs', type=int)
+        end_ms = start_ms + duration_ms if start_ms is not None else None
+        segment_id = append_transcript_segment(
+            appointment_ref, new_transcript_text, sequence=sequence, start_ms=start_ms, end_ms=end_ms,
+        )
 
-        print(f"[Audio Chunk] Firestore updated successfully")
+        print(f"[Audio Chunk] Transcript segment {segment_id} stored")
+        schedule_rolling_summary(appointment_ref)
 
         return jsonify({
             'status': 'uploaded',
-            'message': 'Audio chunk processed and transcript updated',
-            'transcriptLength': len(updated_transcript)
+            'message': 'Audio chunk processed and transcript segment stored',
+            'segmentId': segment_id,
+            'sequence': sequence,
+            'segmentLength': len(new_transcript_text),
+            'startMs': start_ms,
+            'endMs': end_ms,
         }), 200
 
     except Exception as e:
@@ -95,8 +111,8 @@ def upload_audio_chunk(user_id, appointment_id):
 def upload_recording(user_id, appointment_id):
     """
     POST /appointments/{appointmentId}/upload-recording
-    Legacy endpoint: uploads a pre-recorded audio file, splits it into 30 s chunks,
-    processes each chunk (GCS upload + transcription), and finalizes with SOAP generation.
+    Legacy endpoint: uploads a pre-recorded audio file, decodes it once into speech segments,
+    processes each segment (webm GCS backup + transcription), and finalizes with SOAP generation.
     """
     try:
         if 'recording' not in request.files:
@@ -110,62 +126,73 @@ def upload_recording(user_id, appointment_id):
 
         print(f"[Upload Recording] Starting processing for appointment {appointment_id}")
 
-        audio_content = audio_file.read()
         file_extension = detect_file_extension(audio_file.filename)
-        audio_size_mb = len(audio_content) / (1024 * 1024)
-        print(f"[Upload Recording] Received audio file: {audio_size_mb:.2f} MB, format: {file_extension}")
+        print(f"[Upload Recording] Streaming {audio_file.filename or 'recording'} (format: {file_extension})")
 
-        # Split audio into webm chunks
-        try:
-            chunks = split_audio_to_webm_chunks(audio_content, file_extension)
-        except Exception as e:
-            set_appointment_error(appointment_ref)
-            print(f"[Upload Recording] Error loading audio: {str(e)}")
-            return jsonify({'error': f'Failed to load audio file: {str(e)}', 'status': 'failed'}), 400
-
-        # Process each chunk: upload to GCS, transcribe, update Firestore
         stt_service, storage_svc, _ = get_services()
 
-        for idx, chunk_content in enumerate(chunks):
-            print(f"[Upload Recording] Processing chunk {idx + 1}/{len(chunks)}")
+        # One pass over the request body: the resumable GCS upload reads it in
+        # bounded blocks and tees the same blocks into the decoder
+        timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
+        full_audio_filename = f"recordings/{appointment_id}/{timestamp}_full.{file_extension}"
+        decoder_input = PushStream(max_buffered_blocks=32)
 
+        def upload_full_audio():
             try:
+                return storage_svc.upload_stream(
+                    TeeReader(audio_file.stream, decoder_input.feed),
+                    full_audio_filename, content_type=f'audio/{file_extension}',
+                )
+            finally:
+                decoder_input.close_input()
+
+        upload_executor = ThreadPoolExecutor(max_workers=1)
+        upload_future = upload_executor.submit(upload_full_audio)
+        upload_executor.shutdown(wait=False)
+
+        # Decode once into PCM segments; webm is only encoded for the GCS backup copy
+        segmenter = create_segmenter()
+        segments = split_audio_to_pcm_segments(decoder_input, file_extension, segmenter=segmenter)
+
+        # Process each chunk: upload to GCS, transcribe, update Firestore
+        chunks_processed = 0
+        try:
+            for segment in segments:
+                idx = segment.index
+                print(f"[Upload Recording] Processing chunk {idx + 1}")
+
                 chunk_filename = f"chunks/{appointment_id}/chunk_{idx:04d}.webm"
-                gcs_uri = storage_svc.upload_audio_file(chunk_content, chunk_filename, content_type='audio/webm')
+                gcs_uri = storage_svc.upload_audio_file(encode_pcm_to_webm(segment.pcm), chunk_filename, content_type='audio/webm')
                 print(f"[Upload Recording] Chunk {idx + 1} uploaded to GCS: {gcs_uri}")
 
                 print(f"[Upload Recording] Transcribing chunk {idx + 1}...")
-                new_transcript_text = stt_service.transcribe_audio_chunk(chunk_content, use_gcs=False, gcs_uri=None)
+                new_transcript_text = stt_service.transcribe_pcm(segment.pcm)
                 print(f"[Upload Recording] Chunk {idx + 1} transcription completed")
 
-                # Re-fetch to avoid stale reads
-                appointment_doc = appointment_ref.get()
-                current_transcript = appointment_doc.to_dict().get('rawTranscript', '')
-                updated_transcript = (current_transcript + '\n' + new_transcript_text) if current_transcript else new_transcript_text
-
-                appointment_ref.update({
-                    'rawTranscript': updated_transcript,
-                    'lastUpdated': datetime.utcnow().isoformat()
-                })
+                append_transcript_segment(
+                    appointment_ref, new_transcript_text,
+                    start_ms=segment.start_ms, end_ms=segment.end_ms, source='recording',
+                )
 
+                chunks_processed += 1
                 print(f"[Upload Recording] Chunk {idx + 1} processed successfully")
 
-            except Exception as e:
-                set_appointment_error(appointment_ref)
-                print(f"[Upload Recording] Error processing chunk {idx + 1}: {str(e)}")
-                return jsonify({
-                    'error': f'Failed to process chunk {idx + 1}: {str(e)}',
-                    'status': 'failed',
-                    'chunksProcessed': idx
-                }), 500
+        except Exception as e:
+            # Let the full-audio upload finish without waiting on the decoder
+            decoder_input.abort()
+            set_appointment_error(appointment_ref)
+            print(f"[Upload Recording] Error processing chunk {chunks_processed + 1}: {str(e)}")
+            return jsonify({
+                'error': f'Failed to process chunk {chunks_processed + 1}: {str(e)}',
+                'status': 'failed',
+                'chunksProcessed': chunks_processed
+            }), 500
 
         print(f"[Upload Recording] All chunks processed successfully")
 
-        # Upload full audio to GCS
+        # Wait for the full audio upload that ran alongside transcription
         try:
-            timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
-            full_audio_filename = f"recordings/{appointment_id}/{timestamp}_full.{file_extension}"
-            recording_url = storage_svc.upload_audio_file(audio_content, full_audio_filename, content_type=f'audio/{file_extension}')
+            recording_url = upload_future.result()
             print(f"[Upload Recording] Full audio uploaded: {recording_url}")
             appointment_ref.update({
                 'recordingLink': recording_url,
@@ -176,12 +203,15 @@ def upload_recording(user_id, appointment_id):
             print(f"[Upload Recording] Error uploading full audio: {str(e)}")
             return jsonify({'error': f'Failed to upload full audio: {str(e)}', 'status': 'failed'}), 500
 
-        # Get fresh transcript and generate SOAP
+        # Assemble the transcript from its segments and generate SOAP
         appointment_doc = appointment_ref.get()
-        raw_transcript = appointment_doc.to_dict().get('rawTranscript', '')
+        raw_transcript = materialize_transcript(appointment_ref, appointment_doc.to_dict())
 
         _, _, ai_service = get_services()
-        soap_notes, soap_error = generate_soap_and_finalize(appointment_ref, raw_transcript, ai_service, schema_version=Constants.SUMMARY_SCHEMA_VERSION_1_2)
+        soap_notes, soap_error = generate_soap_and_finalize(
+            appointment_ref, raw_transcript, ai_service, schema_version=Constants.SUMMARY_SCHEMA_VERSION_1_2,
+            force_regenerate=parse_force_regenerate(request),
+        )
         if soap_error:
             return soap_error
 
@@ -193,7 +223,8 @@ def upload_recording(user_id, appointment_id):
             'recordingLink': recording_url,
             'soapNotes': soap_notes,
             'status': 'Completed',
-            'chunksProcessed': len(chunks)
+            'chunksProcessed': chunks_processed,
+            'audioSecondsSkipped': segmenter.stats.skipped_seconds if segmenter else 0,
         }), 200
 
     except Exception as e:
@@ -220,16 +251,14 @@ def upload_recording_new(user_id, appointment_id):
         if error:
             return error
 
-        audio_content = audio_file.read()
         file_extension = detect_file_extension(audio_file.filename)
-        audio_size_mb = len(audio_content) / (1024 * 1024)
-        print(f"[Upload Recording New] Received {audio_size_mb:.2f} MB, format: {file_extension}")
+        print(f"[Upload Recording New] Streaming {audio_file.filename or 'recording'} (format: {file_extension})")
 
         _, store_service, _ = get_services()
         timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
         full_audio_filename = f"recordings/{appointment_id}/{timestamp}_full.{file_extension}"
-        recording_gcs_uri = store_service.upload_file(
-            audio_content, full_audio_filename, content_type=f'audio/{file_extension}'
+        recording_gcs_uri = store_service.upload_stream(
+            audio_file.stream, full_audio_filename, content_type=f'audio/{file_extension}'
         )
         print(f"[Upload Recording New] Uploaded to GCS: {recording_gcs_uri}")
 
@@ -276,12 +305,11 @@ def finalize_appointment(user_id, appointment_id):
                 return jsonify({'error': 'No audio file provided'}), 400
 
             audio_file = request.files['fullAudio']
-            audio_content = audio_file.read()
 
             try:
                 timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
                 full_audio_filename = f"recordings/{appointment_id}/{timestamp}_full.webm"
-                recording_url = store_service.upload_audio_file(audio_content, full_audio_filename, content_type='audio/webm')
+                recording_url = store_service.upload_stream(audio_file.stream, full_audio_filename, content_type='audio/webm')
                 appointment_ref.update({
                     'recordingLink': recording_url,
                     'lastUpdated': datetime.utcnow().isoformat(),
@@ -290,10 +318,13 @@ def finalize_appointment(user_id, appointment_id):
                 set_appointment_error(appointment_ref)
                 return jsonify({'error': f'Audio upload failed: {str(e)}'}), 500
 
-        # PART 2: Generate SOAP from transcript
-        raw_transcript = appointment_data.get('rawTranscript', '')
+        # PART 2: Generate SOAP from transcript (assembled from stored segments)
+        raw_transcript = materialize_transcript(appointment_ref, appointment_data)
 
-        soap_notes, soap_error = generate_soap_and_finalize(appointment_ref, raw_transcript, ai_service, schema_version=Constants.SUMMARY_SCHEMA_VERSION_1_2)
+        soap_notes, soap_error = generate_soap_and_finalize(
+            appointment_ref, raw_transcript, ai_service, schema_version=Constants.SUMMARY_SCHEMA_VERSION_1_2,
+            force_regenerate=parse_force_regenerate(request),
+        )
         if soap_error:
             return soap_error
 
@@ -0,0 +1,224 @@
+"""
+Live transcription over WebSocket.
+
+Endpoints:
+- WS /appointments/<id>/live-transcription — Stream audio in, receive interim and final transcripts
+
+Protocol (JSON text messages unless noted):
+  client → {"type": "start", "token": "<Firebase ID token>", "format": "webm"}
+           "format" is a streamable container ffmpeg can read from a pipe
+           (e.g. "webm", "ogg") or "pcm16" for raw 16 kHz mono 16-bit PCM.
+           The token may instead be sent in the Authorization header.
+  server → {"type": "ready"}
+  client → binary audio frames, in order
+  client → {"type": "stop"}
+  server → {"type": "interim", "transcript": "..."}              (any number)
+  server → {"type": "final", "transcript": "...", "endMs": 1234} (any number)
+           endMs is the position in the appointment's recording timeline
+  server → {"type": "done", "segmentsStored": 3}
+  server → {"type": "error", "error": "..."}
+
+Each open session holds one gunicorn handler thread for its whole duration,
+so at most ``LIVE_MAX_SESSIONS`` run at once per instance; a connection over
+the limit receives an error message and is closed.
+
+A single recognition session (rolled over transparently before the API's
+per-stream limit) stays open for the whole connection. Final results are
+persisted as transcript segments in batches, not per result. A connection
+continues the timeline where the appointment's latest segment ends, so a
+reconnect never stores segments that overlap earlier ones.
+"""
+
+import json
+import threading
+import time
+from flask import Blueprint, request
+from flask_sock import Sock
+from simple_websocket import ConnectionClosed
+from utils.auth import get_user_id_from_token
+from utils.audio_pipeline import PushStream, decode_to_pcm, SEEKABLE_INPUT_FORMATS
+from config import LIVE_PERSIST_BATCH_SIZE, LIVE_PERSIST_INTERVAL_SECONDS, LIVE_MAX_SESSIONS
+from routes.services import (
+    get_services,
+    get_appointment_or_404,
+    append_transcript_segment,
+    latest_transcript_segment,
+    schedule_rolling_summary,
+)
+
+live_bp = Blueprint('live', __name__)
+sock = Sock()
+
+# Open live sessions on this instance (each holds a handler thread)
+_live_sessions = threading.BoundedSemaphore(LIVE_MAX_SESSIONS)
+
+
+class FinalResultBatcher:
+    """Buffer final transcript results and persist them as segments in batches."""
+
+    def __init__(self, appointment_ref, offset_ms=0, batch_size=None, interval_seconds=None):
+        """
+        Args:
+            appointment_ref: Firestore reference of the appointment.
+            offset_ms: Recording position where this connection's audio starts;
+                       recognition timestamps (from 0) are shifted by it.
+            batch_size: Final results per stored segment (default LIVE_PERSIST_BATCH_SIZE).
+            interval_seconds: Longest wait before a partial batch is stored.
+        """
+        self.appointment_ref = appointment_ref
+        self.batch_size = batch_size or LIVE_PERSIST_BATCH_SIZE
+        self.interval_seconds = interval_seconds or LIVE_PERSIST_INTERVAL_SECONDS
+        self.offset_ms = offset_ms
+        self.texts = []
+        self.start_ms = offset_ms
+        self.end_ms = offset_ms
+        self.last_flush = time.monotonic()
+        self.segments_stored = 0
+
+    def add(self, text, end_ms):
+        """Buffer a final result; ``end_ms`` is relative to the start of this connection."""
+        self.texts.append(text)
+        self.end_ms = max(self.end_ms, self.offset_ms + end_ms)
+        if len(self.texts) >= self.batch_size or time.monotonic() - self.last_flush >= self.interval_seconds:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if not self.texts:
+            return
+        append_transcript_segment(
+            self.appointment_ref, ' '.join(self.texts),
+            start_ms=self.start_ms, end_ms=self.end_ms, source='live',
+        )
+        self.segments_stored += 1
+        print(f"[Live] Stored segment {self.segments_stored} ({len(self.texts)} results, "
+              f"{self.start_ms / 1000:.1f}s-{self.end_ms / 1000:.1f}s)")
+        self.texts = []
+        self.start_ms = self.end_ms
+        schedule_rolling_summary(self.appointment_ref)
+
+
+def _send(ws, message_type, **fields):
+    ws.send(json.dumps({'type': message_type, **fields}))
+
+
+@sock.route('/appointments/<appointment_id>/live-transcription', bp=live_bp)
+def live_transcription(ws, appointment_id):
+    """
+    WS /appointments/{appointmentId}/live-transcription
+    Accepts a continuous audio stream and pushes interim and final transcripts
+    back as they arrive. See the module docstring for the message protocol.
+    """
+    if not _open_live_session(ws, appointment_id):
+        return
+    try:
+        _run_live_session(ws, appointment_id)
+    finally:
+        _live_sessions.release()
+
+
+def _open_live_session(ws, appointment_id):
+    """Take a live session slot, or tell the client the instance is full. Returns True if a slot was taken."""
+    if _live_sessions.acquire(blocking=False):
+        return True
+    print(f"[Live] Refused session for appointment {appointment_id}: {LIVE_MAX_SESSIONS} sessions already open")
+    try:
+        _send(ws, 'error', error='Too many live transcription sessions on this server; retry shortly or upload audio chunks')
+    except ConnectionClosed:
+        pass
+    return False
+
+
+def _run_live_session(ws, appointment_id):
+    """Handshake, stream audio through recognition and persist final results for one connection."""
+    try:
+        start = json.loads(ws.receive(timeout=30) or '{}')
+        if start.get('type') != 'start':
+            _send(ws, 'error', error='First message must be {"type": "start", ...}')
+            return
+
+        try:
+            user_id = get_user_id_from_token(start.get('token') or request.headers.get('Authorization'))
+        except Exception as e:
+            _send(ws, 'error', error=f'Invalid or expired token: {str(e)}')
+            return
+
+        audio_format = (start.get('format') or 'webm').lower()
+        if audio_format in SEEKABLE_INPUT_FORMATS:
+            _send(ws, 'error', error=f'Format {audio_format} cannot be decoded as a live stream')
+            return
+
+        appointment_ref, _, error = get_appointment_or_404(user_id, appointment_id)
+        if error:
+            _send(ws, 'error', error='Appointment not found')
+            return
+
+    except ConnectionClosed:
+        return
+    except Exception as e:
+        print(f"[Live] Handshake error: {str(e)}")
+        _send(ws, 'error', error=str(e))
+        return
+
+    print(f"[Live] Session started for appointment {appointment_id} (format: {audio_format})")
+    audio_in = PushStream()
+
+    def receive_audio():
+        """Move incoming WebSocket frames into the decoder until the client stops."""
+        try:
+            while True:
+                message = ws.receive()
+                if isinstance(message, (bytes, bytearray)):
+                    audio_in.feed(message)
+                elif message:
+                    if json.loads(message).get('type') == 'stop':
+                        break
+        except ConnectionClosed:
+            pass
+        except Exception as e:
+            print(f"[Live] Receive error: {str(e)}")
+        finally:
+            audio_in.close_input()
+
+    receiver = threading.Thread(target=receive_audio, daemon=True)
+    receiver.start()
+
+    if audio_format == 'pcm16':
+        pcm_blocks = iter(lambda: audio_in.read(4800), b'')
+    else:
+        pcm_blocks = decode_to_pcm(audio_in, low_latency=True)
+
+    stt_service, _, _ = get_services()
+    latest = latest_transcript_segment(appointment_ref)
+    batcher = FinalResultBatcher(appointment_ref, offset_ms=(latest or {}).get('endMs') or 0)
+
+    try:
+        _send(ws, 'ready')
+        for result in stt_service.stream_recognize(pcm_blocks, interim_results=True):
+            if result.is_final:
+                batcher.add(result.transcript, result.end_ms)
+                _send(ws, 'final', transcript=result.transcript, endMs=batcher.offset_ms + result.end_ms)
+            else:
+                _send(ws, 'interim', transcript=result.transcript)
+
+        batcher.flush()
+        _send(ws, 'done', segmentsStored=batcher.segments_stored)
+        print(f"[Live] Session finished for appointment {appointment_id}")
+
+    except ConnectionClosed:
+        print(f"[Live] Client disconnected from appointment {appointment_id}")
+    except Exception as e:
+        print(f"[Live] Streaming error: {str(e)}")
+        # Nothing reads the audio any more: let the receiver drain without blocking
+        audio_in.abort()
+        try:
+            _send(ws, 'error', error=f'Transcription failed: {str(e)}')
+        except ConnectionClosed:
+            pass
+    finally:
+        # Never drop finals that were already shown to the user
+        try:
+            batcher.flush()
+        except Exception as e:
+            print(f"[Live] Failed to persist final results: {str(e)}")
+        audio_in.close_input()
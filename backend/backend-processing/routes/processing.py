@@ -5,20 +5,41 @@ Endpoints:
 - POST /appointments/<id>/process            — Combined processor (transcribe + PDF extract + SOAP)
 - POST /appointments/<id>/generate-questions  — Generate patient questions from transcript
 - POST /appointments/<id>/upload-notes        — Store plain text notes on appointment
-- POST /appointments/<id>/upload-document     — Upload PDF document to GCS
+- POST /appointments/<id>/upload-document     — Upload PDF document to GCS, extract its text in the background
 """
 
 from flask import Blueprint, request, jsonify
 from datetime import datetime
 from utils.auth import verify_firebase_token
-from utils.processing import transcribe_full_recording, generate_soap_from_text, extract_text_from_pdf_gcs
+from utils.processing import (
+    transcribe_full_recording,
+    transcribe_uncovered_audio,
+    generate_soap_from_text,
+    remove_duplicate_passages,
+)
 from utils.constants import Constants
+from utils.tokens import estimate_tokens_for_characters
+from utils.transcript_compaction import compact_for_prompt
+from utils.dag import DagExecutor, Task
+from config import PROCESS_AUDIO_TIMEOUT_SECONDS, PROCESS_DOCUMENT_TIMEOUT_SECONDS, QUESTIONS_INCREMENTAL
 from routes.services import (
     get_services,
     get_appointment_or_404,
     set_appointment_error,
     update_title_if_empty,
     parse_notes_from_request,
+    assemble_transcript,
+    supersede_transcript_segments,
+    load_transcript_segments,
+    has_full_segment_timing,
+    get_transcription_cache,
+    add_document_link,
+    schedule_document_extraction,
+    get_document_text,
+    parse_force_regenerate,
+    create_summary_draft_writer,
+    SummaryDraftWriter,
+    generate_questions_incremental,
 )
 
 processing_bp = Blueprint('processing', __name__)
@@ -30,14 +51,32 @@ def generate_questions(user_id, appointment_id):
     """
     POST /appointments/{appointmentId}/generate-questions
     Generates 2-3 potential questions based on the transcript so far.
+
+    With QUESTIONS_INCREMENTAL, only the transcript added since the previous
+    call is sent, together with a stored digest of the conversation.
     """
     try:
         appointment_ref, appointment_data, error = get_appointment_or_404(user_id, appointment_id)
         if error:
             return error
 
-        # Use rawTranscript if available, fall back to notes or processedSummary
-        transcript = appointment_data.get('rawTranscript', '')
+        # Use the transcript (materialized text + stored segments) if available,
+        # fall back to notes or processedSummary
+        transcript, _ = assemble_transcript(appointment_ref, appointment_data)
+        if transcript and QUESTIONS_INCREMENTAL:
+            try:
+                _, _, ai_service = get_services()
+                questions, info = generate_questions_incremental(appointment_ref, appointment_data, transcript, ai_service)
+            except Exception as e:
+                return jsonify({'error': f'Question generation failed: {str(e)}'}), 500
+            return jsonify({
+                'questions': questions,
+                'message': 'Questions generated successfully',
+                **info,
+            }), 200
+
+        if transcript:
+            transcript, _ = compact_for_prompt(transcript, label="Generate Questions")
         if not transcript:
             transcript = appointment_data.get('notes', '')
         if not transcript:
@@ -57,7 +96,8 @@ def generate_questions(user_id, appointment_id):
 
         return jsonify({
             'questions': questions,
-            'message': 'Questions generated successfully'
+            'message': 'Questions generated successfully',
+            'mode': 'full',
         }), 200
 
     except Exception as e:
@@ -107,7 +147,11 @@ def upload_document(user_id, appointment_id):
     """
     POST /appointments/{appointmentId}/upload-document
     Uploads a PDF document to Google Cloud Storage and returns the GCS URI.
-    Does NOT extract text — that is handled by the /process endpoint.
+    Text extraction starts in the background right away (schedule_document_extraction)
+    and is stored in the documentTexts subcollection. /process reuses that
+    text while it matches the PDF's current generation, waits for an
+    extraction still running on this instance, and extracts on the fly only
+    when the text is missing or stale.
     """
     try:
         if 'document' not in request.files:
@@ -119,37 +163,28 @@ def upload_document(user_id, appointment_id):
         if error:
             return error
 
-        doc_content = doc_file.read()
         original_filename = doc_file.filename or 'document.pdf'
-        doc_size_mb = len(doc_content) / (1024 * 1024)
-        print(f"[Upload Document] Received {original_filename}: {doc_size_mb:.2f} MB")
+        print(f"[Upload Document] Streaming {original_filename}")
 
         _, store_service, _ = get_services()
         timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
         gcs_filename = f"documents/{appointment_id}/{timestamp}_{original_filename}"
-        document_gcs_uri = store_service.upload_file(
-            doc_content, gcs_filename, content_type='application/pdf'
+        document_gcs_uri = store_service.upload_stream(
+            doc_file.stream, gcs_filename, content_type='application/pdf'
         )
         print(f"[Upload Document] Uploaded to GCS: {document_gcs_uri}")
 
         # Append to documentLinks array (supports multiple documents)
-        existing_links = appointment_data.get('documentLinks', [])
-        if not isinstance(existing_links, list):
-            existing_links = [existing_links] if existing_links else []
-        existing_links.append(document_gcs_uri)
+        document_count = add_document_link(appointment_ref, appointment_data, document_gcs_uri)
 
-        update_fields = {
-            'documentLinks': existing_links,
-            'documentLink': document_gcs_uri,  # backward compat: last uploaded doc
-            'lastUpdated': datetime.utcnow().isoformat(),
-        }
-        appointment_ref.update(update_fields)
+        # Extract the text now, off the request path, so /process can reuse it
+        schedule_document_extraction(appointment_ref, document_gcs_uri)
 
         return jsonify({
             'message': 'Document uploaded successfully',
             'appointmentId': appointment_id,
             'documentGcsUri': document_gcs_uri,
-            'documentCount': len(existing_links),
+            'documentCount': document_count,
             'status': 'uploaded'
         }), 200
 
@@ -158,6 +193,60 @@ def upload_document(user_id, appointment_id):
         return jsonify({'error': str(e), 'status': 'failed'}), 500
 
 
+def _transcribe_recording(appointment_ref, appointment_id, recording_gcs_uri, stt_service, store_service):
+    """
+    Download and transcribe the appointment recording for /process.
+
+    Runs as a DAG branch that may time out and keep running in the background,
+    so it never writes to the appointment: the caller stores the result (see
+    ``_store_recording_transcript``) only once the branch has succeeded.
+
+    Returns:
+        (transcript, transcription_info, segment_ids) — info describes how the
+        transcript was produced; segment_ids are the transcript segments it
+        supersedes (None: all stored segments).
+    """
+    print(f"[Process] Downloading recording from GCS...")
+    audio_content = store_service.download_file(recording_gcs_uri)
+    file_extension = recording_gcs_uri.split('.')[-1].lower() if '.' in recording_gcs_uri else 'webm'
+
+    # Reuse chunks already transcribed while recording; only the gaps go to STT
+    segments = load_transcript_segments(appointment_ref)
+    if has_full_segment_timing(segments):
+        print(f"[Process] Reusing {len(segments)} transcript segments, transcribing uncovered audio...")
+        transcript, coverage_stats = transcribe_uncovered_audio(
+            audio_content=audio_content,
+            file_extension=file_extension,
+            stt_service=stt_service,
+            segments=segments,
+            cache=get_transcription_cache(),
+        )
+        transcription_info = {'mode': 'gaps', **coverage_stats}
+        # Segments stored after this point are not part of the merged transcript
+        superseded_ids = [seg['id'] for seg in segments]
+    else:
+        print(f"[Process] Transcribing recording ({len(audio_content)} bytes, format: {file_extension})...")
+        transcript = transcribe_full_recording(
+            audio_content=audio_content,
+            file_extension=file_extension,
+            stt_service=stt_service,
+            storage_service=store_service,
+            appointment_id=appointment_id,
+            cache=get_transcription_cache(),
+        )
+        transcription_info = {'mode': 'full'}
+        superseded_ids = None
+
+    return transcript, transcription_info, superseded_ids
+
+
+def _store_recording_transcript(appointment_ref, transcript, superseded_ids):
+    """Store a /process recording transcript as ``rawTranscript``; it supersedes the segments stored so far."""
+    if superseded_ids is None:
+        superseded_ids = [seg['id'] for seg in load_transcript_segments(appointment_ref)]
+    supersede_transcript_segments(appointment_ref, transcript, superseded_ids)
+
+
 @processing_bp.route('/appointments/<appointment_id>/process', methods=['POST'])
 @verify_firebase_token
 def process_appointment(user_id, appointment_id):
@@ -230,59 +319,75 @@ def process_appointment(user_id, appointment_id):
 
         stt_service, store_service, ai_service = get_services()
 
-        # Collect all text sources
+        # Run the independent input branches concurrently: the recording and every
+        # document. Latency is that of the slowest branch, not the sum.
+        tasks = []
+        if recording_gcs_uri:
+            tasks.append(Task(
+                'recording',
+                lambda: _transcribe_recording(appointment_ref, appointment_id, recording_gcs_uri, stt_service, store_service),
+                timeout_seconds=PROCESS_AUDIO_TIMEOUT_SECONDS,
+            ))
+        for doc_idx, doc_uri in enumerate(document_gcs_uris):
+            tasks.append(Task(
+                f'document_{doc_idx + 1}',
+                lambda doc_uri=doc_uri: get_document_text(appointment_ref, doc_uri, store_service),
+                timeout_seconds=PROCESS_DOCUMENT_TIMEOUT_SECONDS,
+            ))
+        branches = DagExecutor(tasks, label="Process").run()
+
+        # Join branch outputs in the fixed labelled order
         text_parts = []
+        transcription_info = None
+        compaction_info = None
 
-        # 1. Transcribe recording if provided
+        # 1. Recording transcript
         if recording_gcs_uri:
-            try:
-                print(f"[Process] Downloading recording from GCS...")
-                audio_content = store_service.download_file(recording_gcs_uri)
-                file_extension = recording_gcs_uri.split('.')[-1].lower() if '.' in recording_gcs_uri else 'webm'
-                print(f"[Process] Transcribing recording ({len(audio_content)} bytes, format: {file_extension})...")
-
-                transcript = transcribe_full_recording(
-                    audio_content=audio_content,
-                    file_extension=file_extension,
-                    stt_service=stt_service,
-                    storage_service=store_service,
-                    appointment_id=appointment_id,
-                )
-
-                if transcript:
-                    text_parts.append(f"=== Audio Transcript ===\n{transcript}")
-                    appointment_ref.update({
-                        'rawTranscript': transcript,
-                        'lastUpdated': datetime.utcnow().isoformat(),
-                    })
-                    print(f"[Process] Transcription complete: {len(transcript)} characters")
-                else:
-                    print(f"[Process] Warning: Transcription returned empty result")
-            except Exception as e:
-                print(f"[Process] Error transcribing recording: {str(e)}")
+            result = branches['recording']
+            if not result.ok:
+                print(f"[Process] Error transcribing recording: {str(result.error)}")
                 set_appointment_error(appointment_ref)
-                return jsonify({'error': f'Recording transcription failed: {str(e)}', 'status': 'failed'}), 500
+                return jsonify({'error': f'Recording transcription failed: {str(result.error)}', 'status': 'failed'}), 500
+            transcript, transcription_info, superseded_ids = result.value
+            if transcript:
+                # Written here, not in the branch: a timed-out branch must not touch the appointment
+                _store_recording_transcript(appointment_ref, transcript, superseded_ids)
+                transcript, compaction_info = compact_for_prompt(transcript, label="Process")
+                text_parts.append(f"=== Audio Transcript ===\n{transcript}")
+                print(f"[Process] Transcription complete: {len(transcript)} characters")
+            else:
+                print(f"[Process] Warning: Transcription returned empty result")
 
         # 2. Add notes if provided
         if notes_text:
             text_parts.append(f"=== Patient Notes ===\n{notes_text}")
             print(f"[Process] Notes included: {len(notes_text)} characters")
 
-        # 3. Extract text from PDF documents (supports multiple)
-        for doc_idx, doc_uri in enumerate(document_gcs_uris):
-            try:
-                print(f"[Process] Extracting text from document {doc_idx + 1}/{len(document_gcs_uris)}...")
-                pdf_text = extract_text_from_pdf_gcs(doc_uri, store_service)
-                if pdf_text:
-                    label = f"=== Document Content ({doc_idx + 1}) ===" if len(document_gcs_uris) > 1 else "=== Document Content ==="
-                    text_parts.append(f"{label}\n{pdf_text}")
-                    print(f"[Process] Document {doc_idx + 1} text extracted: {len(pdf_text)} characters")
-                else:
-                    print(f"[Process] Warning: Document {doc_idx + 1} text extraction returned empty result")
-            except Exception as e:
-                print(f"[Process] Error extracting text from document {doc_idx + 1}: {str(e)}")
+        # 3. Text from PDF documents (supports multiple)
+        document_texts = []
+        boilerplate_removed = 0
+        for doc_idx in range(len(document_gcs_uris)):
+            result = branches[f'document_{doc_idx + 1}']
+            if not result.ok:
+                print(f"[Process] Error extracting text from document {doc_idx + 1}: {str(result.error)}")
                 set_appointment_error(appointment_ref)
-                return jsonify({'error': f'PDF text extraction failed for document {doc_idx + 1}: {str(e)}', 'status': 'failed'}), 500
+                return jsonify({'error': f'PDF text extraction failed for document {doc_idx + 1}: {str(result.error)}', 'status': 'failed'}), 500
+            pdf_text, text_source, doc_boilerplate_removed = result.value
+            document_texts.append(pdf_text)
+            boilerplate_removed += doc_boilerplate_removed
+            print(f"[Process] Document {doc_idx + 1} text ({text_source}): {len(pdf_text)} characters")
+
+        # Passages repeated across documents are sent to the model only once
+        document_texts, text_reduction = remove_duplicate_passages(document_texts)
+        # Repeated headers/footers were already stripped within each document at extraction time
+        text_reduction['boilerplateCharactersRemoved'] = boilerplate_removed
+        text_reduction['boilerplateEstimatedTokensRemoved'] = estimate_tokens_for_characters(boilerplate_removed)
+        for doc_idx, pdf_text in enumerate(document_texts):
+            if pdf_text:
+                label = f"=== Document Content ({doc_idx + 1}) ===" if len(document_gcs_uris) > 1 else "=== Document Content ==="
+                text_parts.append(f"{label}\n{pdf_text}")
+            else:
+                print(f"[Process] Warning: Document {doc_idx + 1} text extraction returned empty result")
 
         # Combine all text
         combined_text = "\n\n".join(text_parts)
@@ -295,7 +400,11 @@ def process_appointment(user_id, appointment_id):
         # Generate SOAP summary from combined text
         try:
             print(f"[Process] Generating SOAP summary...")
-            soap_notes = generate_soap_from_text(combined_text, ai_service, schema_version=Constants.SUMMARY_SCHEMA_VERSION_1_3)
+            soap_notes = generate_soap_from_text(
+                combined_text, ai_service, schema_version=Constants.SUMMARY_SCHEMA_VERSION_1_3,
+                force_regenerate=parse_force_regenerate(request),
+                on_section=create_summary_draft_writer(appointment_ref),
+            )
             print(f"[Process] SOAP summary generated successfully")
         except Exception as e:
             print(f"[Process] Error generating SOAP summary: {str(e)}")
@@ -307,6 +416,7 @@ def process_appointment(user_id, appointment_id):
             'processedSummary': soap_notes,
             'status': 'Completed',
             'lastUpdated': datetime.utcnow().isoformat(),
+            **SummaryDraftWriter.draft_cleanup(),
         })
 
         # Set title if not already set
@@ -322,7 +432,11 @@ def process_appointment(user_id, appointment_id):
                 'recording': bool(recording_gcs_uri),
                 'notes': bool(notes_text),
                 'documents': len(document_gcs_uris),
-            }
+            },
+            'transcription': transcription_info,
+            'timings': branches.timings_summary(),
+            'textReduction': text_reduction,
+            'transcriptCompaction': compaction_info,
         }), 200
 
     except Exception as e:
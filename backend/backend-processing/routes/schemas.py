@@ -0,0 +1,31 @@
+"""
+Summary schema listing.
+
+Endpoints:
+- GET /summary-schemas — List the summary schema versions loaded by the schema registry
+"""
+
+from flask import Blueprint, jsonify
+from utils.schema_registry import get_schema_registry
+
+schemas_bp = Blueprint('schemas', __name__)
+
+
+@schemas_bp.route('/summary-schemas', methods=['GET'])
+def list_summary_schemas():
+    """
+    GET /summary-schemas
+    Lists the available summary schema versions with the size of each schema
+    variant, plus any version folder that failed validation.
+    """
+    try:
+        registry = get_schema_registry()
+        return jsonify({
+            'defaultVariant': registry.variant,
+            'hotReload': registry.hot_reload,
+            'schemas': registry.list_versions(),
+        }), 200
+
+    except Exception as e:
+        print(f"[Summary Schemas] Error: {str(e)}")
+        return jsonify({'error': str(e), 'status': 'failed'}), 500
@@ -5,18 +5,40 @@ Provides:
 - Firestore database initialization
 - Lazy service initialization (STT, Storage, Vertex AI)
 - Common appointment helpers (get, error handling, title updates)
+- Append-only transcript segment store
+- Precomputed document text store (background PDF extraction)
+- Incremental question generation state (rolling digest + watermark)
+- Rolling summary updated in the background while a recording is running
 - Audio processing utilities (chunking, transcription)
 """
 
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import threading
+import time
+import uuid
 from flask import jsonify
+from firebase_admin import firestore
 from utils.speech_to_text import SpeechToTextService
 from utils.storage import StorageService
 from utils.vertex_ai import VertexAIService
 from utils.constants import Constants
+from utils.transcription import ConcurrentTranscriber
+from utils.audio_pipeline import segment_audio
+from utils.cache import create_cache
+from utils.processing import extract_pdf_gcs
+from utils.transcript_compaction import compact_for_prompt
 from config import initialize_firebase, GCP_PROJECT_ID, GCP_BUCKET_NAME, GCP_LOCATION, VERTEX_AI_MODEL
-import io
-from pydub import AudioSegment
+from config import TRANSCRIPT_CACHE_BACKEND, TRANSCRIPT_CACHE_MAX_BYTES, TRANSCRIPT_CACHE_DIR
+from config import PDF_EXTRACTION_WORKERS, DOCUMENT_EXTRACTION_LEASE_SECONDS, DOCUMENT_EXTRACTION_POLL_SECONDS
+from config import QUESTIONS_MIN_NEW_CHARACTERS, QUESTIONS_DIGEST_MAX_WORDS
+from config import (
+    ROLLING_SUMMARY_ENABLED, ROLLING_SUMMARY_DEBOUNCE_SECONDS, ROLLING_SUMMARY_MIN_NEW_CHARACTERS,
+    ROLLING_SUMMARY_CONTEXT_CHARACTERS, ROLLING_SUMMARY_FINALIZE_WAIT_SECONDS, ROLLING_SUMMARY_WORKERS,
+)
+from config import SOAP_CACHE_BACKEND, SOAP_CACHE_MAX_BYTES, SOAP_CACHE_TTL_SECONDS, SOAP_CACHE_DIR, SOAP_CACHE_REDIS_URL
+from config import SOAP_STREAM_SECTIONS, SOAP_DRAFT_FLUSH_SECONDS
 
 # Initialize Firestore
 db = initialize_firebase()
@@ -36,11 +58,71 @@ def get_services():
     if _storage_service is None:
         _storage_service = StorageService(GCP_BUCKET_NAME, GCP_PROJECT_ID)
     if _vertex_ai_service is None:
-        _vertex_ai_service = VertexAIService(GCP_PROJECT_ID, GCP_LOCATION, VERTEX_AI_MODEL)
+        _vertex_ai_service = VertexAIService(
+            GCP_PROJECT_ID, GCP_LOCATION, VERTEX_AI_MODEL,
+            response_cache=_create_soap_cache(_storage_service.bucket),
+        )
 
     return _speech_service, _storage_service, _vertex_ai_service
 
 
+def _create_soap_cache(bucket):
+    """Build the SOAP response cache (None when SOAP_CACHE_BACKEND is 'none')."""
+    return create_cache(
+        'soap',
+        SOAP_CACHE_BACKEND,
+        SOAP_CACHE_MAX_BYTES,
+        directory=SOAP_CACHE_DIR,
+        bucket=bucket,
+        prefix='cache/soap/',
+        ttl_seconds=SOAP_CACHE_TTL_SECONDS,
+        url=SOAP_CACHE_REDIS_URL,
+    )
+
+
+_transcription_cache = None
+_transcription_cache_initialized = False
+
+
+def get_transcription_cache():
+    """Lazy initialization of the transcript cache. Returns None when TRANSCRIPT_CACHE_BACKEND is 'none'."""
+    global _transcription_cache, _transcription_cache_initialized
+
+    if not _transcription_cache_initialized:
+        bucket = None
+        if (TRANSCRIPT_CACHE_BACKEND or '').lower() == 'gcs':
+            _, storage_service, _ = get_services()
+            bucket = storage_service.bucket
+        _transcription_cache = create_cache(
+            'transcripts',
+            TRANSCRIPT_CACHE_BACKEND,
+            TRANSCRIPT_CACHE_MAX_BYTES,
+            directory=TRANSCRIPT_CACHE_DIR,
+            bucket=bucket,
+            prefix='cache/transcripts/',
+        )
+        _transcription_cache_initialized = True
+
+    return _transcription_cache
+
+
+def service_metrics():
+    """Return cache and single-flight counters of the services initialized so far (initializes nothing)."""
+    metrics = {}
+    if _speech_service is not None:
+        metrics['sttSingleFlight'] = _speech_service.inflight.stats()
+    if _vertex_ai_service is not None:
+        metrics['vertexSingleFlight'] = _vertex_ai_service.inflight.stats()
+        metrics['vertexJsonRepairs'] = _vertex_ai_service.json_repairs
+        metrics['vertexCalls'] = _vertex_ai_service.caller.stats()
+        metrics['tokenBudget'] = _vertex_ai_service.token_budget.stats()
+        if _vertex_ai_service.response_cache is not None:
+            metrics['soapCache'] = _vertex_ai_service.response_cache.stats()
+    if _transcription_cache is not None:
+        metrics['transcriptCache'] = _transcription_cache.stats()
+    return metrics
+
+
 # ---------------------------------------------------------------------------
 # Firestore helpers
 # ---------------------------------------------------------------------------
@@ -89,13 +171,752 @@ def update_title_if_empty(appointment_ref, soap_notes):
     print(f"Current title: {str(curr_title)}, new title: {str(new_title)}")
 
 
+# ---------------------------------------------------------------------------
+# Transcript segment store
+# ---------------------------------------------------------------------------
+#
+# Transcribed chunks are written as append-only documents in the
+# ``transcriptSegments`` subcollection of the appointment. Every segment gets
+# the same kind of ``order`` value, its server arrival time in nanoseconds,
+# and a unique document id, so segments from /audio-chunks, live
+# transcription and recordings never collide or overwrite each other. A
+# client chunk ``sequence`` is kept as its own field: sequenced chunks are
+# placed in sequence order among the positions they arrived in (see
+# ``order_transcript_segments``).
+#
+# ``rawTranscript`` on the appointment is only (re)materialized when a full
+# transcript is needed. ``rawTranscriptSegmentIds`` lists the segments whose
+# text it already contains, so a late segment is folded in whatever its
+# position, and ``rawTranscriptSource`` records whether it was built from the
+# segments alone (then it is rebuilt in order) or is a /process recording
+# transcript that supersedes them (then later segments are appended).
+
+TRANSCRIPT_SEGMENTS_COLLECTION = 'transcriptSegments'
+
+
+def get_transcript_segments_ref(appointment_ref):
+    """Return the transcript segment subcollection for an appointment."""
+    return appointment_ref.collection(TRANSCRIPT_SEGMENTS_COLLECTION)
+
+
+def append_transcript_segment(appointment_ref, text, sequence=None, start_ms=None, end_ms=None, source='chunk'):
+    """
+    Store one transcribed chunk as its own segment document.
+
+    This is a single small batched write regardless of how long the
+    appointment's transcript already is, and concurrent chunks never
+    overwrite each other.
+
+    Args:
+        appointment_ref: Firestore reference of the appointment.
+        text: Transcript text of the chunk (may be empty for silent chunks).
+        sequence: (Optional) Client chunk sequence number; sequenced chunks
+                  are assembled in this order even when they arrive out of order.
+        start_ms: (Optional) Start of the chunk within the recording.
+        end_ms: (Optional) End of the chunk within the recording.
+        source: Where the segment came from ('chunk', 'recording', ...).
+
+    Returns:
+        The segment's document id.
+    """
+    order = time.time_ns()
+    segment_id = f"{order:020d}-{uuid.uuid4().hex[:8]}"
+    segment = {
+        'order': order,
+        'text': text or '',
+        'source': source,
+        'createdAt': datetime.utcnow().isoformat(),
+    }
+    if sequence is not None:
+        segment['sequence'] = sequence
+    if start_ms is not None:
+        segment['startMs'] = start_ms
+    if end_ms is not None:
+        segment['endMs'] = end_ms
+
+    batch = db.batch()
+    batch.set(get_transcript_segments_ref(appointment_ref).document(segment_id), segment)
+    batch.update(appointment_ref, {'lastUpdated': datetime.utcnow().isoformat()})
+    batch.commit()
+    return segment_id
+
+
+def order_transcript_segments(segments):
+    """
+    Return segments in transcript order.
+
+    Segments keep their arrival order, except that chunks carrying a client
+    ``sequence`` are sorted by it within the positions sequenced chunks
+    occupy, so a late chunk with a lower sequence takes its place before the
+    chunks that overtook it.
+    """
+    segments = sorted(segments, key=lambda seg: (seg['order'], seg.get('id', '')))
+    slots = [i for i, seg in enumerate(segments) if seg.get('sequence') is not None]
+    sequenced = sorted((segments[i] for i in slots), key=lambda seg: (seg['sequence'], seg['order']))
+    for slot, seg in zip(slots, sequenced):
+        segments[slot] = seg
+    return segments
+
+
+def load_transcript_segments(appointment_ref):
+    """
+    Return every transcript segment in transcript order.
+
+    Returns:
+        List of segment dicts (each includes 'id', 'order' and 'text').
+    """
+    segments = [{**doc.to_dict(), 'id': doc.id} for doc in get_transcript_segments_ref(appointment_ref).stream()]
+    return order_transcript_segments(segments)
+
+
+def latest_transcript_segment(appointment_ref):
+    """Return the most recently stored transcript segment as a dict, or None if there are none."""
+    query = get_transcript_segments_ref(appointment_ref).order_by('order', direction='DESCENDING').limit(1)
+    for doc in query.stream():
+        return {**doc.to_dict(), 'id': doc.id}
+    return None
+
+
+def has_full_segment_timing(segments):
+    """
+    True when every non-empty segment records where it sits in the recording
+    (``startMs``/``endMs``), so the segments can stand in for those ranges.
+    """
+    def timed(seg):
+        return seg.get('startMs') is not None and seg.get('endMs') is not None
+
+    return any(timed(seg) for seg in segments) and all(timed(seg) for seg in segments if seg.get('text'))
+
+
+def _folded_segment_ids(appointment_data, segments):
+    """Return the ids of the segments already contained in ``rawTranscript``."""
+    folded = appointment_data.get('rawTranscriptSegmentIds')
+    if folded is not None:
+        return set(folded)
+    # Appointments materialized before segment ids were tracked store a single order watermark
+    watermark = appointment_data.get('rawTranscriptSegmentOrder')
+    if watermark is None:
+        return set()
+    return {seg['id'] for seg in segments if seg['order'] <= watermark}
+
+
+def assemble_transcript(appointment_ref, appointment_data):
+    """
+    Build the full transcript lazily from ``rawTranscript`` and the stored segments.
+
+    A transcript materialized from segments alone is rebuilt from all
+    segments, so a late out-of-order chunk lands in its place. A /process
+    recording transcript (or one stored before segments existed) is kept,
+    followed by the segments it does not contain yet.
+
+    Returns:
+        (transcript, segment_ids) — the ids of every segment the transcript contains.
+    """
+    base = appointment_data.get('rawTranscript', '') or ''
+    segments = load_transcript_segments(appointment_ref)
+    folded = _folded_segment_ids(appointment_data, segments)
+
+    if not base or appointment_data.get('rawTranscriptSource') == 'segments':
+        included = segments
+        parts = []
+    else:
+        included = [seg for seg in segments if seg['id'] not in folded]
+        parts = [base]
+    parts.extend(seg['text'] for seg in included if seg.get('text'))
+    return '\n'.join(parts), [seg['id'] for seg in segments]
+
+
+def materialize_transcript(appointment_ref, appointment_data):
+    """
+    Assemble the transcript and, if new segments were folded in, persist it as
+    ``rawTranscript`` so clients reading the appointment see the full text.
+
+    Returns:
+        The full transcript string.
+    """
+    transcript, segment_ids = assemble_transcript(appointment_ref, appointment_data)
+    folded = appointment_data.get('rawTranscriptSegmentIds')
+    if segment_ids and (folded is None or set(segment_ids) != set(folded)):
+        built_from_segments = not appointment_data.get('rawTranscript') or appointment_data.get('rawTranscriptSource') == 'segments'
+        appointment_ref.update({
+            'rawTranscript': transcript,
+            'rawTranscriptSegmentIds': segment_ids,
+            'rawTranscriptSource': 'segments' if built_from_segments else appointment_data.get('rawTranscriptSource', 'legacy'),
+            'lastUpdated': datetime.utcnow().isoformat(),
+        })
+        print(f"[Transcript] Materialized {len(transcript)} characters from {len(segment_ids)} segments")
+    return transcript
+
+
+def supersede_transcript_segments(appointment_ref, transcript, segment_ids):
+    """
+    Store a transcript produced from the full recording as ``rawTranscript``.
+
+    It replaces the text of the given segments (those stored when the
+    recording was transcribed); segments stored later are still appended.
+    """
+    appointment_ref.update({
+        'rawTranscript': transcript,
+        'rawTranscriptSegmentIds': list(segment_ids),
+        'rawTranscriptSource': 'recording',
+        'lastUpdated': datetime.utcnow().isoformat(),
+    })
+
+
+def delete_transcript_segments(appointment_ref):
+    """Delete every transcript segment of an appointment. Returns the number deleted."""
+    return _delete_collection(get_transcript_segments_ref(appointment_ref))
+
+
+def _delete_collection(collection_ref):
+    """Delete every document of a (sub)collection in batches. Returns the number deleted."""
+    deleted = 0
+    batch = db.batch()
+    for doc in collection_ref.stream():
+        batch.delete(doc.reference)
+        deleted += 1
+        if deleted % 400 == 0:
+            batch.commit()
+            batch = db.batch()
+    batch.commit()
+    return deleted
+
+
+# ---------------------------------------------------------------------------
+# Document text store
+# ---------------------------------------------------------------------------
+#
+# PDF text is extracted in the background as soon as a document is uploaded.
+# The text is written to ``documents/<appointmentId>/extracted/<id>.txt`` and
+# recorded in the ``documentTexts`` subcollection together with the source
+# object's generation and MD5, so /process can reuse it and detect when the
+# PDF has been replaced since.
+#
+# Uploads and /process can land on different Cloud Run instances, so before
+# extracting, an instance claims the record in a transaction by writing an
+# in-progress marker (``status: 'extracting'`` with the generation/MD5 being
+# extracted and ``extractionStartedAt``). Another instance that finds a fresh
+# marker for the same generation waits for the stored text instead of parsing
+# the PDF again. A marker older than ``DOCUMENT_EXTRACTION_LEASE_SECONDS`` (a
+# crashed or stuck instance) or marked 'failed' can be claimed again.
+
+DOCUMENT_TEXTS_COLLECTION = 'documentTexts'
+
+_document_executor = None
+_document_jobs = {}  # document GCS URI -> Future of a background extraction in this instance
+
+
+def get_document_texts_ref(appointment_ref):
+    """Return the extracted document text subcollection for an appointment."""
+    return appointment_ref.collection(DOCUMENT_TEXTS_COLLECTION)
+
+
+def _document_text_id(document_gcs_uri):
+    return hashlib.sha1(document_gcs_uri.encode('utf-8')).hexdigest()
+
+
+def _claim_document_extraction(record_ref, document_gcs_uri, file_info, extraction_id):
+    """
+    Decide, atomically across instances, who extracts this generation of a document.
+
+    Returns:
+        (state, record) where state is 'ready' (text for this generation is
+        stored), 'busy' (another extraction of it started less than
+        DOCUMENT_EXTRACTION_LEASE_SECONDS ago) or 'claimed' (this caller's
+        marker was written); record is the record as read.
+    """
+    @firestore.transactional
+    def claim(transaction):
+        snapshot = record_ref.get(transaction=transaction)
+        record = snapshot.to_dict() if snapshot.exists else None
+        same_source = bool(record) and (
+            record.get('generation') == file_info['generation'] and record.get('md5Hash') == file_info['md5Hash']
+        )
+        # Records written before markers existed have no status and are complete
+        status = record.get('status', 'ready') if record else None
+        if same_source and status == 'ready':
+            return 'ready', record
+        if same_source and status == 'extracting' and (
+            time.time() - record.get('extractionStartedAt', 0) < DOCUMENT_EXTRACTION_LEASE_SECONDS
+        ):
+            return 'busy', record
+        transaction.set(record_ref, {
+            'gcsUri': document_gcs_uri,
+            'generation': file_info['generation'],
+            'md5Hash': file_info['md5Hash'],
+            'status': 'extracting',
+            'extractionId': extraction_id,
+            'extractionStartedAt': time.time(),
+        })
+        return 'claimed', record
+
+    return claim(db.transaction())
+
+
+def _release_document_extraction(record_ref, extraction_id):
+    """Mark a claimed extraction as failed (if the marker is still ours) so others need not wait out the lease."""
+    @firestore.transactional
+    def release(transaction):
+        snapshot = record_ref.get(transaction=transaction)
+        if snapshot.exists and snapshot.to_dict().get('extractionId') == extraction_id:
+            transaction.update(record_ref, {'status': 'failed'})
+
+    release(db.transaction())
+
+
+def _extract_and_store_document_text(appointment_ref, record_ref, document_gcs_uri, file_info, extraction_id,
+                                     store_service):
+    """
+    Extract a claimed PDF and persist its text (GCS text object + ``documentTexts`` record).
+
+    Returns:
+        (text, characters of repeated headers/footers stripped during extraction)
+    """
+    try:
+        extraction = extract_pdf_gcs(document_gcs_uri, store_service)
+        text = extraction.text
+        boilerplate_removed = extraction.boilerplate_characters_removed
+        text_uri = store_service.upload_file(
+            text.encode('utf-8'),
+            f"documents/{appointment_ref.id}/extracted/{record_ref.id}.txt",
+            content_type='text/plain; charset=utf-8',
+        )
+    except Exception:
+        _release_document_extraction(record_ref, extraction_id)
+        raise
+
+    record_ref.set({
+        'gcsUri': document_gcs_uri,
+        'generation': file_info['generation'],
+        'md5Hash': file_info['md5Hash'],
+        'status': 'ready',
+        'textUri': text_uri,
+        'characters': len(text),
+        'boilerplateCharactersRemoved': boilerplate_removed,
+        'extractedAt': datetime.utcnow().isoformat(),
+    })
+    print(f"[Document Text] Stored {len(text)} characters for {document_gcs_uri}")
+    return text, boilerplate_removed
+
+
+def extract_and_store_document_text(appointment_ref, document_gcs_uri, store_service, wait=True):
+    """
+    Return the text of the current generation of a PDF, extracting it only if
+    no instance has stored or is extracting it.
+
+    Args:
+        appointment_ref: Firestore appointment document reference
+        document_gcs_uri: gs:// URI of the PDF
+        store_service: Initialized StorageService
+        wait: When another instance is extracting the same generation, poll
+              until its text is stored (or its marker goes stale) instead of
+              returning None.
+
+    Returns:
+        (text, source, boilerplate characters removed) where source is
+        'precomputed' or 'extracted'; None when ``wait`` is False and another
+        instance is extracting.
+    """
+    file_info = store_service.get_file_info(document_gcs_uri)
+    if file_info is None:
+        raise FileNotFoundError(f"Document not found: {document_gcs_uri}")
+
+    record_ref = get_document_texts_ref(appointment_ref).document(_document_text_id(document_gcs_uri))
+    extraction_id = uuid.uuid4().hex
+    while True:
+        state, record = _claim_document_extraction(record_ref, document_gcs_uri, file_info, extraction_id)
+        if state == 'ready':
+            text = store_service.download_file(record['textUri']).decode('utf-8')
+            print(f"[Document Text] Using precomputed text for {document_gcs_uri} ({len(text)} characters)")
+            return text, 'precomputed', record.get('boilerplateCharactersRemoved', 0)
+        if state == 'claimed':
+            if record and record.get('textUri'):
+                print(f"[Document Text] Precomputed text for {document_gcs_uri} is stale, extracting again")
+            text, boilerplate_removed = _extract_and_store_document_text(
+                appointment_ref, record_ref, document_gcs_uri, file_info, extraction_id, store_service
+            )
+            return text, 'extracted', boilerplate_removed
+        if not wait:
+            print(f"[Document Text] {document_gcs_uri} is already being extracted by another instance")
+            return None
+        time.sleep(DOCUMENT_EXTRACTION_POLL_SECONDS)
+
+
+def schedule_document_extraction(appointment_ref, document_gcs_uri):
+    """
+    Start extracting a just-uploaded document in the background. Failures are
+    only logged: /process extracts on the fly when no precomputed text exists.
+    """
+    global _document_executor
+    if _document_executor is None:
+        _document_executor = ThreadPoolExecutor(max_workers=PDF_EXTRACTION_WORKERS)
+
+    def run():
+        try:
+            _, store_service, _ = get_services()
+            return extract_and_store_document_text(appointment_ref, document_gcs_uri, store_service, wait=False)
+        except Exception as e:
+            print(f"[Document Text] Background extraction failed for {document_gcs_uri}: {str(e)}")
+            return None
+        finally:
+            _document_jobs.pop(document_gcs_uri, None)
+
+    _document_jobs[document_gcs_uri] = _document_executor.submit(run)
+    print(f"[Document Text] Scheduled background extraction for {document_gcs_uri}")
+
+
+def get_document_text(appointment_ref, document_gcs_uri, store_service):
+    """
+    Return a document's text, preferring the precomputed copy.
+
+    The stored text is used only if it was extracted from the current
+    generation of the PDF. If another instance is extracting that generation,
+    its result is awaited; otherwise (missing, stale or abandoned) the PDF is
+    extracted now and the stored copy refreshed.
+
+    Returns:
+        (text, source, boilerplate characters removed) where source is
+        'precomputed' or 'extracted'.
+    """
+    # An extraction started at upload time may still be running here: wait for
+    # it rather than parsing the same PDF twice
+    job = _document_jobs.get(document_gcs_uri)
+    if job is not None:
+        result = job.result()
+        if result is not None:
+            print(f"[Document Text] Using text from the background extraction of {document_gcs_uri}")
+            text, _, boilerplate_removed = result
+            return text, 'precomputed', boilerplate_removed
+
+    return extract_and_store_document_text(appointment_ref, document_gcs_uri, store_service)
+
+
+def delete_document_texts(appointment_ref):
+    """Delete every extracted document text record of an appointment. Returns the number deleted."""
+    return _delete_collection(get_document_texts_ref(appointment_ref))
+
+
+# ---------------------------------------------------------------------------
+# Incremental question generation
+# ---------------------------------------------------------------------------
+#
+# While a recording is running the client polls /generate-questions. Rather
+# than sending the whole (growing) transcript every time, the appointment's
+# ``questionState`` map keeps a compact digest of the conversation, the
+# questions generated so far, and a watermark: the transcript length already
+# folded into the digest plus a hash of that prefix. Each call sends only the
+# transcript added after the watermark. If the prefix no longer matches (the
+# transcript was rewritten, e.g. by /process), the state is rebuilt from the
+# whole transcript.
+
+QUESTION_STATE_FIELD = 'questionState'
+
+
+def _transcript_prefix_hash(transcript, length):
+    return hashlib.sha256(transcript[:length].encode('utf-8')).hexdigest()
+
+
+def load_question_state(appointment_data, transcript):
+    """
+    Return the stored question state if it still matches the transcript.
+
+    Returns:
+        dict with ``digest``, ``questions`` and ``transcriptCharacters``, or
+        None when there is no state or the transcript was rewritten.
+    """
+    state = appointment_data.get(QUESTION_STATE_FIELD)
+    if not isinstance(state, dict):
+        return None
+    watermark = state.get('transcriptCharacters')
+    if not isinstance(watermark, int) or watermark > len(transcript):
+        return None
+    if state.get('transcriptHash') != _transcript_prefix_hash(transcript, watermark):
+        print(f"[Questions] Transcript changed before the watermark, rebuilding the digest")
+        return None
+    return state
+
+
+def generate_questions_incremental(appointment_ref, appointment_data, transcript, ai_service):
+    """
+    Return questions for a growing transcript, sending the model only the
+    part added since the last call.
+
+    When fewer than ``QUESTIONS_MIN_NEW_CHARACTERS`` were added, the stored
+    questions are returned without a model call.
+
+    Returns:
+        (questions, info) — info has ``mode`` ('cached' or 'incremental') and
+        ``newCharacters``.
+    """
+    state = load_question_state(appointment_data, transcript)
+    watermark = state['transcriptCharacters'] if state else 0
+    delta = transcript[watermark:]
+    info = {'mode': 'incremental', 'newCharacters': len(delta)}
+
+    if state and len(delta.strip()) < QUESTIONS_MIN_NEW_CHARACTERS:
+        print(f"[Questions] {len(delta)} new characters (< {QUESTIONS_MIN_NEW_CHARACTERS}), returning stored questions")
+        info['mode'] = 'cached'
+        return list(state.get('questions') or []), info
+
+    prompt_delta, _ = compact_for_prompt(delta, label="Generate Questions")
+    digest = state.get('digest', '') if state else ''
+    previous = (state.get('questions') or []) if state else []
+    print(f"[Questions] Sending {len(prompt_delta)} new characters with a {len(digest)}-character digest "
+          f"(transcript is {len(transcript)} characters)")
+    result = ai_service.update_questions(digest, previous, prompt_delta, digest_max_words=QUESTIONS_DIGEST_MAX_WORDS)
+
+    appointment_ref.update({
+        QUESTION_STATE_FIELD: {
+            'digest': result['digest'],
+            'questions': result['questions'],
+            'transcriptCharacters': len(transcript),
+            'transcriptHash': _transcript_prefix_hash(transcript, len(transcript)),
+            'updatedAt': datetime.utcnow().isoformat(),
+        },
+    })
+    return result['questions'], info
+
+
+# ---------------------------------------------------------------------------
+# Rolling summary
+# ---------------------------------------------------------------------------
+#
+# While transcript segments arrive (/audio-chunks, live transcription) a
+# partial structured summary is kept up to date in the background, in the
+# appointment's ``rollingSummary`` map (summary, schema version, and the same
+# length + prefix-hash watermark used for questions). Updates are debounced
+# per appointment: the first new segment starts a timer, segments arriving
+# meanwhile are coalesced into that run, and segments arriving during a run
+# schedule one follow-up run. /finalize then only reconciles the rolling
+# summary with the transcript it has not seen yet.
+
+ROLLING_SUMMARY_FIELD = 'rollingSummary'
+ROLLING_SUMMARY_SCHEMA_VERSION = Constants.SUMMARY_SCHEMA_VERSION_1_2  # the version /finalize produces
+
+_rolling_executor = None
+_rolling_jobs = {}  # appointment path -> {'timer', 'future', 'dirty'} for updates in this instance
+_rolling_lock = threading.Lock()
+
+
+def load_rolling_summary(appointment_data, transcript, schema_version=ROLLING_SUMMARY_SCHEMA_VERSION):
+    """
+    Return the stored rolling summary state if it still matches the transcript.
+
+    Returns:
+        dict with ``summary`` and ``transcriptCharacters``, or None when there
+        is no state, it has another schema version, or the transcript was rewritten.
+    """
+    state = appointment_data.get(ROLLING_SUMMARY_FIELD)
+    if not isinstance(state, dict) or not isinstance(state.get('summary'), dict):
+        return None
+    if state.get('schemaVersion') != schema_version:
+        return None
+    watermark = state.get('transcriptCharacters')
+    if not isinstance(watermark, int) or watermark > len(transcript):
+        return None
+    if state.get('transcriptHash') != _transcript_prefix_hash(transcript, watermark):
+        print(f"[Rolling Summary] Transcript changed before the watermark, ignoring the rolling summary")
+        return None
+    return state
+
+
+def update_rolling_summary(appointment_ref, ai_service=None):
+    """
+    Fold the transcript added since the last update into the rolling summary.
+    Does nothing when fewer than ``ROLLING_SUMMARY_MIN_NEW_CHARACTERS`` were added.
+
+    Returns:
+        True if the rolling summary was updated.
+    """
+    appointment_doc = appointment_ref.get()
+    if not appointment_doc.exists:
+        return False
+    appointment_data = appointment_doc.to_dict()
+    if appointment_data.get('status') == 'Completed':
+        return False
+
+    transcript, _ = assemble_transcript(appointment_ref, appointment_data)
+    state = load_rolling_summary(appointment_data, transcript)
+    watermark = state['transcriptCharacters'] if state else 0
+    delta = transcript[watermark:]
+    if len(delta.strip()) < ROLLING_SUMMARY_MIN_NEW_CHARACTERS:
+        return False
+
+    if ai_service is None:
+        _, _, ai_service = get_services()
+    prompt_delta, _ = compact_for_prompt(delta, label="Rolling Summary")
+    started = time.monotonic()
+    summary = ai_service.update_partial_summary(
+        state['summary'] if state else {}, prompt_delta, ROLLING_SUMMARY_SCHEMA_VERSION,
+    )
+    appointment_ref.update({
+        ROLLING_SUMMARY_FIELD: {
+            'summary': summary,
+            'schemaVersion': ROLLING_SUMMARY_SCHEMA_VERSION,
+            'transcriptCharacters': len(transcript),
+            'transcriptHash': _transcript_prefix_hash(transcript, len(transcript)),
+            'updatedAt': datetime.utcnow().isoformat(),
+        },
+    })
+    print(f"[Rolling Summary] Folded {len(delta)} new characters in {time.monotonic() - started:.1f}s "
+          f"(watermark {watermark} -> {len(transcript)})")
+    return True
+
+
+def _run_rolling_summary(appointment_ref, job):
+    key = appointment_ref.path
+    try:
+        update_rolling_summary(appointment_ref)
+    except Exception as e:
+        print(f"[Rolling Summary] Background update failed for {key}: {str(e)}")
+    finally:
+        with _rolling_lock:
+            registered = _rolling_jobs.get(key) is job   # False once finalize has taken over
+            if registered:
+                del _rolling_jobs[key]
+        if registered and job['dirty']:
+            schedule_rolling_summary(appointment_ref)
+
+
+def _start_rolling_summary(appointment_ref):
+    with _rolling_lock:
+        job = _rolling_jobs.get(appointment_ref.path)
+        if job is None or job['timer'] is None:
+            return  # cancelled by finalize
+        job['timer'] = None
+        job['future'] = _rolling_executor.submit(_run_rolling_summary, appointment_ref, job)
+
+
+def schedule_rolling_summary(appointment_ref):
+    """
+    Schedule a debounced background update of the rolling summary after a new
+    transcript segment. Calls made while an update is pending are coalesced
+    into it; calls made while one is running trigger one follow-up update.
+    """
+    global _rolling_executor
+    if not ROLLING_SUMMARY_ENABLED:
+        return
+    with _rolling_lock:
+        if _rolling_executor is None:
+            _rolling_executor = ThreadPoolExecutor(max_workers=ROLLING_SUMMARY_WORKERS)
+        job = _rolling_jobs.setdefault(appointment_ref.path, {'timer': None, 'future': None, 'dirty': False})
+        if job['future'] is not None:
+            job['dirty'] = True
+            return
+        if job['timer'] is not None:
+            return
+        timer = threading.Timer(ROLLING_SUMMARY_DEBOUNCE_SECONDS, _start_rolling_summary, args=(appointment_ref,))
+        timer.daemon = True
+        job['timer'] = timer
+        timer.start()
+
+
+def settle_rolling_summary(appointment_ref, timeout=None):
+    """
+    Cancel a pending rolling summary update and wait (up to ``timeout``,
+    default ``ROLLING_SUMMARY_FINALIZE_WAIT_SECONDS``) for a running one.
+    """
+    with _rolling_lock:
+        job = _rolling_jobs.pop(appointment_ref.path, None)
+        if job is not None and job['timer'] is not None:
+            job['timer'].cancel()
+    if job is not None and job['future'] is not None:
+        try:
+            job['future'].result(timeout=ROLLING_SUMMARY_FINALIZE_WAIT_SECONDS if timeout is None else timeout)
+        except Exception as e:
+            print(f"[Rolling Summary] Not waiting for the running update: {type(e).__name__} {str(e)}")
+
+
+def reconcile_rolling_summary(appointment_ref, raw_transcript, ai_service, schema_version):
+    """
+    Build the final summary from the rolling summary plus the transcript it
+    has not covered yet.
+
+    Returns:
+        The summary, or None when no usable rolling summary exists (the caller
+        then summarizes the whole transcript).
+    """
+    if not ROLLING_SUMMARY_ENABLED or schema_version != ROLLING_SUMMARY_SCHEMA_VERSION:
+        return None
+    settle_rolling_summary(appointment_ref)
+    appointment_doc = appointment_ref.get()
+    state = load_rolling_summary(appointment_doc.to_dict() or {}, raw_transcript, schema_version)
+    if state is None:
+        return None
+
+    watermark = state['transcriptCharacters']
+    summarized_tail, _ = compact_for_prompt(
+        raw_transcript[max(0, watermark - ROLLING_SUMMARY_CONTEXT_CHARACTERS):watermark], label="Rolling Summary",
+    )
+    unsummarized_tail, _ = compact_for_prompt(raw_transcript[watermark:], label="Rolling Summary")
+    print(f"[Rolling Summary] Reconciling: {watermark} characters already summarized, "
+          f"{len(raw_transcript) - watermark} new")
+    try:
+        return ai_service.reconcile_summary(state['summary'], summarized_tail, unsummarized_tail, schema_version)
+    except Exception as e:
+        print(f"[Rolling Summary] Reconciliation failed, summarizing the whole transcript: {str(e)}")
+        return None
+
+
 # ---------------------------------------------------------------------------
 # SOAP generation helper
 # ---------------------------------------------------------------------------
 
-def generate_soap_and_finalize(appointment_ref, raw_transcript, ai_service, schema_version=Constants.SUMMARY_SCHEMA_VERSION_1_2):
+SUMMARY_DRAFT_FIELD = 'processedSummaryDraft'
+
+
+class SummaryDraftWriter:
+    """
+    Persist summary sections to the appointment's ``processedSummaryDraft``
+    map as they stream in, so clients listening to the appointment see the
+    title and summary long before the whole summary is generated.
+
+    The first section is written immediately; later ones are batched into
+    at most one write per ``flush_seconds``. When the summary is complete the
+    draft is removed in the same update that stores ``processedSummary``
+    (see ``draft_cleanup``).
+    """
+
+    def __init__(self, appointment_ref, flush_seconds: float = None):
+        self.appointment_ref = appointment_ref
+        self.flush_seconds = flush_seconds if flush_seconds is not None else SOAP_DRAFT_FLUSH_SECONDS
+        self.sections_written = 0
+        self._pending = {}
+        self._last_write = None
+
+    def __call__(self, key, value):
+        self._pending[key] = value
+        if self._last_write is None or time.monotonic() - self._last_write >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        """Write pending sections now."""
+        if not self._pending:
+            return
+        self.appointment_ref.update({f"{SUMMARY_DRAFT_FIELD}.{key}": value for key, value in self._pending.items()})
+        self.sections_written += len(self._pending)
+        print(f"[Summary Draft] Wrote section(s): {', '.join(self._pending)}")
+        self._pending = {}
+        self._last_write = time.monotonic()
+
+    @staticmethod
+    def draft_cleanup() -> dict:
+        """Return the update fields that remove the draft."""
+        return {SUMMARY_DRAFT_FIELD: firestore.DELETE_FIELD}
+
+
+def create_summary_draft_writer(appointment_ref):
+    """Return a SummaryDraftWriter, or None when SOAP_STREAM_SECTIONS is disabled."""
+    return SummaryDraftWriter(appointment_ref) if SOAP_STREAM_SECTIONS else None
+
+
+def generate_soap_and_finalize(appointment_ref, raw_transcript, ai_service, schema_version=Constants.SUMMARY_SCHEMA_VERSION_1_2,
+                               force_regenerate=False):
     """
     Generate SOAP notes from a transcript and mark the appointment as Completed.
+    When a rolling summary was built during the recording, it is reconciled
+    with the rest of the transcript instead of summarizing from scratch.
+    ``force_regenerate`` skips the rolling summary and the SOAP response cache.
 
     Returns:
         (soap_notes, None) on success.
@@ -106,7 +927,16 @@ def generate_soap_and_finalize(appointment_ref, raw_transcript, ai_service, sche
         return None, (jsonify({'error': 'No transcript available to process', 'status': 'failed'}), 400)
 
     try:
-        soap_notes = ai_service.process_transcript_to_soap(raw_transcript, schema_version=schema_version)
+        soap_notes = None
+        if not force_regenerate:
+            soap_notes = reconcile_rolling_summary(appointment_ref, raw_transcript, ai_service, schema_version)
+        if soap_notes is None:
+            prompt_transcript, _ = compact_for_prompt(raw_transcript, label="SOAP")
+            draft_writer = create_summary_draft_writer(appointment_ref)
+            soap_notes = ai_service.process_transcript_to_soap(
+                prompt_transcript, schema_version=schema_version, force_regenerate=force_regenerate,
+                on_section=draft_writer,
+            )
         print(f"SOAP notes generated successfully")
     except Exception as e:
         print(f"Error generating SOAP notes: {str(e)}")
@@ -119,6 +949,7 @@ def generate_soap_and_finalize(appointment_ref, raw_transcript, ai_service, sche
         'processedSummary': soap_notes,
         'status': 'Completed',
         'lastUpdated': datetime.utcnow().isoformat(),
+        **SummaryDraftWriter.draft_cleanup(),
     })
 
     update_title_if_empty(appointment_ref, soap_notes)
@@ -130,6 +961,27 @@ def generate_soap_and_finalize(appointment_ref, raw_transcript, ai_service, sche
 # Audio processing helpers
 # ---------------------------------------------------------------------------
 
+def add_document_link(appointment_ref, appointment_data, document_gcs_uri):
+    """
+    Append a document to the appointment's ``documentLinks`` (and set the
+    legacy ``documentLink`` to it).
+
+    Returns:
+        The number of documents now linked to the appointment.
+    """
+    existing_links = appointment_data.get('documentLinks', [])
+    if not isinstance(existing_links, list):
+        existing_links = [existing_links] if existing_links else []
+    existing_links.append(document_gcs_uri)
+
+    appointment_ref.update({
+        'documentLinks': existing_links,
+        'documentLink': document_gcs_uri,  # backward compat: last uploaded doc
+        'lastUpdated': datetime.utcnow().isoformat(),
+    })
+    return len(existing_links)
+
+
 def detect_file_extension(filename):
     """Extract file extension from a filename, defaulting to 'webm'."""
     if filename and '.' in filename:
@@ -137,53 +989,49 @@ def detect_file_extension(filename):
     return 'webm'
 
 
-def split_audio_to_webm_chunks(audio_content, file_extension, chunk_length_ms=30000):
+def split_audio_to_pcm_segments(audio_content, file_extension, segment_seconds=30, segmenter=None):
     """
-    Load raw audio bytes and split into webm-encoded chunks.
+    Decode audio once with ffmpeg and split it into PCM segments.
+
+    Segments are produced lazily as the decoder runs, so the whole recording is
+    never held in memory as PCM. Use ``encode_pcm_to_webm`` on a segment only
+    when a compressed backup copy is needed.
 
     Args:
-        audio_content: Raw audio file bytes.
-        file_extension: Format hint for pydub (e.g. 'webm', 'mp3').
-        chunk_length_ms: Chunk duration in milliseconds (default 30 s).
+        audio_content: Raw audio file bytes, or a readable binary file object
+                       (e.g. an uploaded file's stream), read in bounded blocks.
+        file_extension: Format hint for ffmpeg (e.g. 'webm', 'mp3').
+        segment_seconds: Segment duration in seconds for fixed slicing (default 30 s).
+        segmenter: Optional VoiceActivitySegmenter (see ``utils.vad.create_segmenter``)
+                   to cut at pauses and skip silence instead of fixed slicing.
 
     Returns:
-        List of bytes, each being a webm-encoded audio chunk.
-
-    Raises:
-        Exception if the audio cannot be loaded or converted.
+        Iterator of PcmSegment objects (16 kHz mono 16-bit PCM).
     """
-    audio = AudioSegment.from_file(io.BytesIO(audio_content), format=file_extension)
-    print(f"Audio loaded: duration={len(audio)}ms, channels={audio.channels}, frame_rate={audio.frame_rate}")
-
-    chunks = []
-    for i in range(0, len(audio), chunk_length_ms):
-        chunk = audio[i:i + chunk_length_ms]
-        chunk_buffer = io.BytesIO()
-        chunk.export(chunk_buffer, format='webm')
-        chunks.append(chunk_buffer.getvalue())
+    if isinstance(audio_content, (bytes, bytearray)):
+        print(f"Decoding {len(audio_content)} bytes of {file_extension} audio into PCM segments")
+    else:
+        print(f"Decoding streamed {file_extension} audio into PCM segments")
+    return segment_audio(audio_content, input_format=file_extension, segment_seconds=segment_seconds, segmenter=segmenter)
 
-    print(f"Split audio into {len(chunks)} chunks of ~{chunk_length_ms // 1000}s each")
-    return chunks
 
-
-def transcribe_chunks(chunks, stt_service):
+def transcribe_chunks(segments, stt_service, max_workers=None):
     """
-    Transcribe a list of audio chunk byte arrays and combine into a single transcript.
+    Transcribe PCM segments concurrently and combine them into a single
+    transcript, preserving segment order.
 
     This is used by endpoints that do NOT need per-chunk GCS upload or Firestore updates
     (e.g. the "try" / demo endpoints).
 
     Returns:
-        Combined transcript string.
+        TranscriptionResult with ordered parts; call ``.join()`` for the combined transcript.
     """
-    transcript_parts = []
-    for idx, chunk_content in enumerate(chunks):
-        print(f"Transcribing chunk {idx + 1}/{len(chunks)}...")
-        text = stt_service.transcribe_audio_chunk(chunk_content, use_gcs=False, gcs_uri=None)
-        print(f"Chunk {idx + 1} transcription completed")
-        if text:
-            transcript_parts.append(text)
-    return '\n'.join(transcript_parts)
+    transcriber = ConcurrentTranscriber(
+        lambda idx, segment: stt_service.transcribe_pcm(segment.pcm),
+        max_workers=max_workers,
+        label="Transcribe Chunks",
+    )
+    return transcriber.transcribe(segments)
 
 
 def parse_notes_from_request(request):
@@ -199,3 +1047,17 @@ def parse_notes_from_request(request):
         if json_data:
             notes_text = json_data.get('notes', '') or json_data.get('transcript', '')
     return notes_text
+
+
+def parse_force_regenerate(request):
+    """
+    Return True if the request asks to bypass the SOAP response cache
+    (``forceRegenerate`` in the JSON body, form data or query string).
+    """
+    json_data = request.get_json(silent=True) or {}
+    value = json_data.get('forceRegenerate')
+    if value is None:
+        value = request.form.get('forceRegenerate') or request.args.get('forceRegenerate')
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes')
+    return bool(value)
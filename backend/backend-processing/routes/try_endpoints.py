@@ -13,12 +13,15 @@ Endpoints:
 
 from flask import Blueprint, request, jsonify
 from utils.constants import Constants
+from utils.vad import create_segmenter
+from utils.transcript_compaction import compact_for_prompt
 from routes.services import (
     get_services,
     detect_file_extension,
-    split_audio_to_webm_chunks,
+    split_audio_to_pcm_segments,
     transcribe_chunks,
     parse_notes_from_request,
+    parse_force_regenerate,
 )
 
 try_bp = Blueprint('try_endpoints', __name__)
@@ -40,6 +43,7 @@ def generate_questions_try():
 
         try:
             _, _, ai_service = get_services()
+            appointment_transcript, _ = compact_for_prompt(appointment_transcript, label="Generate Questions Try")
             questions = ai_service.generate_questions(appointment_transcript)
         except Exception as e:
             return jsonify({'error': f'Question generation failed: {str(e)}'}), 500
@@ -57,8 +61,8 @@ def generate_questions_try():
 def upload_recording_try():
     """
     POST /appointments/upload-recording-try
-    Uploads a pre-recorded audio file, splits it into 30 s chunks,
-    transcribes each chunk, and generates SOAP notes.
+    Uploads a pre-recorded audio file, decodes it once into speech segments,
+    transcribes the segments concurrently, and generates SOAP notes.
     Mirrors upload-recording logic but without auth, Firestore, or GCS storage.
     No auth required.
     """
@@ -69,23 +73,18 @@ def upload_recording_try():
         audio_file = request.files['recording']
         print(f"[Upload Recording Try] Starting processing")
 
-        audio_content = audio_file.read()
         file_extension = detect_file_extension(audio_file.filename)
-        audio_size_mb = len(audio_content) / (1024 * 1024)
-        print(f"[Upload Recording Try] Received audio file: {audio_size_mb:.2f} MB, format: {file_extension}")
+        print(f"[Upload Recording Try] Received audio file: {audio_file.filename or 'recording'}, format: {file_extension}")
 
-        # Split audio into webm chunks
-        try:
-            chunks = split_audio_to_webm_chunks(audio_content, file_extension)
-        except Exception as e:
-            print(f"[Upload Recording Try] Error loading audio: {str(e)}")
-            return jsonify({'error': f'Failed to load audio file: {str(e)}', 'status': 'failed'}), 400
-
-        # Transcribe all chunks (no GCS upload, no Firestore)
+        # Decode once into PCM segments and transcribe them (no GCS upload, no Firestore)
         stt_service, _, _ = get_services()
 
         try:
-            current_transcript = transcribe_chunks(chunks, stt_service)
+            segmenter = create_segmenter()
+            # Decode straight from the uploaded file stream instead of reading it into memory
+            segments = split_audio_to_pcm_segments(audio_file.stream, file_extension, segmenter=segmenter)
+            transcription = transcribe_chunks(segments, stt_service)
+            current_transcript = transcription.join('\n')
         except Exception as e:
             print(f"[Upload Recording Try] Transcription error: {str(e)}")
             return jsonify({'error': f'Transcription failed: {str(e)}', 'status': 'failed'}), 500
@@ -99,7 +98,11 @@ def upload_recording_try():
         print(f"[Upload Recording Try] Generating SOAP notes...")
         try:
             _, _, ai_service = get_services()
-            soap_notes = ai_service.process_transcript_to_soap(current_transcript, schema_version=Constants.SUMMARY_SCHEMA_VERSION_1_2)
+            prompt_transcript, _ = compact_for_prompt(current_transcript, label="Upload Recording Try")
+            soap_notes = ai_service.process_transcript_to_soap(
+                prompt_transcript, schema_version=Constants.SUMMARY_SCHEMA_VERSION_1_2,
+                force_regenerate=parse_force_regenerate(request),
+            )
             print(f"[Upload Recording Try] SOAP notes generated successfully")
         except Exception as e:
             print(f"[Upload Recording Try] Error generating SOAP notes: {str(e)}")
@@ -114,7 +117,8 @@ def upload_recording_try():
             'title': new_title,
             'transcript': current_transcript,
             'status': 'Completed',
-            'chunksProcessed': len(chunks)
+            'chunksProcessed': len(transcription.parts),
+            'audioSecondsSkipped': segmenter.stats.skipped_seconds if segmenter else 0,
         }), 200
 
     except Exception as e:
@@ -139,7 +143,10 @@ def upload_notes_try():
         # Generate SOAP notes
         try:
             _, _, ai_service = get_services()
-            soap_notes = ai_service.process_transcript_to_soap(appointment_notes, schema_version=Constants.SUMMARY_SCHEMA_VERSION_1_2)
+            soap_notes = ai_service.process_transcript_to_soap(
+                appointment_notes, schema_version=Constants.SUMMARY_SCHEMA_VERSION_1_2,
+                force_regenerate=parse_force_regenerate(request),
+            )
             print(f"[Upload Notes Try] SOAP notes generated successfully")
         except Exception as e:
             print(f"[Upload Notes Try] Error generating SOAP notes: {str(e)}")
@@ -0,0 +1,149 @@
+"""
+Direct-to-GCS upload sessions.
+
+Endpoints:
+- POST /appointments/<id>/upload-sessions           — Start a resumable upload session for a recording or document
+- POST /appointments/<id>/upload-sessions/complete  — Record an uploaded object on the appointment
+
+Clients upload file bytes straight to Cloud Storage through the returned
+session URL (HTTP PUT, optionally in chunks with Content-Range headers), so
+recordings and documents never pass through the API instance.
+"""
+
+import os
+from flask import Blueprint, request, jsonify
+from datetime import datetime
+from utils.auth import verify_firebase_token
+from routes.services import (
+    get_services,
+    get_appointment_or_404,
+    detect_file_extension,
+    add_document_link,
+    schedule_document_extraction,
+)
+
+uploads_bp = Blueprint('uploads', __name__)
+
+UPLOAD_KINDS = ('recording', 'document')
+
+
+def _object_prefix(kind, appointment_id):
+    """Return the GCS folder for an upload kind."""
+    return f"recordings/{appointment_id}/" if kind == 'recording' else f"documents/{appointment_id}/"
+
+
+@uploads_bp.route('/appointments/<appointment_id>/upload-sessions', methods=['POST'])
+@verify_firebase_token
+def create_upload_session(user_id, appointment_id):
+    """
+    POST /appointments/{appointmentId}/upload-sessions
+    Starts a resumable upload session for a recording or PDF document and
+    returns the session URL the client uploads to directly.
+
+    Expects JSON: {"kind": "recording" | "document", "filename": "...", "contentType": "..."}
+    """
+    try:
+        json_data = request.get_json(silent=True) or {}
+        kind = json_data.get('kind', '')
+        if kind not in UPLOAD_KINDS:
+            return jsonify({'error': f"kind must be one of {', '.join(UPLOAD_KINDS)}", 'status': 'failed'}), 400
+
+        appointment_ref, appointment_data, error = get_appointment_or_404(user_id, appointment_id)
+        if error:
+            return error
+
+        filename = os.path.basename(json_data.get('filename', '') or '')
+        timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
+        if kind == 'recording':
+            file_extension = detect_file_extension(filename)
+            object_name = f"{_object_prefix(kind, appointment_id)}{timestamp}_full.{file_extension}"
+            content_type = json_data.get('contentType') or f'audio/{file_extension}'
+        else:
+            object_name = f"{_object_prefix(kind, appointment_id)}{timestamp}_{filename or 'document.pdf'}"
+            content_type = json_data.get('contentType') or 'application/pdf'
+
+        _, store_service, _ = get_services()
+        session_url = store_service.create_upload_session(
+            object_name, content_type, origin=request.headers.get('Origin'),
+        )
+        gcs_uri = f"gs://{store_service.bucket.name}/{object_name}"
+        print(f"[Upload Session] Started {kind} upload session for {gcs_uri}")
+
+        return jsonify({
+            'message': 'Upload session created',
+            'appointmentId': appointment_id,
+            'kind': kind,
+            'uploadUrl': session_url,
+            'method': 'PUT',
+            'contentType': content_type,
+            'gcsUri': gcs_uri,
+            'status': 'created'
+        }), 200
+
+    except Exception as e:
+        print(f"[Upload Session] Error: {str(e)}")
+        return jsonify({'error': str(e), 'status': 'failed'}), 500
+
+
+@uploads_bp.route('/appointments/<appointment_id>/upload-sessions/complete', methods=['POST'])
+@verify_firebase_token
+def complete_upload_session(user_id, appointment_id):
+    """
+    POST /appointments/{appointmentId}/upload-sessions/complete
+    Confirms that a direct upload finished and links the object to the
+    appointment (recordingLink, or documentLinks for documents).
+
+    Expects JSON: {"kind": "recording" | "document", "gcsUri": "gs://..."}
+    """
+    try:
+        json_data = request.get_json(silent=True) or {}
+        kind = json_data.get('kind', '')
+        gcs_uri = json_data.get('gcsUri', '')
+        if kind not in UPLOAD_KINDS or not gcs_uri:
+            return jsonify({'error': 'kind and gcsUri are required', 'status': 'failed'}), 400
+
+        appointment_ref, appointment_data, error = get_appointment_or_404(user_id, appointment_id)
+        if error:
+            return error
+
+        _, store_service, _ = get_services()
+        # Links are always stored as gs://<bucket>/<object>, like every other upload path
+        if not gcs_uri.startswith('gs://'):
+            return jsonify({'error': 'gcsUri must be a gs://<bucket>/<object> URI', 'status': 'failed'}), 400
+        try:
+            object_name = store_service.get_blob_name(gcs_uri)
+        except ValueError as e:
+            return jsonify({'error': str(e), 'status': 'failed'}), 400
+
+        # Only objects inside this appointment's folder can be linked to it
+        if not object_name.startswith(_object_prefix(kind, appointment_id)) or '..' in object_name:
+            return jsonify({'error': 'gcsUri does not belong to this appointment', 'status': 'failed'}), 400
+
+        file_info = store_service.get_file_info(gcs_uri)
+        if not file_info:
+            return jsonify({'error': 'Upload not found; the upload may not have finished', 'status': 'failed'}), 404
+
+        print(f"[Upload Session] Completed {kind} upload: {gcs_uri} ({file_info['size']} bytes)")
+
+        response = {
+            'message': 'Upload recorded successfully',
+            'appointmentId': appointment_id,
+            'kind': kind,
+            'gcsUri': gcs_uri,
+            'size': file_info['size'],
+            'status': 'uploaded'
+        }
+        if kind == 'recording':
+            appointment_ref.update({
+                'recordingLink': gcs_uri,
+                'lastUpdated': datetime.utcnow().isoformat(),
+            })
+        else:
+            response['documentCount'] = add_document_link(appointment_ref, appointment_data, gcs_uri)
+            schedule_document_extraction(appointment_ref, gcs_uri)
+
+        return jsonify(response), 200
+
+    except Exception as e:
+        print(f"[Upload Session] Error completing upload: {str(e)}")
+        return jsonify({'error': str(e), 'status': 'failed'}), 500
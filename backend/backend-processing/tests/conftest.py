@@ -0,0 +1,18 @@
+"""
+Shared test setup.
+
+The route modules open a Firestore client at import time, so Firebase Admin
+initialization is replaced before any of them are imported. Tests run from
+this directory's parent: ``python -m pytest -q tests``.
+"""
+import os
+import sys
+from unittest import mock
+
+import firebase_admin
+from firebase_admin import firestore
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+mock.patch.object(firebase_admin, 'initialize_app').start()
+mock.patch.object(firestore, 'client').start()
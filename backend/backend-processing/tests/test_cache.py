@@ -0,0 +1,92 @@
+"""Caches: keys, LRU and disk eviction, TTL expiry, and backend errors treated as misses."""
+import os
+from unittest import mock
+
+from utils.cache import Cache, CacheBackend, DiskBackend, MemoryLRUBackend, create_cache, make_cache_key
+
+
+class BrokenBackend(CacheBackend):
+    def get(self, key):
+        raise ConnectionError('redis down')
+
+    def set(self, key, value):
+        raise ConnectionError('redis down')
+
+    def delete(self, key):
+        raise ConnectionError('redis down')
+
+
+def test_cache_keys_are_stable_and_length_prefixed():
+    assert make_cache_key('transcript', b'audio', 'cfg') == make_cache_key('transcript', b'audio', 'cfg')
+    assert make_cache_key('ab', 'c') != make_cache_key('a', 'bc')
+    assert make_cache_key('1') == make_cache_key(1)
+
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryLRUBackend(max_bytes=10)
+    backend.set('a', 'aaaa')
+    backend.set('b', 'bbbb')
+    backend.get('a')
+    backend.set('c', 'cccc')
+
+    assert backend.get('a') == 'aaaa'
+    assert backend.get('b') is None
+    assert backend.get('c') == 'cccc'
+
+
+def test_memory_backend_skips_values_larger_than_the_budget():
+    backend = MemoryLRUBackend(max_bytes=4)
+    backend.set('small', 'abc')
+    backend.set('big', 'abcdefgh')
+
+    assert backend.get('big') is None
+    assert backend.get('small') == 'abc'
+
+
+def test_disk_backend_round_trips_and_evicts_oldest(tmp_path):
+    backend = DiskBackend(str(tmp_path), max_bytes=10)
+    backend.set('old', 'oooooo')
+    os.utime(tmp_path / 'old', (1, 1))
+    backend.set('new', 'nnnnnn')
+
+    assert backend.get('old') is None
+    assert backend.get('new') == 'nnnnnn'
+    backend.delete('new')
+    backend.delete('missing')
+    assert backend.get('new') is None
+
+
+def test_cache_counts_hits_and_misses():
+    cache = Cache('test', MemoryLRUBackend())
+    cache.set('k', 'value')
+
+    assert cache.get('k') == 'value'
+    assert cache.get('other') is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1 and cache.stats()['hitRate'] == 0.5
+
+
+def test_expired_entries_are_misses_and_deleted():
+    backend = MemoryLRUBackend()
+    cache = Cache('test', backend, ttl_seconds=60)
+    with mock.patch('utils.cache.time.time', return_value=1000.0):
+        cache.set('k', 'value')
+        assert cache.get('k') == 'value'
+    with mock.patch('utils.cache.time.time', return_value=1061.0):
+        assert cache.get('k') is None
+
+    assert backend.get('k') is None
+    assert cache.stats()['expired'] == 1
+
+
+def test_backend_errors_are_misses_not_failures():
+    cache = Cache('test', BrokenBackend())
+    cache.set('k', 'value')
+
+    assert cache.get('k') is None
+    assert cache.stats()['errors'] == 2 and cache.stats()['misses'] == 1
+
+
+def test_create_cache_from_configuration(tmp_path):
+    assert create_cache('t', 'none', 1024) is None
+    assert isinstance(create_cache('t', 'memory', 1024).backend, MemoryLRUBackend)
+    assert isinstance(create_cache('t', 'disk', 1024, directory=str(tmp_path)).backend, DiskBackend)
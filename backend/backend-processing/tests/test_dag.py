@@ -0,0 +1,52 @@
+"""DagExecutor concurrency, dependency and timeout handling."""
+import threading
+import time
+
+from utils.dag import DagExecutor, Task, TaskTimeoutError
+
+
+def test_independent_tasks_run_concurrently():
+    run = DagExecutor([
+        Task('a', lambda: time.sleep(0.2) or 'a'),
+        Task('b', lambda: time.sleep(0.2) or 'b'),
+    ]).run()
+
+    assert run['a'].value == 'a' and run['b'].value == 'b'
+    assert run.wall_seconds < 0.35
+
+
+def test_dependents_receive_results_and_are_skipped_after_failure():
+    def fail():
+        raise RuntimeError('boom')
+
+    run = DagExecutor([
+        Task('a', lambda: 2),
+        Task('double', lambda a: a * 2, deps=('a',)),
+        Task('broken', fail),
+        Task('after_broken', lambda broken: broken, deps=('broken',)),
+    ]).run()
+
+    assert run['double'].value == 4
+    assert isinstance(run['broken'].error, RuntimeError)
+    assert run['after_broken'].skipped and not run['after_broken'].ok
+
+
+def test_timed_out_task_is_reported_without_waiting_for_it():
+    release = threading.Event()
+    finished = threading.Event()
+
+    def slow():
+        release.wait(5)
+        finished.set()
+        return 'late'
+
+    start = time.monotonic()
+    run = DagExecutor([Task('slow', slow, timeout_seconds=0.1)]).run()
+
+    assert time.monotonic() - start < 1
+    assert isinstance(run['slow'].error, TaskTimeoutError)
+    assert run['slow'].value is None
+    # The abandoned thread still finishes in the background; its result is never used
+    release.set()
+    assert finished.wait(5)
+    assert run['slow'].value is None
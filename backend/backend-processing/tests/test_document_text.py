@@ -0,0 +1,134 @@
+"""Document text store: the in-progress marker keeps instances from extracting the same PDF twice."""
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+import routes.services as services
+
+URI = 'gs://bucket/documents/appt-1/labs.pdf'
+FILE_INFO = {'generation': '7', 'md5Hash': 'abc'}
+
+
+class FakeRecordRef:
+    def __init__(self, doc_id):
+        self.id = doc_id
+        self.data = None
+
+    def get(self, transaction=None):
+        data = self.data
+        return SimpleNamespace(exists=data is not None, to_dict=lambda: dict(data))
+
+    def set(self, data):
+        self.data = dict(data)
+
+    def update(self, fields):
+        self.data.update(fields)
+
+
+class FakeTransaction:
+    def set(self, ref, data):
+        ref.set(data)
+
+    def update(self, ref, fields):
+        ref.update(fields)
+
+
+class FakeAppointment:
+    id = 'appt-1'
+
+    def __init__(self):
+        self.record = FakeRecordRef(services._document_text_id(URI))
+
+    def collection(self, name):
+        assert name == services.DOCUMENT_TEXTS_COLLECTION
+        return SimpleNamespace(document=lambda doc_id: self.record)
+
+
+@pytest.fixture
+def appointment(monkeypatch):
+    monkeypatch.setattr(services, 'db', SimpleNamespace(transaction=FakeTransaction))
+    monkeypatch.setattr(services.firestore, 'transactional', lambda fn: fn)
+    return FakeAppointment()
+
+
+@pytest.fixture
+def storage():
+    texts = {}
+
+    def upload_file(data, name, content_type=None):
+        texts[f'gs://bucket/{name}'] = data
+        return f'gs://bucket/{name}'
+
+    return mock.Mock(
+        get_file_info=mock.Mock(return_value=dict(FILE_INFO)),
+        upload_file=mock.Mock(side_effect=upload_file),
+        download_file=mock.Mock(side_effect=lambda uri: texts[uri]),
+        texts=texts,
+    )
+
+
+@pytest.fixture
+def extract(monkeypatch):
+    extract = mock.Mock(return_value=SimpleNamespace(text='Hemoglobin 13.2', boilerplate_characters_removed=40))
+    monkeypatch.setattr(services, 'extract_pdf_gcs', extract)
+    return extract
+
+
+def marker(started_at, **fields):
+    return dict(FILE_INFO, gcsUri=URI, status='extracting', extractionId='other', extractionStartedAt=started_at, **fields)
+
+
+def test_first_caller_extracts_and_stores(appointment, storage, extract):
+    text, source, boilerplate = services.get_document_text(appointment, URI, storage)
+
+    assert (text, source, boilerplate) == ('Hemoglobin 13.2', 'extracted', 40)
+    assert appointment.record.data['status'] == 'ready'
+    assert services.get_document_text(appointment, URI, storage)[:2] == ('Hemoglobin 13.2', 'precomputed')
+    assert extract.call_count == 1
+
+
+def test_waits_for_an_extraction_running_on_another_instance(appointment, storage, extract):
+    appointment.record.data = marker(time.time())
+    storage.texts['gs://bucket/other.txt'] = b'From the other instance'
+
+    def other_instance_finishes(_seconds):
+        appointment.record.data = dict(FILE_INFO, status='ready', textUri='gs://bucket/other.txt',
+                                       boilerplateCharactersRemoved=5)
+
+    with mock.patch.object(services.time, 'sleep', side_effect=other_instance_finishes) as sleep:
+        result = services.get_document_text(appointment, URI, storage)
+
+    assert result == ('From the other instance', 'precomputed', 5)
+    assert sleep.call_count == 1
+    extract.assert_not_called()
+
+
+def test_background_extraction_skips_a_document_in_progress(appointment, storage, extract):
+    appointment.record.data = marker(time.time())
+
+    assert services.extract_and_store_document_text(appointment, URI, storage, wait=False) is None
+    extract.assert_not_called()
+
+
+@pytest.mark.parametrize('record', [
+    marker(time.time() - services.DOCUMENT_EXTRACTION_LEASE_SECONDS - 1),   # abandoned
+    dict(marker(time.time()), status='failed'),                               # failed elsewhere
+    dict(FILE_INFO, generation='6', status='ready', textUri='gs://bucket/old.txt'),  # PDF replaced
+])
+def test_stale_failed_or_outdated_records_are_taken_over(appointment, storage, extract, record):
+    appointment.record.data = record
+
+    assert services.get_document_text(appointment, URI, storage)[1] == 'extracted'
+    assert appointment.record.data['generation'] == '7'
+    assert extract.call_count == 1
+
+
+def test_failed_extraction_releases_the_marker(appointment, storage, extract):
+    extract.side_effect = RuntimeError('corrupt PDF')
+
+    with pytest.raises(RuntimeError):
+        services.get_document_text(appointment, URI, storage)
+
+    assert appointment.record.data['status'] == 'failed'
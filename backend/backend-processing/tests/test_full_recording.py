@@ -0,0 +1,62 @@
+"""Chunk backups in transcribe_full_recording happen once, outside the STT retry."""
+from unittest import mock
+
+import pytest
+
+from utils import processing
+from utils.audio_pipeline import PcmSegment
+
+
+class FlakyStt:
+    """transcribe_pcm fails on the first attempt for every segment."""
+
+    def __init__(self):
+        self.calls = {}
+
+    def transcribe_pcm(self, pcm):
+        self.calls[pcm] = self.calls.get(pcm, 0) + 1
+        if self.calls[pcm] == 1:
+            raise RuntimeError('UNAVAILABLE')
+        return pcm.decode()
+
+    def transcribe_pcm_stream(self, pcm_stream):
+        return "\n".join(pcm.decode() for pcm in pcm_stream)
+
+
+@pytest.fixture
+def recording():
+    segments = [PcmSegment(index=i, start_ms=i * 30000, pcm=f'segment {i}'.encode()) for i in range(3)]
+    with mock.patch.object(processing, 'segment_audio', return_value=iter(segments)), \
+            mock.patch.object(processing, 'create_segmenter', return_value=None), \
+            mock.patch.object(processing, 'encode_pcm_to_webm', side_effect=lambda pcm: b'webm:' + pcm) as encode, \
+            mock.patch('utils.transcription.time.sleep'):
+        yield segments, encode
+
+
+@pytest.mark.parametrize('mode', ['chunked', 'long'])
+def test_each_segment_is_backed_up_once(recording, mode):
+    segments, encode = recording
+    stt = FlakyStt()
+    storage = mock.Mock()
+    storage.upload_audio_file.side_effect = lambda data, name, content_type: f'gs://bucket/{name}'
+
+    transcript = processing.transcribe_full_recording(
+        b'audio', 'webm', stt, storage_service=storage, appointment_id='appt', max_workers=2, mode=mode,
+    )
+
+    assert transcript == "segment 0\nsegment 1\nsegment 2"
+    assert encode.call_count == len(segments)
+    uploaded = sorted(call.args[1] for call in storage.upload_audio_file.call_args_list)
+    assert uploaded == [f'chunks/appt/chunk_{i:04d}.webm' for i in range(3)]
+    if mode == 'chunked':
+        assert all(count == 2 for count in stt.calls.values())
+
+
+def test_failed_backup_fails_the_transcription(recording):
+    storage = mock.Mock()
+    storage.upload_audio_file.side_effect = RuntimeError('bucket gone')
+
+    with pytest.raises(RuntimeError, match='bucket gone'):
+        processing.transcribe_full_recording(
+            b'audio', 'webm', FlakyStt(), storage_service=storage, appointment_id='appt', mode='chunked',
+        )
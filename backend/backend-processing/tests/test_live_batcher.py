@@ -0,0 +1,43 @@
+"""Live transcription: segment timeline offsets and the per-instance session limit."""
+import json
+import threading
+from unittest import mock
+
+import routes.live as live
+
+
+def test_reconnect_continues_the_recording_timeline(monkeypatch):
+    append = mock.Mock()
+    monkeypatch.setattr(live, 'append_transcript_segment', append)
+    monkeypatch.setattr(live, 'schedule_rolling_summary', mock.Mock())
+
+    batcher = live.FinalResultBatcher(mock.Mock(), offset_ms=60000, batch_size=2, interval_seconds=3600)
+    batcher.add('first', 4000)
+    batcher.add('second', 9000)
+    batcher.add('third', 12000)
+    batcher.flush()
+
+    spans = [(call.kwargs['start_ms'], call.kwargs['end_ms']) for call in append.call_args_list]
+    assert spans == [(60000, 69000), (69000, 72000)]
+
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, message):
+        self.sent.append(json.loads(message))
+
+
+def test_sessions_over_the_limit_are_refused(monkeypatch):
+    monkeypatch.setattr(live, '_live_sessions', threading.BoundedSemaphore(1))
+
+    first, second = FakeSocket(), FakeSocket()
+    assert live._open_live_session(first, 'appt-1')
+    assert not live._open_live_session(second, 'appt-2')
+    assert first.sent == []
+    assert second.sent[0]['type'] == 'error'
+
+    live._live_sessions.release()
+    assert live._open_live_session(second, 'appt-2')
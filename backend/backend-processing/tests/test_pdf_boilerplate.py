@@ -0,0 +1,24 @@
+"""Repeated header/footer stripping in utils/pdf_extract.py."""
+from utils.pdf_extract import strip_repeated_lines
+
+
+def _lab_report(pages: int) -> list[str]:
+    return [
+        f"ACME LABORATORIES\nCollected: 0{page}/14/2024\nWBC {page}.4\nResult body {page}\nNormal\nNormal\nNormal\nPage {page} of {pages}"
+        for page in range(1, pages + 1)
+    ]
+
+
+def test_page_numbers_are_stripped_as_boilerplate():
+    cleaned, removed = strip_repeated_lines(_lab_report(5))
+
+    assert removed > 0
+    assert all('ACME LABORATORIES' not in page and 'Page ' not in page for page in cleaned)
+
+
+def test_dates_and_values_that_differ_per_page_are_kept():
+    cleaned, _ = strip_repeated_lines(_lab_report(5))
+
+    for page, text in enumerate(cleaned, start=1):
+        assert f"Collected: 0{page}/14/2024" in text
+        assert f"WBC {page}.4" in text
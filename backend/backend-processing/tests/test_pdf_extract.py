@@ -0,0 +1,115 @@
+"""PDF extraction: inline and process-pool paths, pool resets and cancelled batches."""
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from utils import pdf_extract
+
+
+def make_pdf(pages: int) -> bytes:
+    """Build a minimal PDF whose page i contains the text "Page body i"."""
+    objects = ['<< /Type /Catalog /Pages 2 0 R >>', None, '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    kids = []
+    for i in range(1, pages + 1):
+        stream = f"BT /F1 12 Tf 72 720 Td (Page body {i}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>"
+
+    out = b'%PDF-1.4\n'
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode('latin-1')
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('latin-1')
+    out += ''.join(f"{offset:010d} 00000 n \n" for offset in offsets).encode('latin-1')
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode('latin-1')
+    return out
+
+
+class FakePool:
+    """Runs batches inline; the first submissions can be cancelled or break the pool."""
+
+    def __init__(self, cancel=0, broken=0):
+        self.cancel, self.broken = cancel, broken
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        self.submitted.append(args[1])
+        future = Future()
+        if self.cancel:
+            self.cancel -= 1
+            future.cancel()
+        elif self.broken:
+            self.broken -= 1
+            future.set_exception(BrokenProcessPool('worker died'))
+        else:
+            future.set_result(fn(*args))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+def test_small_document_is_extracted_inline_in_page_order():
+    extraction = pdf_extract.extract_pdf(make_pdf(3), processes=1)
+
+    assert extraction.text == 'Page body 1\n\nPage body 2\n\nPage body 3'
+    assert extraction.stats_summary()['pagesByStatus'] == {'ok': 3}
+
+
+def test_large_document_uses_the_process_pool():
+    pdf = make_pdf(12)
+
+    extraction = pdf_extract.extract_pdf(pdf, processes=2)
+
+    assert extraction.text.split('\n\n') == [f'Page body {i}' for i in range(1, 13)]
+    assert extraction.stats_summary()['pagesByStatus'] == {'ok': 12}
+
+
+def test_cancelled_batches_are_resubmitted(monkeypatch):
+    pool = FakePool(cancel=2)
+    monkeypatch.setattr(pdf_extract, '_get_pool', lambda processes: pool)
+
+    extraction = pdf_extract.extract_pdf(make_pdf(12), processes=2)
+
+    assert extraction.stats_summary()['pagesByStatus'] == {'ok': 12}
+    assert len(pool.submitted) == len(set(map(tuple, pool.submitted))) + 2
+
+
+def test_broken_pool_marks_its_batch_and_resets_only_that_pool(monkeypatch):
+    broken = FakePool(broken=1)
+    monkeypatch.setattr(pdf_extract, '_get_pool', lambda processes: broken)
+    resets = []
+    monkeypatch.setattr(pdf_extract, '_reset_pool', resets.append)
+
+    extraction = pdf_extract.extract_pdf(make_pdf(12), processes=2)
+
+    assert resets == [broken]
+    statuses = extraction.stats_summary()['pagesByStatus']
+    assert statuses['memory'] == len(broken.submitted[0])
+    assert statuses['ok'] == 12 - len(broken.submitted[0])
+
+
+def test_reset_pool_ignores_a_pool_that_was_already_replaced(monkeypatch):
+    old, current = FakePool(), FakePool()
+    monkeypatch.setattr(pdf_extract, '_pool', current)
+
+    pdf_extract._reset_pool(old)
+    assert pdf_extract._pool is current
+
+    pdf_extract._reset_pool(current)
+    assert pdf_extract._pool is None
+
+
+@pytest.fixture(autouse=True)
+def no_shared_pool_leak():
+    yield
+    pool = pdf_extract._pool
+    if pool is not None and not isinstance(pool, FakePool):
+        pool.shutdown(wait=True)
+    pdf_extract._pool = None
@@ -0,0 +1,152 @@
+"""ResilientCaller retries, deadlines, circuit breaker and per-key hedging."""
+import time
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+from utils.resilience import (
+    AttemptTimeoutError, CallDeadlineError, CircuitBreaker, CircuitOpenError, ResilientCaller,
+)
+
+
+def make_caller(**overrides):
+    options = dict(
+        deadline_seconds=5, attempt_timeout_seconds=1, max_attempts=3,
+        backoff_base_seconds=0.01, backoff_max_seconds=0.01,
+        hedge_enabled=False, hedge_percentile=95, hedge_min_samples=3,
+        breaker_failure_threshold=3, breaker_reset_seconds=0.2, max_workers=4,
+    )
+    options.update(overrides)
+    return ResilientCaller('Test', **options)
+
+
+class Flaky:
+    """Fails with the given errors, then returns 'ok'."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+
+def test_retryable_errors_are_retried():
+    caller = make_caller()
+    fn = Flaky(google_exceptions.ServiceUnavailable('down'), google_exceptions.TooManyRequests('slow down'))
+
+    assert caller.call(fn) == 'ok'
+    assert fn.calls == 3
+    assert caller.stats()['retries'] == 2
+
+
+def test_non_retryable_errors_are_raised_immediately():
+    caller = make_caller()
+    fn = Flaky(google_exceptions.InvalidArgument('bad request'))
+
+    with pytest.raises(google_exceptions.InvalidArgument):
+        caller.call(fn)
+    assert fn.calls == 1
+    assert caller.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_last_error_is_raised_after_max_attempts():
+    caller = make_caller(breaker_failure_threshold=10)
+    fn = Flaky(*[google_exceptions.InternalServerError('boom')] * 5)
+
+    with pytest.raises(google_exceptions.InternalServerError):
+        caller.call(fn)
+    assert fn.calls == 3
+
+
+def test_slow_attempt_times_out_and_is_retried():
+    caller = make_caller(attempt_timeout_seconds=0.1)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) == 1:
+            time.sleep(0.5)
+        return 'ok'
+
+    assert caller.call(fn) == 'ok'
+    assert caller.stats()['timeouts'] == 1
+
+
+def test_deadline_stops_retries():
+    caller = make_caller(deadline_seconds=0.25, attempt_timeout_seconds=0.2, max_attempts=10,
+                         breaker_failure_threshold=100)
+
+    with pytest.raises((CallDeadlineError, AttemptTimeoutError)):
+        caller.call(lambda: time.sleep(1))
+
+
+def test_breaker_opens_fails_fast_and_closes_after_probe():
+    caller = make_caller(max_attempts=1, breaker_failure_threshold=2)
+    failing = Flaky(*[google_exceptions.ServiceUnavailable('down')] * 2)
+
+    for _ in range(2):
+        with pytest.raises(google_exceptions.ServiceUnavailable):
+            caller.call(failing)
+    assert caller.breaker.state == CircuitBreaker.OPEN
+
+    untouched = Flaky()
+    with pytest.raises(CircuitOpenError):
+        caller.call(untouched)
+    assert untouched.calls == 0
+
+    time.sleep(0.25)
+    assert caller.call(untouched) == 'ok'   # the half-open probe succeeds
+    assert caller.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_failed_probe_reopens_breaker():
+    caller = make_caller(max_attempts=1, breaker_failure_threshold=1)
+    with pytest.raises(google_exceptions.ServiceUnavailable):
+        caller.call(Flaky(google_exceptions.ServiceUnavailable('down')))
+
+    time.sleep(0.25)
+    with pytest.raises(google_exceptions.ServiceUnavailable):
+        caller.call(Flaky(google_exceptions.ServiceUnavailable('still down')))
+    assert caller.breaker.state == CircuitBreaker.OPEN
+    assert caller.breaker.opened == 2
+
+
+def test_hedging_threshold_is_tracked_per_key():
+    caller = make_caller(hedge_enabled=True, hedge_min_samples=3)
+    for _ in range(3):
+        caller.call(lambda: 'fast', key='questions')
+
+    # Fast question calls set a tiny threshold for 'questions' only
+    assert caller._hedge_delay('questions') is not None
+    assert caller._hedge_delay('summary') is None
+
+    def slow_summary():
+        time.sleep(0.1)
+        return 'summary'
+
+    assert caller.call(slow_summary, key='summary') == 'summary'
+    assert caller.stats()['hedges'] == 0
+    assert set(caller.stats()['latency']) == {'questions', 'summary'}
+
+
+def test_slow_attempt_is_hedged_against_its_own_key():
+    caller = make_caller(hedge_enabled=True, hedge_min_samples=3)
+    for _ in range(3):
+        caller.call(lambda: time.sleep(0.02), key='questions')
+
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) == 1:
+            time.sleep(0.5)   # the primary hangs; the hedge answers
+            return 'primary'
+        return 'hedge'
+
+    assert caller.call(fn, key='questions') == 'hedge'
+    stats = caller.stats()
+    assert stats['hedges'] == 1 and stats['hedgeWins'] == 1
@@ -0,0 +1,62 @@
+"""TokenBudgetPlanner output budgets, model tier, strategy and token counting."""
+from unittest import mock
+
+from utils.token_budget import FULL_SUMMARY_OUTPUT_TOKENS, TokenBudgetPlanner
+
+
+def make_planner(**overrides):
+    options = dict(mode='estimate', margin=0.25, fast_model='', fast_model_max_input_tokens=8000,
+                   map_reduce_threshold_tokens=120000)
+    options.update(overrides)
+    return TokenBudgetPlanner('gemini-pro', **options)
+
+
+def test_full_summaries_keep_the_output_ceiling():
+    planner = make_planner()
+    for task in ('summary', 'summary_merge', 'summary_update'):
+        for prompt in ('short visit', 'x' * 200000):
+            assert planner.plan(task, prompt).max_output_tokens == FULL_SUMMARY_OUTPUT_TOKENS
+
+
+def test_small_tasks_get_bounded_budgets():
+    planner = make_planner()
+
+    assert planner.plan('questions', 'transcript ' * 100).max_output_tokens == 2048
+    assert 8192 <= planner.plan('summary_map', 'y' * 40000).max_output_tokens <= 16384
+
+
+def test_oversized_summary_prompts_go_to_map_reduce():
+    planner = make_planner(map_reduce_threshold_tokens=1000)
+
+    assert planner.plan('summary', 'z' * 3000).strategy == 'single'
+    assert planner.plan('summary', 'z' * 8000).strategy == 'map_reduce'
+    # Only the single-pass summary task is routed
+    assert planner.plan('summary_merge', 'z' * 8000).strategy == 'single'
+
+
+def test_fast_model_takes_small_prompts():
+    planner = make_planner(fast_model='gemini-flash', fast_model_max_input_tokens=100)
+
+    assert planner.plan('questions', 'a' * 200).model_name == 'gemini-flash'
+    assert planner.plan('questions', 'a' * 2000).model_name == 'gemini-pro'
+
+
+def test_auto_mode_counts_only_near_a_threshold():
+    count = mock.Mock(return_value=1100)
+    planner = make_planner(mode='auto', count_fn=count, map_reduce_threshold_tokens=1000)
+
+    far = planner.plan('summary', 'b' * 400)       # ~100 tokens: estimate is enough
+    near = planner.plan('summary', 'b' * 4000)     # ~1000 tokens: the exact count decides
+
+    assert not far.counted
+    assert near.counted and near.input_tokens == 1100 and near.strategy == 'map_reduce'
+    assert count.call_count == 1
+
+
+def test_failed_count_falls_back_to_the_estimate():
+    planner = make_planner(mode='api', count_fn=mock.Mock(side_effect=RuntimeError('quota')))
+
+    budget = planner.plan('questions', 'c' * 400)
+
+    assert not budget.counted and budget.input_tokens == 100
+    assert planner.stats()['countFailures'] == 1
@@ -0,0 +1,124 @@
+"""Transcript segment store: one ordering scheme, out-of-order chunks, materialization."""
+import pytest
+
+import routes.services as services
+
+
+class FakeDoc:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class FakeDocRef:
+    def __init__(self, store, doc_id):
+        self.store = store
+        self.id = doc_id
+
+    def set(self, data):
+        self.store[self.id] = dict(data)
+
+
+class FakeQuery:
+    def __init__(self, store, field=None, descending=False, limit=None):
+        self.store, self.field, self.descending, self._limit = store, field, descending, limit
+
+    def order_by(self, field, direction=None):
+        return FakeQuery(self.store, field, direction == 'DESCENDING', self._limit)
+
+    def limit(self, count):
+        return FakeQuery(self.store, self.field, self.descending, count)
+
+    def stream(self):
+        items = list(self.store.items())
+        if self.field:
+            items.sort(key=lambda item: item[1][self.field], reverse=self.descending)
+        return [FakeDoc(doc_id, data) for doc_id, data in items[:self._limit]]
+
+
+class FakeCollection(FakeQuery):
+    def document(self, doc_id):
+        return FakeDocRef(self.store, doc_id)
+
+
+class FakeAppointment:
+    id = 'appt-1'
+
+    def __init__(self):
+        self.data = {}
+        self.segments = {}
+
+    def collection(self, name):
+        assert name == services.TRANSCRIPT_SEGMENTS_COLLECTION
+        return FakeCollection(self.segments)
+
+    def update(self, fields):
+        self.data.update(fields)
+
+
+class FakeBatch:
+    def __init__(self):
+        self.ops = []
+
+    def set(self, ref, data):
+        self.ops.append(lambda: ref.set(data))
+
+    def update(self, ref, fields):
+        self.ops.append(lambda: ref.update(fields))
+
+    def commit(self):
+        for op in self.ops:
+            op()
+
+
+@pytest.fixture
+def appointment(monkeypatch):
+    monkeypatch.setattr(services, 'db', type('FakeDb', (), {'batch': staticmethod(FakeBatch)})())
+    return FakeAppointment()
+
+
+def test_repeated_sequence_does_not_overwrite(appointment):
+    first = services.append_transcript_segment(appointment, 'one', sequence=1)
+    second = services.append_transcript_segment(appointment, 'one again', sequence=1)
+
+    assert first != second
+    assert len(appointment.segments) == 2
+
+
+def test_out_of_order_chunks_are_assembled_by_sequence(appointment):
+    services.append_transcript_segment(appointment, 'second', sequence=2)
+    services.append_transcript_segment(appointment, 'first', sequence=1)
+    services.append_transcript_segment(appointment, 'third', sequence=3)
+
+    transcript, segment_ids = services.assemble_transcript(appointment, appointment.data)
+
+    assert transcript == 'first\nsecond\nthird'
+    assert len(segment_ids) == 3
+
+
+def test_late_chunk_after_materialization_is_not_dropped(appointment):
+    services.append_transcript_segment(appointment, 'live words', source='live')
+    services.append_transcript_segment(appointment, 'chunk two', sequence=2)
+    assert services.materialize_transcript(appointment, dict(appointment.data)) == 'live words\nchunk two'
+
+    # Chunk 1 arrives late, after a higher sequence and a live segment were materialized
+    services.append_transcript_segment(appointment, 'chunk one', sequence=1)
+    transcript = services.materialize_transcript(appointment, dict(appointment.data))
+
+    assert transcript == 'live words\nchunk one\nchunk two'
+    assert appointment.data['rawTranscript'] == transcript
+    assert len(appointment.data['rawTranscriptSegmentIds']) == 3
+
+
+def test_recording_transcript_supersedes_only_earlier_segments(appointment):
+    early = services.append_transcript_segment(appointment, 'chunk text', sequence=1)
+    services.supersede_transcript_segments(appointment, 'full recording transcript', [early])
+    services.append_transcript_segment(appointment, 'added later', sequence=2)
+
+    transcript, _ = services.assemble_transcript(appointment, dict(appointment.data))
+
+    assert transcript == 'full recording transcript\nadded later'
@@ -0,0 +1,39 @@
+"""JSON repair counter on VertexAIService and its exposure through GET /health."""
+from unittest import mock
+
+import pytest
+from flask import Flask
+
+import routes.services as services
+from routes.appointments_crud import appointments_crud_bp
+from utils import vertex_ai
+
+
+@pytest.fixture
+def vertex_service(monkeypatch):
+    monkeypatch.setattr(vertex_ai.vertexai, 'init', mock.Mock())
+    monkeypatch.setattr(vertex_ai, 'GenerativeModel', mock.Mock())
+    return vertex_ai.VertexAIService('test-project', 'us-central1', model_name='gemini-test')
+
+
+def test_repaired_response_is_counted(vertex_service):
+    assert vertex_service.json_repairs == 0
+
+    parsed = vertex_service._parse_json_text('{"title": "Follow-up", "tags": ["a", "b",],', 'test', structured=True)
+
+    assert parsed == {'title': 'Follow-up', 'tags': ['a', 'b']}
+    assert vertex_service.json_repairs == 1
+
+
+def test_health_reports_json_repairs(vertex_service, monkeypatch):
+    vertex_service._parse_json_text('```json\n{"title": "Visit",}\n```', 'test', structured=False)
+    monkeypatch.setattr(services, '_vertex_ai_service', vertex_service)
+
+    app = Flask(__name__)
+    app.register_blueprint(appointments_crud_bp)
+    response = app.test_client().get('/health')
+
+    assert response.status_code == 200
+    metrics = response.get_json()['metrics']
+    assert metrics['vertexJsonRepairs'] == 1
+    assert 'vertexCalls' in metrics and 'tokenBudget' in metrics
@@ -0,0 +1,362 @@
+"""
+Single-pass audio decoding and segmentation.
+
+Decodes a source recording once with ffmpeg into 16 kHz mono 16-bit PCM and
+yields fixed-length PCM segments that can be sent straight to Speech-to-Text.
+Compressed (webm) copies of a segment are only encoded when a backup is
+actually requested.
+"""
+import io
+import queue
+import subprocess
+import tempfile
+import threading
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Union
+
+# PCM format produced by the decoder: mono, signed 16-bit little-endian, 16 kHz
+PCM_SAMPLE_RATE = 16000
+PCM_SAMPLE_WIDTH = 2
+PCM_BYTES_PER_SECOND = PCM_SAMPLE_RATE * PCM_SAMPLE_WIDTH
+
+# Containers whose index may sit at the end of the file (e.g. the mp4 "moov"
+# atom). ffmpeg cannot seek stdin, so these are spooled to a temp file first.
+SEEKABLE_INPUT_FORMATS = {'m4a', 'mp4', 'mov', '3gp', 'caf'}
+
+# How much source data is copied to ffmpeg / temp files per write
+INPUT_BLOCK_SIZE = 256 * 1024
+
+
+@dataclass
+class PcmSegment:
+    """A contiguous slice of decoded PCM audio."""
+    index: int
+    start_ms: int
+    pcm: bytes
+
+    @property
+    def duration_ms(self) -> int:
+        return len(self.pcm) * 1000 // PCM_BYTES_PER_SECOND
+
+    @property
+    def end_ms(self) -> int:
+        return self.start_ms + self.duration_ms
+
+
+class PushStream(io.RawIOBase):
+    """
+    A readable binary stream fed by another thread.
+
+    Producers call ``feed()`` with each block of data as it arrives (e.g. from
+    a WebSocket) and ``close_input()`` when no more data will come; consumers
+    such as ``decode_to_pcm`` read from it like a file and block until data
+    is available. A consumer that stops early calls ``abort()``.
+    """
+
+    def __init__(self, max_buffered_blocks: int = 256):
+        super().__init__()
+        self._queue = queue.Queue(maxsize=max_buffered_blocks)
+        self._pending = b''
+        self._eof = False
+        self._aborted = False
+
+    def feed(self, data: bytes):
+        if data and not self._aborted:
+            self._queue.put(bytes(data))
+
+    def abort(self):
+        """Discard buffered and future data (the consumer has gone away) so producers never block."""
+        self._aborted = True
+        self._discard_buffered()
+        self._queue.put(None)
+
+    def close_input(self):
+        try:
+            self._queue.put(None, timeout=5)
+        except queue.Full:
+            # The consumer has stopped reading; drop buffered data so EOF gets through
+            self._discard_buffered()
+            self._queue.put_nowait(None)
+
+    def _discard_buffered(self):
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._pending and not self._eof:
+            block = self._queue.get()
+            if block is None:
+                self._eof = True
+            else:
+                self._pending = block
+        if size is None or size < 0:
+            size = len(self._pending)
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class TeeReader(io.RawIOBase):
+    """
+    A forward-only reader that copies everything it reads to a sink.
+
+    Used to upload a request body to GCS and feed the same bytes to the
+    decoder in one pass: the uploader reads from the TeeReader while the
+    decoder consumes a ``PushStream`` passed as the sink. ``tell()`` reports
+    the number of bytes read so far, which is all a resumable upload needs.
+    """
+
+    def __init__(self, source, sink=None, block_size: int = INPUT_BLOCK_SIZE):
+        """
+        Args:
+            source:     Readable binary file object.
+            sink:       Optional callable receiving each block read (e.g. ``PushStream.feed``).
+            block_size: Largest block handed to the sink at once.
+        """
+        super().__init__()
+        self.source = source
+        self.sink = sink
+        self.block_size = block_size
+        self.bytes_read = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.bytes_read
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.source.read(size) if size is not None else self.source.read()
+        if data:
+            self.bytes_read += len(data)
+            if self.sink is not None:
+                view = memoryview(data)
+                for offset in range(0, len(view), self.block_size):
+                    self.sink(bytes(view[offset:offset + self.block_size]))
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def pcm_duration_seconds(pcm_length: int) -> float:
+    """Return the duration in seconds of ``pcm_length`` bytes of decoder output."""
+    return pcm_length / PCM_BYTES_PER_SECOND
+
+
+def _iter_source_blocks(source: Union[bytes, io.IOBase], block_size: int = INPUT_BLOCK_SIZE) -> Iterator[bytes]:
+    """Yield the source audio in bounded blocks, whether it is bytes or a binary file object."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        for offset in range(0, len(view), block_size):
+            yield bytes(view[offset:offset + block_size])
+        return
+
+    while True:
+        block = source.read(block_size)
+        if not block:
+            break
+        yield block
+
+
+def decode_to_pcm(
+    source: Union[bytes, io.IOBase],
+    input_format: str = None,
+    block_size: int = 4800,
+    low_latency: bool = False,
+) -> Iterator[bytes]:
+    """
+    Decode audio to PCM with a single ffmpeg process, yielding PCM blocks as
+    they are produced. The decoded audio is never held in memory as a whole.
+
+    Args:
+        source:       Audio content as bytes, or a readable binary file object.
+        input_format: Optional format hint (file extension such as 'webm', 'm4a').
+        block_size:   Size of PCM blocks to yield (default 4800 bytes = ~150ms at 16kHz).
+        low_latency:  Minimize ffmpeg input probing/buffering (for live streams).
+
+    Yields:
+        PCM audio blocks (mono, 16-bit, 16 kHz)
+
+    Raises:
+        Exception: If ffmpeg exits with an error.
+    """
+    fmt = (input_format or '').lower()
+    spool = None
+
+    try:
+        if fmt in SEEKABLE_INPUT_FORMATS:
+            # Spool to disk in blocks so ffmpeg can seek to the container index
+            spool = tempfile.NamedTemporaryFile(suffix=f'.{fmt}')
+            for block in _iter_source_blocks(source):
+                spool.write(block)
+            spool.flush()
+            input_arg = spool.name
+        else:
+            input_arg = 'pipe:0'
+
+        # -f s16le / -acodec pcm_s16le = signed 16-bit little-endian PCM
+        # -ar 16000 = 16 kHz sample rate, -ac 1 = mono, pipe:1 = write to stdout
+        latency_args = ['-fflags', 'nobuffer', '-probesize', '4096', '-analyzeduration', '0'] if low_latency else []
+        process = subprocess.Popen(
+            [
+                'ffmpeg', '-hide_banner',
+                *latency_args,
+                '-i', input_arg,
+                '-f', 's16le',
+                '-acodec', 'pcm_s16le',
+                '-ar', str(PCM_SAMPLE_RATE),
+                '-ac', '1',
+                'pipe:1',
+            ],
+            stdin=subprocess.DEVNULL if spool else subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+
+        def write_input():
+            try:
+                for block in _iter_source_blocks(source):
+                    process.stdin.write(block)
+            except Exception as e:
+                print(f"[PCM Decode] Error writing to ffmpeg: {e}")
+            finally:
+                try:
+                    process.stdin.close()
+                except Exception:
+                    pass
+
+        # Drain stderr in the background so a chatty ffmpeg can't block on a full pipe
+        stderr_chunks = []
+        stderr_thread = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+        stderr_thread.start()
+
+        writer_thread = None
+        if not spool:
+            writer_thread = threading.Thread(target=write_input, daemon=True)
+            writer_thread.start()
+
+        total_bytes = 0
+        try:
+            while True:
+                block = process.stdout.read(block_size)
+                if not block:
+                    break
+                total_bytes += len(block)
+                yield block
+        finally:
+            if process.poll() is None:
+                # Consumer stopped early; don't leave ffmpeg running
+                process.kill()
+            if writer_thread:
+                writer_thread.join()
+            process.wait()
+            stderr_thread.join()
+
+        if process.returncode != 0:
+            stderr_output = b''.join(c for c in stderr_chunks if c).decode('utf-8', errors='ignore')
+            raise Exception(f"ffmpeg failed with return code {process.returncode}: {stderr_output[-2000:]}")
+
+        print(f"[PCM Decode] Decoded {total_bytes} bytes of PCM audio (~{pcm_duration_seconds(total_bytes):.2f} seconds)")
+
+    except Exception as e:
+        raise Exception(f"Failed to decode audio to PCM: {str(e)}")
+    finally:
+        if spool:
+            spool.close()
+
+
+def iter_pcm_segments(pcm_blocks: Iterable[bytes], segment_seconds: float = 30.0) -> Iterator[PcmSegment]:
+    """
+    Regroup a stream of PCM blocks into fixed-duration segments.
+
+    Args:
+        pcm_blocks:      Iterable of PCM blocks, e.g. from ``decode_to_pcm``.
+        segment_seconds: Target segment duration (the last segment may be shorter).
+
+    Yields:
+        PcmSegment objects in order.
+    """
+    segment_bytes = int(segment_seconds * PCM_SAMPLE_RATE) * PCM_SAMPLE_WIDTH
+    buffer = bytearray()
+    index = 0
+    offset_bytes = 0
+
+    for block in pcm_blocks:
+        buffer.extend(block)
+        while len(buffer) >= segment_bytes:
+            pcm = bytes(buffer[:segment_bytes])
+            del buffer[:segment_bytes]
+            yield PcmSegment(index=index, start_ms=offset_bytes * 1000 // PCM_BYTES_PER_SECOND, pcm=pcm)
+            index += 1
+            offset_bytes += segment_bytes
+
+    if buffer:
+        yield PcmSegment(index=index, start_ms=offset_bytes * 1000 // PCM_BYTES_PER_SECOND, pcm=bytes(buffer))
+
+
+def segment_audio(
+    source: Union[bytes, io.IOBase],
+    input_format: str = None,
+    segment_seconds: float = 30.0,
+    segmenter=None,
+) -> Iterator[PcmSegment]:
+    """
+    Decode a source recording once and yield PCM segments.
+
+    Args:
+        source:          Audio content as bytes, or a readable binary file object.
+        input_format:    Optional format hint (file extension).
+        segment_seconds: Segment duration in seconds for fixed slicing (default 30 s).
+        segmenter:       Optional object with a ``segments(pcm_blocks)`` method
+                         (e.g. ``utils.vad.VoiceActivitySegmenter``) used instead
+                         of fixed-duration slicing.
+
+    Yields:
+        PcmSegment objects in order.
+    """
+    pcm_blocks = decode_to_pcm(source, input_format=input_format)
+    if segmenter is not None:
+        return segmenter.segments(pcm_blocks)
+    return iter_pcm_segments(pcm_blocks, segment_seconds=segment_seconds)
+
+
+def encode_pcm_to_webm(pcm: bytes) -> bytes:
+    """
+    Encode a PCM segment to a compressed webm/opus file (used for chunk backups).
+
+    Args:
+        pcm: PCM audio (mono, 16-bit, 16 kHz)
+
+    Returns:
+        webm file content as bytes
+    """
+    result = subprocess.run(
+        [
+            'ffmpeg', '-hide_banner',
+            '-f', 's16le', '-ar', str(PCM_SAMPLE_RATE), '-ac', '1',
+            '-i', 'pipe:0',
+            '-c:a', 'libopus',
+            '-f', 'webm',
+            'pipe:1',
+        ],
+        input=pcm,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    if result.returncode != 0:
+        stderr_output = result.stderr.decode('utf-8', errors='ignore')
+        raise Exception(f"ffmpeg webm encode failed with return code {result.returncode}: {stderr_output[-2000:]}")
+    return result.stdout
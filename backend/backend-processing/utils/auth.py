@@ -2,28 +2,41 @@ from functools import wraps
 from flask import request, jsonify
 from firebase_admin import auth
 
+
+def get_user_id_from_token(token: str) -> str:
+    """
+    Verify a Firebase ID token and return the user's uid.
+
+    Accepts either the raw token or a "Bearer <token>" header value.
+    Raises if the token is missing, invalid or expired.
+    """
+    if not token:
+        raise ValueError('No token provided')
+
+    # Extract token from "Bearer <token>"
+    token = token.split('Bearer ')[-1]
+
+    # Verify the token
+    decoded_token = auth.verify_id_token(token)
+    return decoded_token['uid']
+
+
 def verify_firebase_token(f):
     """Decorator to verify Firebase ID token from Authorization header"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
         auth_header = request.headers.get('Authorization')
-        
+
         if not auth_header:
             return jsonify({'error': 'No authorization header'}), 401
-        
+
         try:
-            # Extract token from "Bearer <token>"
-            token = auth_header.split('Bearer ')[-1]
-            
-            # Verify the token
-            decoded_token = auth.verify_id_token(token)
-            
             # Add user_id to kwargs for route handlers to use
-            kwargs['user_id'] = decoded_token['uid']
-            
-            return f(*args, **kwargs)
-        
+            kwargs['user_id'] = get_user_id_from_token(auth_header)
+
         except Exception as e:
             return jsonify({'error': 'Invalid or expired token', 'details': str(e)}), 401
-    
+
+        return f(*args, **kwargs)
+
     return decorated_function
@@ -0,0 +1,317 @@
+"""
+Small content-addressed cache with pluggable storage backends.
+
+Backends store opaque string values under hex keys:
+- MemoryLRUBackend — in-process, least-recently-used eviction by total size
+- DiskBackend      — files in a local directory, oldest-first eviction by total size
+- GCSBackend       — objects under a bucket prefix, oldest-first eviction by total size
+- RedisBackend     — keys in a Redis (or Redis-compatible) server, which does its own
+                     size-based eviction (``maxmemory-policy``); needs the optional
+                     ``redis`` package
+
+``Cache`` wraps a backend with hit/miss counters, an optional time-to-live,
+and never lets a backend failure break the caller: errors are logged and
+treated as misses.
+"""
+import hashlib
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+
+def make_cache_key(*parts) -> str:
+    """Return a stable SHA-256 hex key for the given parts (str or bytes)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part if isinstance(part, (bytes, bytearray)) else str(part).encode('utf-8')
+        # Length-prefix each part so ("ab", "c") and ("a", "bc") differ
+        digest.update(len(data).to_bytes(8, 'big'))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class CacheBackend(ABC):
+    """Interface for cache storage backends."""
+
+    @abstractmethod
+    def get(self, key: str):
+        """Return the stored value, or None if absent."""
+
+    @abstractmethod
+    def set(self, key: str, value: str):
+        """Store a value, evicting older entries if the backend is bounded."""
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Remove a value if present."""
+
+
+class MemoryLRUBackend(CacheBackend):
+    """In-process LRU cache bounded by the total size of stored values."""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str):
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._size -= len(self._entries.pop(key).encode('utf-8'))
+            self._entries[key] = value
+            self._size += size
+            while self._size > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.encode('utf-8'))
+
+    def delete(self, key: str):
+        with self._lock:
+            value = self._entries.pop(key, None)
+            if value is not None:
+                self._size -= len(value.encode('utf-8'))
+
+
+class DiskBackend(CacheBackend):
+    """Cache entries stored as files in a local directory, bounded by total size."""
+
+    def __init__(self, directory: str, max_bytes: int = 512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = f.read()
+        except FileNotFoundError:
+            return None
+        # Touch so eviction treats this entry as recently used
+        os.utime(path, None)
+        return value
+
+    def set(self, key: str, value: str):
+        tmp_path = f"{self._path(key)}.tmp.{threading.get_ident()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(value)
+        os.replace(tmp_path, self._path(key))
+        self._evict()
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and '.tmp.' not in entry.name:
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+
+
+class GCSBackend(CacheBackend):
+    """Cache entries stored as objects under a prefix in a GCS bucket, bounded by total size."""
+
+    def __init__(self, bucket, prefix: str, max_bytes: int = 1024 * 1024 * 1024):
+        """
+        Args:
+            bucket:    google.cloud.storage Bucket (e.g. ``StorageService.bucket``)
+            prefix:    Object name prefix, e.g. ``cache/transcripts/``
+            max_bytes: Total size budget for objects under the prefix
+        """
+        self.bucket = bucket
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+
+    def get(self, key: str):
+        blob = self.bucket.blob(f"{self.prefix}{key}")
+        if not blob.exists():
+            return None
+        return blob.download_as_text(encoding='utf-8')
+
+    def set(self, key: str, value: str):
+        blob = self.bucket.blob(f"{self.prefix}{key}")
+        blob.upload_from_string(value, content_type='text/plain; charset=utf-8')
+        self._evict()
+
+    def delete(self, key: str):
+        blob = self.bucket.blob(f"{self.prefix}{key}")
+        if blob.exists():
+            blob.delete()
+
+    def _evict(self):
+        blobs = list(self.bucket.list_blobs(prefix=self.prefix))
+        total = sum(blob.size or 0 for blob in blobs)
+        for blob in sorted(blobs, key=lambda b: b.updated):
+            if total <= self.max_bytes:
+                break
+            blob.delete()
+            total -= blob.size or 0
+
+
+class RedisBackend(CacheBackend):
+    """Cache entries stored as Redis string keys under a prefix."""
+
+    def __init__(self, url: str, prefix: str, ttl_seconds: int = None):
+        """
+        Args:
+            url:         Redis URL, e.g. ``redis://localhost:6379/0``
+            prefix:      Key prefix, e.g. ``cache:soap:``
+            ttl_seconds: Server-side expiry for every key (None: no expiry)
+        """
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("The redis cache backend requires the 'redis' package (pip install redis)")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, key: str):
+        value = self.client.get(f"{self.prefix}{key}")
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key: str, value: str):
+        self.client.set(f"{self.prefix}{key}", value.encode('utf-8'), ex=self.ttl_seconds or None)
+
+    def delete(self, key: str):
+        self.client.delete(f"{self.prefix}{key}")
+
+
+_EXPIRY_MARKER = 'expires:'
+
+
+class Cache:
+    """A named cache over a backend, with hit/miss counters and an optional TTL."""
+
+    def __init__(self, name: str, backend: CacheBackend, ttl_seconds: float = None):
+        """
+        Args:
+            name:        Cache name used in logs.
+            backend:     Storage backend.
+            ttl_seconds: Entries older than this are treated as misses and
+                         deleted on read (None: entries never expire).
+        """
+        self.name = name
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.expired = 0
+        self._lock = threading.Lock()
+
+    def _count(self, attr: str):
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def get(self, key: str):
+        """Return the cached value for key, or None on a miss (or backend error)."""
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            self._count('errors')
+            print(f"[Cache:{self.name}] Read error for {key[:12]}: {str(e)}")
+            value = None
+
+        if value is not None and value.startswith(_EXPIRY_MARKER):
+            # Entries written with a TTL carry their expiry time on the first line
+            header, _, value = value.partition('\n')
+            try:
+                expires_at = float(header[len(_EXPIRY_MARKER):])
+            except ValueError:
+                expires_at = 0.0
+            if expires_at <= time.time():
+                self._count('expired')
+                self._delete(key)
+                value = None
+
+        self._count('hits' if value is not None else 'misses')
+        print(f"[Cache:{self.name}] {'Hit' if value is not None else 'Miss'} for {key[:12]} ({self.stats()})")
+        return value
+
+    def set(self, key: str, value: str):
+        """Store a value; backend failures are logged and ignored."""
+        if self.ttl_seconds:
+            value = f"{_EXPIRY_MARKER}{time.time() + self.ttl_seconds:.3f}\n{value}"
+        try:
+            self.backend.set(key, value)
+        except Exception as e:
+            self._count('errors')
+            print(f"[Cache:{self.name}] Write error for {key[:12]}: {str(e)}")
+
+    def _delete(self, key: str):
+        try:
+            self.backend.delete(key)
+        except Exception as e:
+            self._count('errors')
+            print(f"[Cache:{self.name}] Delete error for {key[:12]}: {str(e)}")
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'errors': self.errors,
+            'expired': self.expired,
+            'hitRate': round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+def create_cache(name: str, backend: str, max_bytes: int, directory: str = None, bucket=None, prefix: str = None,
+                 ttl_seconds: float = None, url: str = None):
+    """
+    Build a Cache from configuration values.
+
+    Args:
+        name:        Cache name used in logs.
+        backend:     'memory', 'disk', 'gcs', 'redis' or 'none'.
+        max_bytes:   Size budget for the backend (redis: enforced by the server).
+        directory:   Directory for the disk backend.
+        bucket:      GCS bucket for the gcs backend.
+        prefix:      Object/key prefix for the gcs and redis backends.
+        ttl_seconds: Entry lifetime (None: entries never expire).
+        url:         Server URL for the redis backend.
+
+    Returns:
+        A Cache, or None when caching is disabled.
+    """
+    backend = (backend or 'none').lower()
+    if backend == 'memory':
+        return Cache(name, MemoryLRUBackend(max_bytes=max_bytes), ttl_seconds=ttl_seconds)
+    if backend == 'disk':
+        return Cache(name, DiskBackend(directory, max_bytes=max_bytes), ttl_seconds=ttl_seconds)
+    if backend == 'gcs':
+        return Cache(name, GCSBackend(bucket, prefix, max_bytes=max_bytes), ttl_seconds=ttl_seconds)
+    if backend == 'redis':
+        return Cache(name, RedisBackend(url, prefix.replace('/', ':'), ttl_seconds=ttl_seconds), ttl_seconds=ttl_seconds)
+    return None
@@ -0,0 +1,126 @@
+"""
+Transcript coverage of a recording.
+
+Segments transcribed while recording (``/audio-chunks``, live transcription,
+the legacy upload) carry ``startMs``/``endMs`` positions in the recording.
+These helpers merge those ranges, find the stretches of the recording that
+have no transcript yet, and cut only those stretches out of the decoded PCM
+so ``/process`` never sends already-transcribed audio to Speech-to-Text again.
+"""
+from typing import Iterable, Iterator
+from utils.audio_pipeline import PcmSegment, PCM_BYTES_PER_SECOND, PCM_SAMPLE_WIDTH
+
+
+def merge_intervals(intervals: Iterable[tuple[int, int]], tolerance_ms: int = 0) -> list[tuple[int, int]]:
+    """
+    Merge overlapping (or nearly touching) ``(start_ms, end_ms)`` ranges.
+
+    Args:
+        intervals:    Ranges in any order; empty or inverted ranges are ignored.
+        tolerance_ms: Ranges separated by at most this much are joined.
+
+    Returns:
+        Sorted, non-overlapping ranges.
+    """
+    merged: list[list[int]] = []
+    for start, end in sorted((s, e) for s, e in intervals if e > s):
+        if merged and start <= merged[-1][1] + tolerance_ms:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def covered_intervals(segments: Iterable[dict], tolerance_ms: int = 250) -> list[tuple[int, int]]:
+    """
+    Return the merged recording ranges covered by transcript segments.
+
+    Segments without both ``startMs`` and ``endMs`` carry no position and
+    therefore cover nothing.
+    """
+    return merge_intervals(
+        ((seg['startMs'], seg['endMs']) for seg in segments
+         if seg.get('startMs') is not None and seg.get('endMs') is not None),
+        tolerance_ms=tolerance_ms,
+    )
+
+
+def iter_gap_segments(
+    pcm_blocks: Iterable[bytes],
+    covered: list[tuple[int, int]],
+    min_gap_ms: int = 1000,
+    max_segment_seconds: float = 30.0,
+) -> Iterator[PcmSegment]:
+    """
+    Yield the parts of a PCM stream that fall outside the covered ranges.
+
+    Each gap is emitted as one or more segments of at most
+    ``max_segment_seconds``; ``start_ms`` refers to the position in the source
+    recording. Gaps shorter than ``min_gap_ms`` (timing jitter between chunk
+    boundaries) are skipped. The trailing gap after the last covered range
+    runs to the end of the stream.
+
+    Args:
+        pcm_blocks:          Iterable of PCM blocks, e.g. from ``decode_to_pcm``.
+        covered:             Merged ranges from ``covered_intervals``.
+        min_gap_ms:          Shortest gap worth transcribing.
+        max_segment_seconds: Longest segment yielded for a single gap.
+
+    Yields:
+        PcmSegment objects in recording order.
+    """
+    bytes_per_ms = PCM_BYTES_PER_SECOND // 1000
+    max_segment_bytes = int(max_segment_seconds * PCM_BYTES_PER_SECOND) // PCM_SAMPLE_WIDTH * PCM_SAMPLE_WIDTH
+    boundaries = [(start * bytes_per_ms, end * bytes_per_ms) for start, end in covered]
+
+    buffer = bytearray()
+    buffer_start = 0      # byte offset in the recording of buffer[0]
+    position = 0          # byte offset in the recording of the next incoming byte
+    gap_emitted = False   # part of the current gap was already yielded
+    cover_idx = 0
+    index = 0
+
+    def emit(length: int) -> PcmSegment:
+        nonlocal buffer_start, index, gap_emitted
+        segment = PcmSegment(index=index, start_ms=buffer_start // bytes_per_ms, pcm=bytes(buffer[:length]))
+        del buffer[:length]
+        buffer_start += length
+        index += 1
+        gap_emitted = True
+        return segment
+
+    def end_gap():
+        """Emit the rest of the current gap, unless the whole gap is too short to matter."""
+        nonlocal gap_emitted
+        if buffer and (gap_emitted or len(buffer) >= min_gap_ms * bytes_per_ms):
+            yield emit(len(buffer))
+        buffer.clear()
+        gap_emitted = False
+
+    for block in pcm_blocks:
+        offset = 0
+        while offset < len(block):
+            # Skip covered ranges that are already behind us
+            while cover_idx < len(boundaries) and boundaries[cover_idx][1] <= position:
+                cover_idx += 1
+
+            if cover_idx < len(boundaries) and boundaries[cover_idx][0] <= position:
+                # Inside a covered range: the current gap (if any) ends here
+                yield from end_gap()
+                skip = min(len(block) - offset, boundaries[cover_idx][1] - position)
+                offset += skip
+                position += skip
+                continue
+
+            # Uncovered: copy up to the start of the next covered range
+            limit = boundaries[cover_idx][0] if cover_idx < len(boundaries) else position + len(block)
+            take = min(len(block) - offset, limit - position)
+            if not buffer:
+                buffer_start = position
+            buffer.extend(block[offset:offset + take])
+            offset += take
+            position += take
+            while len(buffer) >= max_segment_bytes:
+                yield emit(max_segment_bytes)
+
+    yield from end_gap()
@@ -0,0 +1,165 @@
+"""
+Small DAG executor for fanning out independent work.
+
+Each ``Task`` is a named callable with optional dependencies and a timeout.
+Tasks whose dependencies have succeeded run concurrently on a thread pool, so
+the wall-clock time of a graph of independent tasks is that of the slowest
+task rather than the sum of all of them. A task receives the results of its
+dependencies as keyword arguments.
+
+Python threads cannot be cancelled: a task that exceeds its timeout is
+reported as timed out and its dependents are skipped, but the thread is left
+to finish in the background.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+
+class TaskTimeoutError(Exception):
+    """Raised (as a task's error) when a task runs longer than its timeout."""
+
+
+@dataclass
+class Task:
+    """One node of the graph."""
+    name: str
+    fn: Callable[..., Any]
+    deps: tuple[str, ...] = ()
+    timeout_seconds: float = None
+
+
+@dataclass
+class TaskResult:
+    """Outcome of one task."""
+    name: str
+    value: Any = None
+    error: Exception = None
+    seconds: float = 0.0
+    skipped: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and not self.skipped
+
+
+@dataclass
+class DagRun:
+    """Results of all tasks of one run, keyed by task name."""
+    results: dict[str, TaskResult] = field(default_factory=dict)
+    wall_seconds: float = 0.0
+
+    def __getitem__(self, name: str) -> TaskResult:
+        return self.results[name]
+
+    def timings_summary(self) -> dict:
+        """Return per-task durations and the overall wall time (for logs and API responses)."""
+        return {
+            'wallSeconds': round(self.wall_seconds, 3),
+            'tasks': {
+                name: {
+                    'seconds': round(result.seconds, 3),
+                    'status': 'skipped' if result.skipped else ('ok' if result.ok else 'failed'),
+                }
+                for name, result in self.results.items()
+            },
+        }
+
+
+class DagExecutor:
+    """Run a set of tasks respecting their dependencies, as concurrently as possible."""
+
+    def __init__(self, tasks: list[Task], max_workers: int = None, label: str = "DAG"):
+        """
+        Args:
+            tasks:       Tasks to run; names must be unique and dependencies must exist.
+            max_workers: Thread pool size (default: one thread per task).
+            label:       Log prefix used in progress messages.
+        """
+        self.tasks = {task.name: task for task in tasks}
+        if len(self.tasks) != len(tasks):
+            raise ValueError("Task names must be unique")
+        for task in tasks:
+            missing = [dep for dep in task.deps if dep not in self.tasks]
+            if missing:
+                raise ValueError(f"Task {task.name} depends on unknown task(s): {', '.join(missing)}")
+        self.max_workers = max_workers or max(1, len(tasks))
+        self.label = label
+
+    def run(self) -> DagRun:
+        """
+        Execute the graph.
+
+        Returns:
+            DagRun with a TaskResult for every task. Failures never raise; a
+            task whose dependency failed, timed out or was skipped is skipped.
+        """
+        run = DagRun()
+        wall_start = time.monotonic()
+        pending = dict(self.tasks)
+        running = {}  # future -> (task, start time)
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            while pending or running:
+                # Start (or skip) every task whose dependencies are settled
+                for name, task in list(pending.items()):
+                    dep_results = [run.results.get(dep) for dep in task.deps]
+                    if any(result is None for result in dep_results):
+                        continue
+                    del pending[name]
+                    if not all(result.ok for result in dep_results):
+                        run.results[name] = TaskResult(name=name, skipped=True)
+                        print(f"[{self.label}] Skipping {name}: a dependency did not succeed")
+                        continue
+                    kwargs = {dep: run.results[dep].value for dep in task.deps}
+                    future = executor.submit(task.fn, **kwargs)
+                    running[future] = (task, time.monotonic())
+
+                if not running:
+                    if pending:
+                        # Remaining tasks wait on each other: a cycle
+                        for name in pending:
+                            run.results[name] = TaskResult(name=name, error=ValueError("Dependency cycle"), skipped=True)
+                        break
+                    continue
+
+                # Wait for the next completion or the nearest deadline
+                now = time.monotonic()
+                deadlines = [
+                    start + task.timeout_seconds - now
+                    for task, start in running.values() if task.timeout_seconds is not None
+                ]
+                timeout = max(0.0, min(deadlines)) if deadlines else None
+                done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+
+                now = time.monotonic()
+                for future in list(running):
+                    task, start = running[future]
+                    if future in done:
+                        del running[future]
+                        error = future.exception()
+                        run.results[task.name] = TaskResult(
+                            name=task.name,
+                            value=None if error else future.result(),
+                            error=error,
+                            seconds=now - start,
+                        )
+                        status = f"failed: {error}" if error else "done"
+                        print(f"[{self.label}] {task.name} {status} in {now - start:.2f}s")
+                    elif task.timeout_seconds is not None and now - start >= task.timeout_seconds:
+                        del running[future]
+                        run.results[task.name] = TaskResult(
+                            name=task.name,
+                            error=TaskTimeoutError(f"{task.name} timed out after {task.timeout_seconds:g}s"),
+                            seconds=now - start,
+                        )
+                        print(f"[{self.label}] {task.name} timed out after {task.timeout_seconds:g}s")
+        finally:
+            # Don't block on timed-out tasks that are still running
+            executor.shutdown(wait=False)
+
+        run.wall_seconds = time.monotonic() - wall_start
+        print(f"[{self.label}] Finished {len(run.results)} task(s) in {run.wall_seconds:.2f}s")
+        return run
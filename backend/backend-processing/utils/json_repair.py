@@ -0,0 +1,135 @@
+"""
+Tolerant repair of near-valid JSON returned by the model.
+
+A 20-60 s summary generation should not be thrown away because of one bad
+character. ``repair_json`` fixes the mistakes models actually make:
+
+- text before the first ``{``/``[`` (a markdown fence, a preamble) and after
+  the closing bracket is dropped,
+- trailing commas before ``}``/``]`` are removed,
+- raw newlines and tabs inside strings are escaped,
+- an unterminated string at the end is closed, and unclosed objects/arrays
+  are closed; if the last member is incomplete (``"key":`` with no value) the
+  text is cut back to the last complete member.
+
+It does not guess at anything else; ``loads_lenient`` tries strict parsing
+first and only repairs when that fails.
+"""
+import json
+
+_STRING_ESCAPES = {'\n': '\\n', '\r': '\\r', '\t': '\\t'}
+
+# Complete members to fall back to when the repaired tail does not parse
+_MAX_FALLBACK_ATTEMPTS = 20
+
+
+def _strip_trailing_comma(out: list[str]):
+    while out and out[-1].isspace():
+        out.pop()
+    if out and out[-1] == ',':
+        out.pop()
+
+
+def _candidates(text: str) -> list[str]:
+    """Return repaired versions of text, most complete first."""
+    start = min((i for i in (text.find('{'), text.find('[')) if i != -1), default=-1)
+    if start == -1:
+        return []
+
+    out: list[str] = []
+    stack: list[str] = []
+    safe_points: list[tuple[int, tuple]] = []   # (prefix length, open brackets) after a complete value
+    in_string = False
+    escape = False
+
+    for ch in text[start:]:
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_string = False
+            out.append(_STRING_ESCAPES.get(ch, ch))
+            continue
+
+        if ch == '"':
+            in_string = True
+            out.append(ch)
+        elif ch in '{[':
+            stack.append('}' if ch == '{' else ']')
+            out.append(ch)
+            safe_points.append((len(out), tuple(stack)))
+        elif ch in '}]':
+            if not stack:
+                break
+            _strip_trailing_comma(out)
+            safe_points = [point for point in safe_points if point[0] <= len(out)]
+            out.append(stack.pop())   # the expected closer, even if the model wrote the other one
+            if not stack:
+                break                 # ignore anything after the root value
+            safe_points.append((len(out), tuple(stack)))
+        elif ch == ',':
+            safe_points.append((len(out), tuple(stack)))
+            out.append(ch)
+        else:
+            out.append(ch)
+
+    if in_string:
+        if escape:
+            out.pop()
+        out.append('"')
+
+    def close(prefix: list[str], open_brackets) -> str:
+        prefix = list(prefix)
+        _strip_trailing_comma(prefix)
+        return ''.join(prefix) + ''.join(reversed(open_brackets))
+
+    candidates = [close(out, stack)]
+    for length, open_brackets in reversed(safe_points[-_MAX_FALLBACK_ATTEMPTS:]):
+        candidates.append(close(out[:length], open_brackets))
+    return candidates
+
+
+def repair_json(text: str) -> str:
+    """
+    Return a repaired version of text that parses as JSON.
+
+    Raises:
+        json.JSONDecodeError: If no repair produced valid JSON.
+    """
+    for candidate in _candidates(text or ''):
+        try:
+            json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+        return candidate
+    # Re-raise the strict parser's error for the original text
+    json.loads(text)
+    return text
+
+
+def loads_lenient(text: str, context: str = "JSON parsing"):
+    """
+    Parse JSON, repairing near-valid text when strict parsing fails.
+
+    Args:
+        text:    JSON text (possibly with a fence, trailing commas, or a truncated tail).
+        context: Label used in the repair log line.
+
+    Returns:
+        (parsed value, whether a repair was needed)
+
+    Raises:
+        json.JSONDecodeError: The strict parser's error, when repair fails too.
+    """
+    try:
+        return json.loads(text), False
+    except json.JSONDecodeError as original:
+        try:
+            repaired = repair_json(text)
+        except json.JSONDecodeError:
+            raise original
+        print(f"[JSON Repair] Repaired malformed JSON during {context} "
+              f"({len(text)} -> {len(repaired)} characters; error was: {original.msg} at {original.pos})")
+        return json.loads(repaired), True
@@ -0,0 +1,82 @@
+"""
+Incremental parsing of a streamed JSON object.
+
+``JsonSectionParser`` is fed the text of a model response as it streams in
+and returns each top-level member of the root object (``"title": ...``,
+``"diagnosis": {...}``) as soon as the member is complete, so callers can
+show or persist the first sections of a summary while the rest is still
+being generated. Text before the opening brace (such as a markdown code
+fence) is ignored. The parser only reports members early; the complete
+response should still be parsed as a whole at the end.
+"""
+import json
+
+
+class JsonSectionParser:
+    """Yield completed top-level members of a JSON object from streamed text."""
+
+    def __init__(self):
+        self._buffer = ''
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._started = False
+        self._member_start = 0
+        self.done = False
+        self.sections: list[str] = []
+
+    def feed(self, text: str) -> list[tuple[str, object]]:
+        """
+        Consume the next piece of the response.
+
+        Returns:
+            (key, value) pairs for members completed by this piece, in order.
+        """
+        completed = []
+        if self.done or not text:
+            return completed
+        self._buffer += text
+        buffer = self._buffer
+
+        while self._pos < len(buffer):
+            ch = buffer[self._pos]
+            if not self._started:
+                if ch == '{':
+                    self._started = True
+                    self._depth = 1
+                    self._member_start = self._pos + 1
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in '{[':
+                self._depth += 1
+            elif ch in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    self._emit(buffer[self._member_start:self._pos], completed)
+                    self.done = True
+                    self._pos += 1
+                    break
+            elif ch == ',' and self._depth == 1:
+                self._emit(buffer[self._member_start:self._pos], completed)
+                self._member_start = self._pos + 1
+            self._pos += 1
+        return completed
+
+    def _emit(self, member: str, completed: list):
+        if not member.strip():
+            return
+        try:
+            parsed = json.loads('{' + member + '}')
+        except json.JSONDecodeError:
+            return  # malformed member; the final full parse decides
+        for key, value in parsed.items():
+            self.sections.append(key)
+            completed.append((key, value))
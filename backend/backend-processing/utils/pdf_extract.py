@@ -1,26 +1,450 @@
+"""
+PDF text extraction.
+
+Pages are extracted with PyPDF2. Small documents are handled inline; larger
+ones are split into page batches that run on a process pool, so 50-200 page
+lab reports and discharge packets use every core instead of one thread. The
+PDF is written once to a temporary file that workers read and parse once per
+document (not pickled into every batch), and each batch carries only its
+page indices.
+
+Limits (all configurable in config.py):
+- per page:     ``PDF_PAGE_TIMEOUT_SECONDS`` (SIGALRM inside the worker process)
+- per worker:   ``PDF_WORKER_MEMORY_MB`` address-space limit (RLIMIT_AS)
+- per document: ``PDF_DOCUMENT_TIMEOUT_SECONDS`` wall-clock deadline
+- budgets:      stop after ``PDF_MAX_PAGES`` pages or ``PDF_MAX_CHARS`` characters
+
+Headers, footers, patient banners and disclaimers repeated on most pages are
+removed (``strip_repeated_lines``) before the pages are joined. The output
+format is otherwise unchanged: non-empty page texts, stripped, joined with
+blank lines, in page order.
+"""
 import io
+import math
+import os
+import re
+import signal
+import tempfile
+import threading
+import time
+from concurrent.futures import CancelledError, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+import multiprocessing
 import PyPDF2
+from utils.tokens import estimate_tokens_for_characters
+from config import (
+    PDF_EXTRACT_PROCESSES,
+    PDF_PARALLEL_MIN_PAGES,
+    PDF_PAGE_TIMEOUT_SECONDS,
+    PDF_DOCUMENT_TIMEOUT_SECONDS,
+    PDF_WORKER_MEMORY_MB,
+    PDF_MAX_PAGES,
+    PDF_MAX_CHARS,
+    PDF_BOILERPLATE_MIN_PAGE_RATIO,
+)
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+@dataclass
+class PageStat:
+    """Extraction outcome for one page."""
+    page: int  # 1-based page number
+    seconds: float = 0.0
+    characters: int = 0
+    status: str = 'skipped'  # ok | empty | timeout | memory | error | skipped
+
+
+@dataclass
+class PdfExtraction:
+    """Extracted text plus per-page statistics for one document."""
+    text: str
+    total_pages: int
+    pages: list[PageStat] = field(default_factory=list)
+    wall_seconds: float = 0.0
+    truncated: bool = False  # a page/character budget or the document deadline cut extraction short
+    boilerplate_characters_removed: int = 0
+
+    def stats_summary(self) -> dict:
+        """Return aggregate stats suitable for logging or API responses."""
+        counts = {}
+        for page in self.pages:
+            counts[page.status] = counts.get(page.status, 0) + 1
+        durations = [page.seconds for page in self.pages]
+        return {
+            'totalPages': self.total_pages,
+            'pagesByStatus': counts,
+            'characters': len(self.text),
+            'wallSeconds': round(self.wall_seconds, 3),
+            'sumPageSeconds': round(sum(durations), 3),
+            'slowestPageSeconds': round(max(durations), 3) if durations else 0.0,
+            'truncated': self.truncated,
+            'boilerplateCharactersRemoved': self.boilerplate_characters_removed,
+        }
+
+
+# Page numbers are the only numbers ignored when comparing lines: dates and
+# lab values that differ per page ("Collected: 03/14/2024", "WBC 5.4") must
+# not match each other and be stripped as boilerplate.
+_PAGE_LABEL = re.compile(r'\b(page|pg\.?|p\.)\s*\d+(\s*(of|/)\s*\d+)?\b')
+_PAGE_OF = re.compile(r'\b\d+\s+of\s+\d+\b')
+_BARE_PAGE = re.compile(r'^[-\u2013\s]*\d+(\s*/\s*\d+)?[-\u2013\s]*$')
+
+
+def _line_key(line: str) -> str:
+    """
+    Normalize a line for repeat detection. Page numbers are masked ("Page 3 of
+    12" matches "Page 4 of 12", as do "3 of 12", "- 3 -" and a line that is
+    only "3/12"); all other digits are kept.
+    """
+    key = ' '.join(line.split()).lower()
+    if _BARE_PAGE.match(key):
+        return '#'
+    key = _PAGE_LABEL.sub('page #', key)
+    return _PAGE_OF.sub('# of #', key)
+
+
+def strip_repeated_lines(
+    page_texts: list[str],
+    min_page_ratio: float = None,
+    min_pages: int = 3,
+    edge_lines: int = 4,
+    long_line_chars: int = 60,
+) -> tuple[list[str], int]:
+    """
+    Remove lines that repeat across most pages of a document.
+
+    Only lines that look like page furniture are candidates: lines within
+    ``edge_lines`` of the top or bottom of a page (headers, footers, patient
+    banners) and long lines anywhere (disclaimers). Short repeated lines in
+    the body, such as a lab value's "Negative", are kept.
+
+    Args:
+        page_texts: Text of each page, in order.
+        min_page_ratio: Fraction of pages a line must appear on (default PDF_BOILERPLATE_MIN_PAGE_RATIO).
+        min_pages: Documents with fewer pages are returned unchanged.
+        edge_lines: Lines at each end of a page treated as header/footer zone.
+        long_line_chars: Lines at least this long are candidates anywhere on the page.
+
+    Returns:
+        (page texts with boilerplate removed, number of characters removed)
+    """
+    min_page_ratio = min_page_ratio if min_page_ratio is not None else PDF_BOILERPLATE_MIN_PAGE_RATIO
+    non_empty = [text for text in page_texts if text]
+    if len(non_empty) < min_pages:
+        return page_texts, 0
+
+    page_lines = [text.split('\n') if text else [] for text in page_texts]
+    page_counts = {}
+    for lines in page_lines:
+        for key in {_line_key(line) for line in lines if line.strip()}:
+            page_counts[key] = page_counts.get(key, 0) + 1
+
+    threshold = max(min_pages, math.ceil(len(non_empty) * min_page_ratio))
+    repeated = {key for key, count in page_counts.items() if count >= threshold}
+    if not repeated:
+        return page_texts, 0
+
+    removed = 0
+    cleaned = []
+    for lines in page_lines:
+        kept = []
+        # Short pages get a smaller header/footer zone so their body isn't mistaken for one
+        edge = min(edge_lines, max(1, len(lines) // 4))
+        for i, line in enumerate(lines):
+            in_edge = i < edge or i >= len(lines) - edge
+            if (in_edge or len(line.strip()) >= long_line_chars) and _line_key(line) in repeated:
+                removed += len(line) + 1
+                continue
+            kept.append(line)
+        cleaned.append('\n'.join(kept).strip())
+    return cleaned, removed
+
+
+class _PageTimeout(Exception):
+    pass
+
+
+@contextmanager
+def _page_deadline(seconds: float):
+    """Interrupt a page that runs too long (only possible on a process's main thread)."""
+    if not seconds or not hasattr(signal, 'SIGALRM') or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def on_alarm(signum, frame):
+        raise _PageTimeout()
+
+    previous = signal.signal(signal.SIGALRM, on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _init_worker(memory_mb: int):
+    """Process pool initializer: cap the worker's address space."""
+    if resource is not None and memory_mb:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+# The document a pool worker last parsed: consecutive batches of one document reuse the reader
+_worker_document = {'path': None, 'reader': None}
+
+
+def _worker_reader(pdf_path: str):
+    """Return a reader for the PDF at pdf_path, parsing it once per worker and document."""
+    if _worker_document['path'] != pdf_path:
+        with open(pdf_path, 'rb') as f:
+            reader = PyPDF2.PdfReader(io.BytesIO(f.read()))
+        _worker_document.update(path=pdf_path, reader=reader)
+    return _worker_document['reader']
+
+
+def _extract_pages(pdf_path: str, page_indices: list[int], page_timeout_seconds: float,
+                   max_chars: int = None, reader=None) -> list[tuple[int, str, float, str]]:
+    """
+    Extract a batch of pages. Runs in a pool worker (or inline for small documents).
+
+    Args:
+        pdf_path: Temporary file holding the PDF (pool workers); unused when ``reader`` is given.
+        page_indices: 0-based pages of this batch.
+        page_timeout_seconds: Give up on a single page after this long.
+        max_chars: Stop once this many characters are extracted.
+        reader: An already parsed document (inline extraction).
+
+    Returns:
+        List of (page index, text, seconds, status), stopping early once
+        ``max_chars`` characters have been extracted.
+    """
+    if reader is None:
+        reader = _worker_reader(pdf_path)
+
+    results = []
+    characters = 0
+    for idx in page_indices:
+        start = time.perf_counter()
+        text = ''
+        try:
+            with _page_deadline(page_timeout_seconds):
+                text = (reader.pages[idx].extract_text() or '').strip()
+            status = 'ok' if text else 'empty'
+        except _PageTimeout:
+            status = 'timeout'
+        except MemoryError:
+            status = 'memory'
+        except Exception:
+            status = 'error'
+        results.append((idx, text, time.perf_counter() - start, status))
+
+        characters += len(text)
+        if max_chars and characters >= max_chars:
+            break
+    return results
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(processes: int) -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the API process runs gRPC clients and threads
+            _pool = ProcessPoolExecutor(
+                max_workers=processes,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(PDF_WORKER_MEMORY_MB,),
+            )
+        return _pool
+
+
+def _reset_pool(broken_pool: ProcessPoolExecutor):
+    """
+    Drop a pool whose worker died (e.g. killed by the memory limit).
+
+    Only ``broken_pool`` is shut down: when several futures (of this or a
+    concurrent extraction) report the same broken pool, the first one replaces
+    it and the others must not shut down the replacement and its work.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is broken_pool:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+# Times a batch is resubmitted after being cancelled by a pool reset
+_MAX_BATCH_RESUBMITS = 2
+# How often to look for batches cancelled by a pool reset while waiting
+_CANCEL_POLL_SECONDS = 1.0
+
+
+def extract_pdf(
+    pdf_content: bytes,
+    max_pages: int = None,
+    max_chars: int = None,
+    page_timeout_seconds: float = None,
+    document_timeout_seconds: float = None,
+    processes: int = None,
+) -> PdfExtraction:
+    """
+    Extract text from a PDF with page-level parallelism and resource limits.
+
+    Args:
+        pdf_content: PDF file content in bytes
+        max_pages: Extract at most this many pages (default PDF_MAX_PAGES)
+        max_chars: Stop once this many characters are extracted (default PDF_MAX_CHARS)
+        page_timeout_seconds: Give up on a single page after this long (default PDF_PAGE_TIMEOUT_SECONDS)
+        document_timeout_seconds: Return what is done after this long (default PDF_DOCUMENT_TIMEOUT_SECONDS)
+        processes: Worker processes for large documents (default PDF_EXTRACT_PROCESSES)
+
+    Returns:
+        PdfExtraction with the joined text and per-page stats
+    """
+    max_pages = max_pages if max_pages is not None else PDF_MAX_PAGES
+    max_chars = max_chars if max_chars is not None else PDF_MAX_CHARS
+    page_timeout_seconds = page_timeout_seconds if page_timeout_seconds is not None else PDF_PAGE_TIMEOUT_SECONDS
+    document_timeout_seconds = document_timeout_seconds if document_timeout_seconds is not None else PDF_DOCUMENT_TIMEOUT_SECONDS
+    processes = processes if processes is not None else PDF_EXTRACT_PROCESSES
+
+    wall_start = time.monotonic()
+    reader = PyPDF2.PdfReader(io.BytesIO(pdf_content))
+    total_pages = len(reader.pages)
+    page_count = min(total_pages, max_pages) if max_pages else total_pages
+    results = {}
+    deadline_hit = False
+
+    if processes <= 1 or page_count < PDF_PARALLEL_MIN_PAGES:
+        for result in _extract_pages(None, list(range(page_count)), page_timeout_seconds, max_chars, reader=reader):
+            results[result[0]] = result
+    else:
+        # Several batches per worker keeps the pool busy when page costs are uneven
+        batch_size = max(1, math.ceil(page_count / (processes * 4)))
+        batches = [list(range(i, min(i + batch_size, page_count))) for i in range(0, page_count, batch_size)]
+        deadline = wall_start + document_timeout_seconds if document_timeout_seconds else None
+        running = {}  # future -> (batch, pool it was submitted to, resubmits so far)
+        queued = [(batch, 0) for batch in batches]
+
+        # Workers read the document from a file once instead of unpickling it with every batch
+        with tempfile.NamedTemporaryFile(prefix='pdf-extract-', suffix='.pdf', delete=False) as f:
+            f.write(pdf_content)
+            pdf_path = f.name
+
+        def prefix_characters():
+            """Characters extracted from the contiguous run of finished pages at the start."""
+            total = 0
+            for idx in range(page_count):
+                if idx not in results:
+                    break
+                total += len(results[idx][1])
+            return total
+
+        try:
+            while queued or running:
+                # Keep at most two batches per worker in flight, in page order
+                while queued and len(running) < processes * 2:
+                    batch, resubmits = queued.pop(0)
+                    pool = _get_pool(processes)
+                    future = pool.submit(_extract_pages, pdf_path, batch, page_timeout_seconds, max_chars)
+                    running[future] = (batch, pool, resubmits)
+
+                # wait() never reports a future cancelled by a pool reset, so poll for those
+                timeout = _CANCEL_POLL_SECONDS
+                if deadline:
+                    timeout = min(timeout, max(0.0, deadline - time.monotonic()))
+                done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+                done = set(done) | {future for future in running if future.cancelled()}
+                if not done:
+                    if deadline and time.monotonic() >= deadline:
+                        deadline_hit = True
+                        print(f"[PDF Extract] Document deadline of {document_timeout_seconds:g}s reached")
+                        break
+                    continue
+
+                retry = []
+                for future in done:
+                    batch, pool, resubmits = running.pop(future)
+                    try:
+                        for result in future.result():
+                            results[result[0]] = result
+                    except CancelledError:
+                        # Cancelled by a reset of its pool after another batch broke it: run it again
+                        if resubmits < _MAX_BATCH_RESUBMITS:
+                            retry.append((batch, resubmits + 1))
+                        else:
+                            for idx in batch:
+                                results[idx] = (idx, '', 0.0, 'error')
+                    except BrokenProcessPool:
+                        _reset_pool(pool)
+                        for idx in batch:
+                            results[idx] = (idx, '', 0.0, 'memory')
+                    except Exception:
+                        for idx in batch:
+                            results[idx] = (idx, '', 0.0, 'error')
+                # Resubmitted batches go first so pages keep finishing in order
+                queued[:0] = sorted(retry)
+
+                if max_chars and prefix_characters() >= max_chars:
+                    # Budget reached by the leading pages: nothing after them is needed
+                    break
+        finally:
+            for future in running:
+                future.cancel()
+            # Workers still on an abandoned batch already hold the parsed document
+            os.unlink(pdf_path)
+
+    # Assemble in page order, stopping at the character budget
+    pages = []
+    page_texts: list[str] = []
+    characters = 0
+    budget_hit = page_count < total_pages
+    for idx in range(page_count):
+        _, text, seconds, status = results.get(idx, (idx, '', 0.0, 'skipped'))
+        if characters >= max_chars > 0:
+            budget_hit = True
+            pages.append(PageStat(page=idx + 1))
+            continue
+        pages.append(PageStat(page=idx + 1, seconds=seconds, characters=len(text), status=status))
+        page_texts.append(text)
+        characters += len(text)
+
+    page_texts, boilerplate_removed = strip_repeated_lines(page_texts)
+    if boilerplate_removed:
+        print(f"[PDF Extract] Stripped repeated headers/footers: {boilerplate_removed} characters "
+              f"(~{estimate_tokens_for_characters(boilerplate_removed)} tokens)")
+
+    extraction = PdfExtraction(
+        text="\n\n".join(text for text in page_texts if text),
+        total_pages=total_pages,
+        pages=pages,
+        wall_seconds=time.monotonic() - wall_start,
+        truncated=budget_hit or deadline_hit,
+        boilerplate_characters_removed=boilerplate_removed,
+    )
+    print(f"[PDF Extract] Total extracted: {len(extraction.text)} characters from {total_pages} pages "
+          f"({extraction.stats_summary()})")
+    return extraction
 
 
 def extract_text_from_pdf(pdf_content: bytes) -> str:
     """
     Extract text content from a PDF file.
-    
+
     Args:
         pdf_content: PDF file content in bytes
-        
+
     Returns:
         Extracted text as a string
     """
-    reader = PyPDF2.PdfReader(io.BytesIO(pdf_content))
-    text_parts: list[str] = []
-    
-    for page_num, page in enumerate(reader.pages):
-        page_text = page.extract_text()
-        if page_text:
-            text_parts.append(page_text.strip())
-            print(f"[PDF Extract] Page {page_num + 1}: extracted {len(page_text)} characters")
-    
-    full_text = "\n\n".join(text_parts)
-    print(f"[PDF Extract] Total extracted: {len(full_text)} characters from {len(reader.pages)} pages")
-    return full_text
+    return extract_pdf(pdf_content).text
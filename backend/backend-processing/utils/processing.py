@@ -2,13 +2,21 @@
 Reusable processing helper functions extracted from appointment routes.
 These functions handle audio transcription, SOAP generation, and PDF text extraction.
 """
-import io
-from pydub import AudioSegment
+import json
+import re
+from utils.audio_pipeline import segment_audio, decode_to_pcm, encode_pcm_to_webm, PcmSegment
 from utils.speech_to_text import SpeechToTextService
 from utils.storage import StorageService
 from utils.vertex_ai import VertexAIService
-from utils.pdf_extract import extract_text_from_pdf
+from utils.pdf_extract import PdfExtraction, extract_pdf
+from utils.transcription import ConcurrentTranscriber
+from utils.vad import create_segmenter
+from utils.cache import Cache, make_cache_key
+from utils.coverage import covered_intervals, iter_gap_segments
 from utils.constants import Constants
+from utils.tokens import estimate_tokens_for_characters
+from concurrent.futures import ThreadPoolExecutor
+from config import STT_TRANSCRIPTION_MODE, DOCUMENT_DEDUP_SIMILARITY
 
 
 def transcribe_full_recording(
@@ -17,13 +25,26 @@ def transcribe_full_recording(
     stt_service: SpeechToTextService,
     storage_service: StorageService = None,
     appointment_id: str = None,
+    max_workers: int = None,
+    mode: str = None,
+    cache: Cache = None,
 ) -> str:
     """
-    Split a full recording into 30-second chunks, transcribe each chunk,
-    and return the combined transcript.
+    Decode a full recording once into 16 kHz PCM, split it into speech
+    segments (cut at pauses, with silence skipped, when ``STT_SEGMENTER`` is
+    'vad'; fixed 30-second slices otherwise), and transcribe them.
 
-    Optionally uploads each chunk to GCS for backup if storage_service 
-    and appointment_id are provided.
+    In 'chunked' mode the segments are transcribed concurrently, one
+    recognition session each, and joined in segment order. In 'long' mode the
+    segments are fed back-to-back into a single continuous stream that rolls
+    over to a new recognition session just before the per-stream limit.
+
+    Optionally uploads each segment to GCS (re-encoded as webm) for backup if
+    storage_service and appointment_id are provided.
+
+    When a cache is given, the transcript is looked up by a hash of the source
+    bytes plus the STT and segmentation settings, and Speech-to-Text is skipped
+    entirely on a hit.
 
     Args:
         audio_content: Raw audio file bytes
@@ -31,70 +52,178 @@ def transcribe_full_recording(
         stt_service: Initialized SpeechToTextService instance
         storage_service: (Optional) Initialized StorageService for chunk backup
         appointment_id: (Optional) Appointment ID for organizing GCS paths
+        max_workers: (Optional) Concurrency limit (default STT_MAX_CONCURRENCY)
+        mode: (Optional) 'chunked' or 'long' (default STT_TRANSCRIPTION_MODE)
+        cache: (Optional) Transcript cache (see ``routes.services.get_transcription_cache``)
 
     Returns:
         Combined transcript string
     """
-    import uuid as uuid_lib
+    mode = (mode or STT_TRANSCRIPTION_MODE).lower()
+    segmenter = create_segmenter()
 
-    # Load audio using pydub
-    audio = AudioSegment.from_file(io.BytesIO(audio_content), format=file_extension)
-    print(f"[Transcribe] Audio loaded: duration={len(audio)}ms, channels={audio.channels}, frame_rate={audio.frame_rate}")
+    cache_key = None
+    if cache is not None:
+        cache_key = make_cache_key(
+            'transcript',
+            audio_content,
+            stt_service.config_fingerprint(),
+            mode,
+            segmenter.fingerprint() if segmenter is not None else 'fixed|30',
+        )
+        cached = cache.get(cache_key)
+        if cached is not None:
+            print(f"[Transcribe] Using cached transcript ({len(cached)} characters), skipping STT")
+            return cached
 
-    # Split audio into 30-second chunks
-    chunk_length_ms = 30 * 1000
-    chunks: list[AudioSegment] = []
-    for i in range(0, len(audio), chunk_length_ms):
-        chunks.append(audio[i:i + chunk_length_ms])
+    print(f"[Transcribe] Decoding {len(audio_content)} bytes of {file_extension} audio into PCM segments")
+    segments = segment_audio(audio_content, input_format=file_extension, segment_seconds=30, segmenter=segmenter)
+    backup_enabled = bool(storage_service and appointment_id)
 
-    print(f"[Transcribe] Split audio into {len(chunks)} chunks of ~30s each")
+    def backup_segment(idx: int, segment: PcmSegment):
+        # Only pay for a compressed encode when a backup was requested
+        chunk_filename = f"chunks/{appointment_id}/chunk_{idx:04d}.webm"
+        gcs_uri = storage_service.upload_audio_file(
+            encode_pcm_to_webm(segment.pcm), chunk_filename, content_type='audio/webm'
+        )
+        print(f"[Transcribe] Chunk {idx + 1} uploaded to GCS: {gcs_uri}")
 
-    transcript_parts: list[str] = []
+    # Back up each segment exactly once, off the recognition path: the stream is
+    # never starved, and a retried STT attempt never re-encodes or re-uploads
+    with ThreadPoolExecutor(max_workers=2) as backup_executor:
+        backups = []
 
-    for idx, chunk in enumerate(chunks):
-        print(f"[Transcribe] Processing chunk {idx + 1}/{len(chunks)}")
+        def backed_up(source):
+            for segment in source:
+                if backup_enabled:
+                    backups.append(backup_executor.submit(backup_segment, segment.index, segment))
+                yield segment
 
-        # Export chunk to webm
-        chunk_buffer = io.BytesIO()
-        chunk.export(chunk_buffer, format='webm')
-        chunk_content = chunk_buffer.getvalue()
+        if mode == 'long':
+            full_transcript = stt_service.transcribe_pcm_stream(
+                segment.pcm for segment in backed_up(segments)
+            )
+        else:
+            def transcribe_segment(idx: int, segment: PcmSegment) -> str:
+                return stt_service.transcribe_pcm(segment.pcm)
 
-        # Optionally upload chunk to GCS for backup
-        if storage_service and appointment_id:
-            chunk_filename = f"chunks/{appointment_id}/chunk_{idx:04d}.webm"
-            gcs_uri = storage_service.upload_audio_file(chunk_content, chunk_filename, content_type='audio/webm')
-            print(f"[Transcribe] Chunk {idx + 1} uploaded to GCS: {gcs_uri}")
+            transcriber = ConcurrentTranscriber(transcribe_segment, max_workers=max_workers, label="Transcribe")
+            full_transcript = transcriber.transcribe(backed_up(segments)).join("\n")
 
-        # Transcribe using inline audio
-        new_text = stt_service.transcribe_audio_chunk(chunk_content, use_gcs=False, gcs_uri=None)
-        print(f"[Transcribe] Chunk {idx + 1} transcription completed")
+        for backup in backups:
+            backup.result()
 
-        if new_text:
-            transcript_parts.append(new_text)
+    if segmenter is not None:
+        print(f"[Transcribe] Silence skipping: {segmenter.stats.as_dict()}")
 
-    full_transcript = "\n".join(transcript_parts)
     print(f"[Transcribe] Full transcript length: {len(full_transcript)} characters")
+    if cache_key is not None:
+        cache.set(cache_key, full_transcript)
     return full_transcript
 
 
-def generate_soap_from_text(text: str, ai_service: VertexAIService, schema_version: str = Constants.SUMMARY_SCHEMA_VERSION_1_3) -> dict:
+def transcribe_uncovered_audio(
+    audio_content: bytes,
+    file_extension: str,
+    stt_service: SpeechToTextService,
+    segments: list[dict],
+    max_workers: int = None,
+    cache: Cache = None,
+) -> tuple[str, dict]:
+    """
+    Build a full transcript from segments that were already transcribed while
+    recording, sending only the uncovered parts of the recording to
+    Speech-to-Text.
+
+    The recording is decoded once; ranges covered by a segment's
+    ``startMs``/``endMs`` are skipped, and the remaining gaps (for example
+    chunks that failed to upload, or audio after the last chunk) are
+    transcribed concurrently. Existing and new texts are merged in recording
+    order.
+
+    Args:
+        audio_content: Raw audio file bytes
+        file_extension: Audio format extension (e.g. 'webm', 'mp3', 'm4a')
+        stt_service: Initialized SpeechToTextService instance
+        segments: Stored transcript segments (dicts with 'text', 'startMs', 'endMs')
+        max_workers: (Optional) Concurrency limit (default STT_MAX_CONCURRENCY)
+        cache: (Optional) Transcript cache for the gap transcriptions
+
+    Returns:
+        (transcript, stats) where stats has coveredSeconds, gapSeconds and gapSegments.
+    """
+    covered = covered_intervals(segments)
+    covered_ms = sum(end - start for start, end in covered)
+
+    cache_key = None
+    gap_parts = None
+    if cache is not None:
+        cache_key = make_cache_key('gaps', audio_content, stt_service.config_fingerprint(), json.dumps(covered))
+        cached = cache.get(cache_key)
+        if cached is not None:
+            gap_parts = [tuple(part) for part in json.loads(cached)]
+
+    if gap_parts is None:
+        print(f"[Transcribe] Recording has {covered_ms / 1000:.1f}s of transcript coverage "
+              f"in {len(covered)} range(s); transcribing the gaps only")
+        gap_starts = {}
+
+        def gap_segments():
+            pcm_blocks = decode_to_pcm(audio_content, input_format=file_extension)
+            for segment in iter_gap_segments(pcm_blocks, covered):
+                gap_starts[segment.index] = (segment.start_ms, segment.end_ms)
+                yield segment
+
+        transcriber = ConcurrentTranscriber(
+            lambda idx, segment: stt_service.transcribe_pcm(segment.pcm),
+            max_workers=max_workers,
+            label="Transcribe Gaps",
+        )
+        result = transcriber.transcribe(gap_segments())
+        gap_parts = [(*gap_starts[idx], text) for idx, text in enumerate(result.parts)]
+        if cache_key is not None:
+            cache.set(cache_key, json.dumps(gap_parts))
+
+    pieces = [
+        (seg['startMs'], seg.get('text') or '') for seg in segments
+        if seg.get('startMs') is not None and seg.get('endMs') is not None
+    ]
+    pieces.extend((start_ms, text) for start_ms, _, text in gap_parts)
+    pieces.sort(key=lambda piece: piece[0])
+    transcript = "\n".join(text for _, text in pieces if text)
+
+    stats = {
+        'coveredSeconds': round(covered_ms / 1000, 2),
+        'gapSeconds': round(sum(end - start for start, end, _ in gap_parts) / 1000, 2),
+        'gapSegments': len(gap_parts),
+    }
+    print(f"[Transcribe] Merged transcript from existing segments and gaps: {stats}")
+    return transcript, stats
+
+
+def generate_soap_from_text(text: str, ai_service: VertexAIService, schema_version: str = Constants.SUMMARY_SCHEMA_VERSION_1_3,
+                            force_regenerate: bool = False, on_section=None) -> dict:
     """
     Generate SOAP-format summary from combined text using Vertex AI.
 
     Args:
         text: Combined text from transcripts, notes, and/or PDF content
         ai_service: Initialized VertexAIService instance
+        force_regenerate: Bypass the SOAP response cache
+        on_section: Optional callback(key, value) receiving each summary section as it is generated
 
     Returns:
         Dictionary with SOAP-structured notes (includes 'version' key)
     """
-    soap_notes = ai_service.process_transcript_to_soap(text, schema_version=schema_version)
+    soap_notes = ai_service.process_transcript_to_soap(
+        text, schema_version=schema_version, force_regenerate=force_regenerate, on_section=on_section,
+    )
     soap_notes["version"] = schema_version
     print(f"[SOAP] Generated SOAP notes successfully")
     return soap_notes
 
 
-def extract_text_from_pdf_gcs(gcs_uri: str, storage_service: StorageService) -> str:
+def extract_pdf_gcs(gcs_uri: str, storage_service: StorageService) -> PdfExtraction:
     """
     Download a PDF from GCS and extract its text content.
 
@@ -103,10 +232,93 @@ def extract_text_from_pdf_gcs(gcs_uri: str, storage_service: StorageService) ->
         storage_service: Initialized StorageService instance
 
     Returns:
-        Extracted text from the PDF
+        The extraction: text plus page and boilerplate statistics
     """
     print(f"[PDF] Downloading PDF from GCS: {gcs_uri}")
     pdf_bytes = storage_service.download_file(gcs_uri)
     print(f"[PDF] Downloaded {len(pdf_bytes)} bytes")
-    text = extract_text_from_pdf(pdf_bytes)
-    return text
+    return extract_pdf(pdf_bytes)
+
+
+def extract_text_from_pdf_gcs(gcs_uri: str, storage_service: StorageService) -> str:
+    """
+    Download a PDF from GCS and extract its text content.
+
+    Args:
+        gcs_uri: GCS URI of the PDF file (gs://bucket/path)
+        storage_service: Initialized StorageService instance
+
+    Returns:
+        Extracted text from the PDF
+    """
+    return extract_pdf_gcs(gcs_uri, storage_service).text
+
+
+_WORD = re.compile(r'\w+')
+_PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+
+
+def _shingles(text: str, size: int = 5) -> set:
+    """Return the set of hashed ``size``-word shingles of a passage (digits and case ignored)."""
+    words = [w for w in _WORD.findall(text.lower()) if not w.isdigit()]
+    if len(words) < size:
+        return {hash(' '.join(words))} if words else set()
+    return {hash(' '.join(words[i:i + size])) for i in range(len(words) - size + 1)}
+
+
+def remove_duplicate_passages(
+    documents: list[str],
+    similarity: float = None,
+    min_passage_chars: int = 80,
+) -> tuple[list[str], dict]:
+    """
+    Drop passages of later documents that repeat text already seen in earlier ones.
+
+    Documents are split into paragraphs; a paragraph is dropped when at least
+    ``similarity`` of its 5-word shingles already occur in the earlier
+    documents (a re-uploaded discharge summary, the same lab panel exported
+    twice, a shared cover letter). The first occurrence always stays, and
+    short paragraphs are never dropped so repeated values and headings survive.
+
+    Args:
+        documents: Document texts in prompt order.
+        similarity: Shingle containment at which a passage counts as a duplicate (default DOCUMENT_DEDUP_SIMILARITY).
+        min_passage_chars: Paragraphs shorter than this are always kept.
+
+    Returns:
+        (documents with duplicate passages removed, stats) where stats has
+        ``duplicatePassages``, ``charactersRemoved`` and ``estimatedTokensRemoved``.
+    """
+    similarity = similarity if similarity is not None else DOCUMENT_DEDUP_SIMILARITY
+    seen = set()
+    removed_passages = 0
+    removed_characters = 0
+    result = []
+
+    for text in documents:
+        kept = []
+        document_shingles = set()
+        for paragraph in _PARAGRAPH_BREAK.split(text or ''):
+            if not paragraph.strip():
+                continue
+            shingles = _shingles(paragraph)
+            document_shingles |= shingles
+            if (seen and shingles and len(paragraph.strip()) >= min_passage_chars
+                    and len(shingles & seen) / len(shingles) >= similarity):
+                removed_passages += 1
+                removed_characters += len(paragraph)
+                continue
+            kept.append(paragraph)
+        # Shingles become "seen" only after the whole document, so repeats within one document are left alone
+        seen |= document_shingles
+        result.append("\n\n".join(kept))
+
+    stats = {
+        'duplicatePassages': removed_passages,
+        'charactersRemoved': removed_characters,
+        'estimatedTokensRemoved': estimate_tokens_for_characters(removed_characters),
+    }
+    if removed_passages:
+        print(f"[Text Reduction] Removed {removed_passages} duplicate passage(s) across documents: "
+              f"{removed_characters} characters (~{stats['estimatedTokensRemoved']} tokens)")
+    return result, stats
@@ -0,0 +1,318 @@
+"""
+Resilient call layer for upstream model calls.
+
+``ResilientCaller.call`` wraps one upstream request with:
+
+- a deadline for the whole call and a timeout per attempt, so a hung request
+  no longer holds a gunicorn thread until the 300 s worker timeout (the
+  attempt runs on a worker pool; a timed-out attempt is abandoned, not killed),
+- retries with jittered exponential backoff on retryable errors (429, 500,
+  503, 504, connection errors, attempt timeouts), within the deadline,
+- optional hedging: when an attempt has been running longer than the
+  configured percentile of recent latencies of the same kind of call (the
+  ``key`` passed to ``call``: a short question call and a long summary have
+  separate windows), a duplicate request is sent and whichever finishes
+  first wins,
+- a circuit breaker: after ``breaker_failure_threshold`` consecutive upstream
+  failures, calls fail fast with ``CircuitOpenError`` for
+  ``breaker_reset_seconds``; then one probe call is let through, and its
+  outcome closes or re-opens the breaker.
+
+Errors that are not retryable (invalid request, safety blocks, parsing) are
+raised immediately and count as a healthy upstream response.
+"""
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable
+from google.api_core import exceptions as google_exceptions
+from config import (
+    VERTEX_CALL_DEADLINE_SECONDS, VERTEX_ATTEMPT_TIMEOUT_SECONDS, VERTEX_MAX_ATTEMPTS,
+    VERTEX_BACKOFF_BASE_SECONDS, VERTEX_BACKOFF_MAX_SECONDS,
+    VERTEX_HEDGE_ENABLED, VERTEX_HEDGE_PERCENTILE, VERTEX_HEDGE_MIN_SAMPLES,
+    VERTEX_BREAKER_FAILURE_THRESHOLD, VERTEX_BREAKER_RESET_SECONDS, VERTEX_CALL_WORKERS,
+)
+
+RETRYABLE_ERRORS = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.InternalServerError,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.GatewayTimeout,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.Aborted,
+    ConnectionError,
+)
+
+# Recent successful latencies kept per call key for the hedging percentile
+_LATENCY_WINDOW = 200
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling upstream while the circuit breaker is open."""
+
+
+class AttemptTimeoutError(TimeoutError):
+    """Raised when one attempt exceeds its timeout (retryable)."""
+
+
+class CallDeadlineError(TimeoutError):
+    """Raised when a call, including its retries, runs past its deadline."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether an upstream error is worth retrying."""
+    return isinstance(error, (AttemptTimeoutError,) + RETRYABLE_ERRORS)
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe."""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Return whether a call may go upstream now."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.opened += 1
+                    print(f"[Circuit Breaker] Open after {self.consecutive_failures} consecutive failure(s); "
+                          f"failing fast for {self.reset_seconds:g}s")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def retry_after_seconds(self) -> float:
+        """Seconds until the next probe is allowed (0 when not open)."""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.reset_seconds - (time.monotonic() - self._opened_at))
+
+
+class ResilientCaller:
+    """Deadlines, retries, hedging and a circuit breaker around upstream calls."""
+
+    def __init__(
+        self,
+        name: str,
+        deadline_seconds: float = None,
+        attempt_timeout_seconds: float = None,
+        max_attempts: int = None,
+        backoff_base_seconds: float = None,
+        backoff_max_seconds: float = None,
+        hedge_enabled: bool = None,
+        hedge_percentile: float = None,
+        hedge_min_samples: int = None,
+        breaker_failure_threshold: int = None,
+        breaker_reset_seconds: float = None,
+        max_workers: int = None,
+    ):
+        """
+        Args:
+            name:                      Name used in logs.
+            deadline_seconds:          Budget for a call including retries (default VERTEX_CALL_DEADLINE_SECONDS).
+            attempt_timeout_seconds:   Budget for one attempt (default VERTEX_ATTEMPT_TIMEOUT_SECONDS).
+            max_attempts:              Attempts per call (default VERTEX_MAX_ATTEMPTS).
+            backoff_base_seconds:      First retry delay, doubled per attempt with full jitter.
+            backoff_max_seconds:       Cap on a single retry delay.
+            hedge_enabled:             Send a duplicate request when an attempt is slow (default VERTEX_HEDGE_ENABLED).
+            hedge_percentile:          Latency percentile after which to hedge (default VERTEX_HEDGE_PERCENTILE).
+            hedge_min_samples:         Latencies needed before hedging starts.
+            breaker_failure_threshold: Consecutive failures that open the breaker.
+            breaker_reset_seconds:     Time the breaker stays open before a probe.
+            max_workers:               Threads available for attempts (default VERTEX_CALL_WORKERS).
+        """
+        def pick(value, default):
+            return default if value is None else value
+
+        self.name = name
+        self.deadline_seconds = pick(deadline_seconds, VERTEX_CALL_DEADLINE_SECONDS)
+        self.attempt_timeout_seconds = pick(attempt_timeout_seconds, VERTEX_ATTEMPT_TIMEOUT_SECONDS)
+        self.max_attempts = max(1, pick(max_attempts, VERTEX_MAX_ATTEMPTS))
+        self.backoff_base_seconds = pick(backoff_base_seconds, VERTEX_BACKOFF_BASE_SECONDS)
+        self.backoff_max_seconds = pick(backoff_max_seconds, VERTEX_BACKOFF_MAX_SECONDS)
+        self.hedge_enabled = pick(hedge_enabled, VERTEX_HEDGE_ENABLED)
+        self.hedge_percentile = pick(hedge_percentile, VERTEX_HEDGE_PERCENTILE)
+        self.hedge_min_samples = pick(hedge_min_samples, VERTEX_HEDGE_MIN_SAMPLES)
+        self.breaker = CircuitBreaker(
+            pick(breaker_failure_threshold, VERTEX_BREAKER_FAILURE_THRESHOLD),
+            pick(breaker_reset_seconds, VERTEX_BREAKER_RESET_SECONDS),
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, pick(max_workers, VERTEX_CALL_WORKERS)), thread_name_prefix=f"{name}-call",
+        )
+        self._latencies: dict[str, deque] = {}   # call key -> recent latencies
+        self._counters = {
+            'calls': 0, 'attempts': 0, 'retries': 0, 'hedges': 0, 'hedgeWins': 0,
+            'timeouts': 0, 'failures': 0, 'rejected': 0,
+        }
+        self._lock = threading.Lock()
+
+    def _count(self, counter: str, amount: int = 1):
+        with self._lock:
+            self._counters[counter] += amount
+
+    def _record_latency(self, key: str, seconds: float):
+        with self._lock:
+            window = self._latencies.get(key)
+            if window is None:
+                window = self._latencies[key] = deque(maxlen=_LATENCY_WINDOW)
+            window.append(seconds)
+
+    def _hedge_delay(self, key: str):
+        """Return the latency percentile of ``key`` calls after which to hedge, or None when hedging is off."""
+        if not self.hedge_enabled:
+            return None
+        with self._lock:
+            samples = sorted(self._latencies.get(key, ()))
+        if len(samples) < self.hedge_min_samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * self.hedge_percentile / 100))
+        return samples[index]
+
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given (1-based) failed attempt."""
+        ceiling = min(self.backoff_max_seconds, self.backoff_base_seconds * (2 ** (attempt - 1)))
+        return random.uniform(0, ceiling)
+
+    def _attempt(self, fn: Callable[[], Any], timeout: float, hedge: bool, key: str):
+        """Run one attempt (plus an optional hedge) and return its result."""
+        started = time.monotonic()
+        primary = self._executor.submit(fn)
+        remaining = [primary]
+        self._count('attempts')
+
+        hedge_delay = self._hedge_delay(key) if hedge else None
+        if hedge_delay is not None and hedge_delay < timeout:
+            done, _ = wait(remaining, timeout=hedge_delay)
+            if not done:
+                print(f"[{self.name}] {key} attempt still running after p{self.hedge_percentile:g} "
+                      f"({hedge_delay:.1f}s), sending hedged request")
+                remaining.append(self._executor.submit(fn))
+                self._count('hedges')
+                self._count('attempts')
+
+        while remaining:
+            done, _ = wait(remaining, timeout=max(0.0, timeout - (time.monotonic() - started)),
+                           return_when=FIRST_COMPLETED)
+            if not done:
+                self._count('timeouts')
+                raise AttemptTimeoutError(f"{self.name} attempt timed out after {timeout:.1f}s")
+            for future in done:
+                remaining.remove(future)
+                if future.exception() is None or not remaining:
+                    if future is not primary and future.exception() is None:
+                        self._count('hedgeWins')
+                    result = future.result()   # raises the error when every request failed
+                    self._record_latency(key, time.monotonic() - started)
+                    return result
+
+    def call(self, fn: Callable[[], Any], hedge: bool = True, deadline_seconds: float = None, key: str = 'default') -> Any:
+        """
+        Call ``fn`` with retries, deadline, hedging and the circuit breaker.
+
+        Args:
+            fn:               Zero-argument callable making the upstream request.
+                              It may run more than once (retries, hedges), and
+                              a timed-out run keeps going in the background.
+            hedge:            Allow hedged duplicates (disable for calls with side effects).
+            deadline_seconds: Overrides the default call deadline.
+            key:              Kind of call (e.g. the token-budget task). Latencies,
+                              and so the hedging threshold, are tracked per key.
+
+        Returns:
+            The result of ``fn``.
+
+        Raises:
+            CircuitOpenError:  When the breaker is open.
+            CallDeadlineError: When retries ran out of time.
+            Whatever ``fn`` raised, for non-retryable errors or after the last attempt.
+        """
+        self._count('calls')
+        deadline = time.monotonic() + (deadline_seconds or self.deadline_seconds)
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self._count('rejected')
+                raise CircuitOpenError(
+                    f"{self.name} is unavailable (circuit open, retry in {self.breaker.retry_after_seconds():.1f}s)"
+                )
+            attempt += 1
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise CallDeadlineError(f"{self.name} call deadline exceeded after {attempt - 1} attempt(s)")
+            try:
+                result = self._attempt(fn, min(self.attempt_timeout_seconds, remaining), hedge, key)
+            except Exception as e:
+                if not is_retryable(e):
+                    self.breaker.record_success()   # upstream answered; the request itself was bad
+                    raise
+                self.breaker.record_failure()
+                self._count('failures')
+                delay = self._backoff(attempt)
+                if attempt >= self.max_attempts:
+                    raise
+                if time.monotonic() + delay >= deadline:
+                    raise CallDeadlineError(
+                        f"{self.name} call deadline of {deadline_seconds or self.deadline_seconds:.0f}s exceeded "
+                        f"after {attempt} attempt(s): {str(e)}"
+                    )
+                print(f"[{self.name}] Attempt {attempt} failed ({type(e).__name__}: {str(e)[:200]}). "
+                      f"Retrying in {delay:.1f}s")
+                self._count('retries')
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    def stats(self) -> dict:
+        """Return counters, per-key latency percentiles and breaker state (for logs and health checks)."""
+        with self._lock:
+            stats = dict(self._counters)
+            windows = {key: sorted(window) for key, window in self._latencies.items()}
+        stats['latency'] = {
+            key: {
+                'samples': len(samples),
+                'p50Seconds': round(samples[len(samples) // 2], 3),
+                'p95Seconds': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+            }
+            for key, samples in windows.items() if samples
+        }
+        stats['breaker'] = {
+            'state': self.breaker.state,
+            'consecutiveFailures': self.breaker.consecutive_failures,
+            'opened': self.breaker.opened,
+        }
+        return stats
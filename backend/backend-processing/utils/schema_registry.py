@@ -0,0 +1,332 @@
+"""
+Registry of summary schema versions.
+
+Every folder under ``summarySchema/`` holds a ``prompt.txt`` template (with
+``{{input}}`` and ``{{schema}}`` placeholders) and a ``schema.json`` written
+as JSON with comments. The registry loads and validates all versions once,
+substitutes the schema into the template and keeps the template split around
+``{{input}}``, so building a prompt is a single join with no disk access.
+
+Two schema variants are kept per version:
+- ``full``    — the schema file as written, comments included (the comments
+                carry per-field instructions for the model)
+- ``compact`` — comments stripped and whitespace removed; fewer prompt tokens
+
+Each version also carries a machine-readable response schema derived from the
+example schema (``build_response_schema``), passed to the model in structured
+output mode so it returns bare JSON of the right shape.
+
+With hot reload enabled the registry checks file modification times at most
+every ``reload_interval_seconds`` and reloads when a file changed, so prompt
+edits take effect without a restart.
+"""
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from config import SUMMARY_SCHEMA_VARIANT, SUMMARY_SCHEMA_HOT_RELOAD, SUMMARY_SCHEMA_RELOAD_INTERVAL_SECONDS
+from utils.tokens import estimate_tokens
+
+SCHEMA_ROOT = os.path.join(os.path.dirname(__file__), '..', 'summarySchema')
+SCHEMA_VARIANTS = ('full', 'compact')
+
+INPUT_PLACEHOLDER = '{{input}}'
+SCHEMA_PLACEHOLDER = '{{schema}}'
+
+
+class SchemaValidationError(ValueError):
+    """Raised when a schema version folder is incomplete or malformed."""
+
+
+_TYPE_NAMES = {
+    'string': 'STRING',
+    'boolean': 'BOOLEAN',
+    'number': 'NUMBER',
+    'integer': 'INTEGER',
+}
+
+
+def build_response_schema(example, required: bool = True) -> dict:
+    """
+    Convert an example-style schema (``"title": "string"``, ``"severity":
+    "high | medium | low"``, one-element arrays) into a Vertex AI response
+    schema.
+
+    - ``"string"``/``"boolean"``/``"number"``/``"integer"`` map to that type,
+    - ``"a | b | c"`` becomes a string enum,
+    - any other string, and numbers/booleans, take the type of the value,
+    - a list describes its items by its first element (strings when empty),
+    - object members keep their order; top-level members are required, nested
+      ones optional (the prompts allow leaving fields out).
+    """
+    if isinstance(example, dict):
+        schema = {
+            'type': 'OBJECT',
+            'properties': {key: build_response_schema(value, required=False) for key, value in example.items()},
+            'property_ordering': list(example),
+        }
+        if required and example:
+            schema['required'] = list(example)
+        return schema
+    if isinstance(example, list):
+        return {'type': 'ARRAY', 'items': build_response_schema(example[0] if example else 'string', required=False)}
+    if isinstance(example, bool):
+        return {'type': 'BOOLEAN'}
+    if isinstance(example, int):
+        return {'type': 'INTEGER'}
+    if isinstance(example, float):
+        return {'type': 'NUMBER'}
+    if isinstance(example, str):
+        options = [option.strip() for option in example.split('|')]
+        if len(options) > 1 and all(options):
+            return {'type': 'STRING', 'enum': options}
+        return {'type': _TYPE_NAMES.get(example.strip().lower(), 'STRING')}
+    return {'type': 'STRING', 'nullable': True}
+
+
+def strip_json_comments(text: str) -> str:
+    """
+    Remove ``//`` line comments and ``/* */`` block comments from JSON text.
+    Comment markers inside string literals are left alone.
+    """
+    out = []
+    i = 0
+    length = len(text)
+    in_string = False
+    while i < length:
+        ch = text[i]
+        if in_string:
+            out.append(ch)
+            if ch == '\\' and i + 1 < length:
+                out.append(text[i + 1])
+                i += 2
+                continue
+            if ch == '"':
+                in_string = False
+            i += 1
+        elif ch == '"':
+            in_string = True
+            out.append(ch)
+            i += 1
+        elif text.startswith('//', i):
+            end = text.find('\n', i)
+            i = length if end == -1 else end
+        elif text.startswith('/*', i):
+            end = text.find('*/', i + 2)
+            i = length if end == -1 else end + 2
+        else:
+            out.append(ch)
+            i += 1
+    return ''.join(out)
+
+
+@dataclass
+class SchemaVersion:
+    """One loaded schema version with its prompt pre-split around the input placeholder."""
+    version: str
+    schema: dict
+    schema_text: dict[str, str]           # variant -> schema text as inserted in the prompt
+    prompt_parts: dict[str, list[str]]    # variant -> template split around {{input}}
+    response_schema: dict                 # Vertex AI response schema for structured output
+    loaded_at: float = field(default_factory=time.time)
+
+    def build_prompt(self, input_text: str, variant: str = 'full') -> str:
+        """Return the full prompt for input_text (a single join, no file access)."""
+        return input_text.join(self.prompt_parts[variant])
+
+    def describe(self) -> dict:
+        """Return listing metadata for API responses."""
+        return {
+            'version': self.version,
+            'variants': {
+                variant: {
+                    'schemaCharacters': len(text),
+                    'promptOverheadCharacters': sum(len(part) for part in self.prompt_parts[variant]),
+                    'estimatedPromptOverheadTokens': estimate_tokens(''.join(self.prompt_parts[variant])),
+                }
+                for variant, text in self.schema_text.items()
+            },
+            'loadedAt': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(self.loaded_at)),
+        }
+
+
+def load_schema_version(directory: str, version: str) -> SchemaVersion:
+    """
+    Load and validate one schema version folder.
+
+    Raises:
+        FileNotFoundError:     If prompt.txt or schema.json is missing.
+        SchemaValidationError: If the schema is not valid JSON (after removing
+                               comments), its "version" field does not match
+                               the folder, or the template lacks a placeholder.
+    """
+    prompt_path = os.path.join(directory, 'prompt.txt')
+    schema_path = os.path.join(directory, 'schema.json')
+    if not os.path.isfile(prompt_path):
+        raise FileNotFoundError(f"Prompt template not found for schema version {version}: {prompt_path}")
+    if not os.path.isfile(schema_path):
+        raise FileNotFoundError(f"Schema file not found for schema version {version}: {schema_path}")
+
+    with open(prompt_path, 'r', encoding='utf-8') as f:
+        template = f.read()
+    with open(schema_path, 'r', encoding='utf-8') as f:
+        schema_source = f.read()
+
+    try:
+        schema = json.loads(strip_json_comments(schema_source))
+    except json.JSONDecodeError as e:
+        raise SchemaValidationError(f"Schema {version} is not valid JSON: {str(e)}")
+    if not isinstance(schema, dict):
+        raise SchemaValidationError(f"Schema {version} must be a JSON object")
+    if 'version' in schema and str(schema['version']) != version:
+        raise SchemaValidationError(f"Schema {version} declares version {schema['version']}")
+    for placeholder in (INPUT_PLACEHOLDER, SCHEMA_PLACEHOLDER):
+        if placeholder not in template:
+            raise SchemaValidationError(f"Prompt template {version} has no {placeholder} placeholder")
+
+    schema_text = {
+        'full': schema_source,
+        'compact': json.dumps(schema, separators=(',', ':'), ensure_ascii=False),
+    }
+    prompt_parts = {
+        variant: template.replace(SCHEMA_PLACEHOLDER, text).split(INPUT_PLACEHOLDER)
+        for variant, text in schema_text.items()
+    }
+    return SchemaVersion(
+        version=version,
+        schema=schema,
+        schema_text=schema_text,
+        prompt_parts=prompt_parts,
+        response_schema=build_response_schema(schema),
+    )
+
+
+class SchemaRegistry:
+    """All schema versions under a root folder, loaded once and optionally hot-reloaded."""
+
+    def __init__(self, root: str = SCHEMA_ROOT, variant: str = None, hot_reload: bool = None,
+                 reload_interval_seconds: float = None):
+        """
+        Args:
+            root:                    Folder containing one sub-folder per version.
+            variant:                 Default schema variant, 'full' or 'compact' (default SUMMARY_SCHEMA_VARIANT).
+            hot_reload:              Reload changed files on access (default SUMMARY_SCHEMA_HOT_RELOAD).
+            reload_interval_seconds: Minimum time between modification checks.
+        """
+        self.root = os.path.abspath(root)
+        self.variant = (variant or SUMMARY_SCHEMA_VARIANT).lower()
+        if self.variant not in SCHEMA_VARIANTS:
+            raise ValueError(f"Unknown schema variant {self.variant}; expected one of {', '.join(SCHEMA_VARIANTS)}")
+        self.hot_reload = SUMMARY_SCHEMA_HOT_RELOAD if hot_reload is None else hot_reload
+        self.reload_interval_seconds = (
+            reload_interval_seconds if reload_interval_seconds is not None else SUMMARY_SCHEMA_RELOAD_INTERVAL_SECONDS
+        )
+        self._versions: dict[str, SchemaVersion] = {}
+        self._errors: dict[str, str] = {}
+        self._mtimes: dict[str, float] = {}
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def _version_dirs(self) -> dict[str, str]:
+        if not os.path.isdir(self.root):
+            return {}
+        return {
+            name: os.path.join(self.root, name)
+            for name in sorted(os.listdir(self.root))
+            if os.path.isdir(os.path.join(self.root, name))
+        }
+
+    def _snapshot(self) -> dict[str, float]:
+        """Return the newest modification time per version folder."""
+        snapshot = {}
+        for version, directory in self._version_dirs().items():
+            mtimes = [
+                os.path.getmtime(os.path.join(directory, name))
+                for name in ('prompt.txt', 'schema.json')
+                if os.path.isfile(os.path.join(directory, name))
+            ]
+            snapshot[version] = max(mtimes) if mtimes else 0.0
+        return snapshot
+
+    def reload(self):
+        """(Re)load every version. A version that fails validation is logged and left out."""
+        mtimes = self._snapshot()
+        versions = {}
+        errors = {}
+        for version, directory in self._version_dirs().items():
+            try:
+                versions[version] = load_schema_version(directory, version)
+            except (OSError, SchemaValidationError) as e:
+                errors[version] = str(e)
+                print(f"[Schema Registry] Skipping schema {version}: {str(e)}")
+        with self._lock:
+            self._versions = versions
+            self._errors = errors
+            self._mtimes = mtimes
+            self._last_check = time.monotonic()
+        print(f"[Schema Registry] Loaded schema versions: {', '.join(versions) or 'none'} (variant: {self.variant})")
+
+    def _maybe_reload(self):
+        if not self.hot_reload or time.monotonic() - self._last_check < self.reload_interval_seconds:
+            return
+        self._last_check = time.monotonic()
+        if self._snapshot() != self._mtimes:
+            print(f"[Schema Registry] Schema files changed, reloading")
+            self.reload()
+
+    def get(self, version: str) -> SchemaVersion:
+        """
+        Return a loaded schema version.
+
+        Raises:
+            FileNotFoundError: If the version does not exist or failed validation.
+        """
+        self._maybe_reload()
+        schema = self._versions.get(version)
+        if schema is None:
+            detail = self._errors.get(version)
+            if detail:
+                raise FileNotFoundError(f"Schema version {version} is invalid: {detail}")
+            raise FileNotFoundError(f"Schema version {version} not found under {self.root}")
+        return schema
+
+    def build_prompt(self, version: str, input_text: str, variant: str = None) -> str:
+        """Return the summary prompt for input_text using the given (or default) schema variant."""
+        variant = (variant or self.variant).lower()
+        if variant not in SCHEMA_VARIANTS:
+            raise ValueError(f"Unknown schema variant {variant}; expected one of {', '.join(SCHEMA_VARIANTS)}")
+        return self.get(version).build_prompt(input_text, variant)
+
+    def schema_text(self, version: str, variant: str = None) -> str:
+        """Return the schema text of a version as it appears in prompts (given or default variant)."""
+        variant = (variant or self.variant).lower()
+        if variant not in SCHEMA_VARIANTS:
+            raise ValueError(f"Unknown schema variant {variant}; expected one of {', '.join(SCHEMA_VARIANTS)}")
+        return self.get(version).schema_text[variant]
+
+    def response_schema(self, version: str) -> dict:
+        """Return the structured-output response schema of a version."""
+        return self.get(version).response_schema
+
+    def list_versions(self) -> list[dict]:
+        """Return metadata for every loaded version, plus versions that failed validation."""
+        self._maybe_reload()
+        listing = [schema.describe() for schema in self._versions.values()]
+        listing.extend({'version': version, 'error': error} for version, error in self._errors.items())
+        return sorted(listing, key=lambda item: item['version'])
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_schema_registry() -> SchemaRegistry:
+    """Return the process-wide schema registry, loading it on first use."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = SchemaRegistry()
+    return _registry
@@ -0,0 +1,77 @@
+"""
+In-process single-flight coalescing of duplicate calls.
+
+When a client retries ``/process`` or ``/generate-questions`` while the first
+request is still running, both requests would make the same Vertex AI or
+Speech-to-Text call. ``SingleFlight.do`` lets the first caller for a key run
+the call while later callers with the same key wait on its future and receive
+the same result (or exception). Once the call finishes the key is released,
+so a later request makes a fresh call; single-flight only joins calls that
+overlap in time. It is not a cache.
+"""
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one execution."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self._inflight: dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """
+        Run ``fn`` unless a call with the same key is already in flight, in
+        which case wait for that call and return its result.
+
+        Args:
+            key: Logical identity of the call (e.g. a hash of its inputs).
+            fn:  Zero-argument callable performing the call.
+
+        Returns:
+            The result of ``fn`` (shared by every coalesced caller).
+
+        Raises:
+            Whatever ``fn`` raised, re-raised in every coalesced caller.
+        """
+        with self._lock:
+            self.calls += 1
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            print(f"[SingleFlight:{self.name}] Joining in-flight call {key[:12]} ({self.stats()})")
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        """Return call counters (for logs and health checks)."""
+        return {
+            'calls': self.calls,
+            'executions': self.executions,
+            'coalesced': self.coalesced,
+            'inFlight': len(self._inflight),
+        }
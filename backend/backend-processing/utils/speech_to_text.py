@@ -1,15 +1,37 @@
 from google.cloud import speech
-import io
-import subprocess
-import threading
+from dataclasses import dataclass
+from typing import Iterable, Iterator
+from utils.audio_pipeline import decode_to_pcm, pcm_duration_seconds, PCM_SAMPLE_RATE, PCM_BYTES_PER_SECOND
+from utils.cache import make_cache_key
+from utils.single_flight import SingleFlight
+from config import STT_STREAM_MAX_SECONDS, STT_STREAM_OVERLAP_SECONDS
+
+
+@dataclass
+class StreamingResult:
+    """A single recognition result from a (possibly rolled-over) streaming session."""
+    transcript: str
+    is_final: bool
+    session: int
+    end_ms: int  # absolute position in the audio stream where this result ends
+
 
 class SpeechToTextService:
     """Service for converting audio chunks to text using Google Cloud Speech-to-Text"""
+
+    MODEL = "medical_conversation"
+    LANGUAGE_CODE = "en-US"
     
     def __init__(self):
         self.client = speech.SpeechClient()
+        # Identical chunks transcribed concurrently (client retries) share one recognition
+        self.inflight = SingleFlight('stt')
+
+    def config_fingerprint(self) -> str:
+        """Return a string identifying the recognition settings (used in cache keys)."""
+        return f"{self.MODEL}|{self.LANGUAGE_CODE}|{PCM_SAMPLE_RATE}|enhanced|punctuation"
     
-    def _stream_decode_to_pcm(self, audio_content: bytes, chunk_size: int = 4800):
+    def _stream_decode_to_pcm(self, audio_content: bytes, chunk_size: int = 4800, input_format: str = None):
         """
         Stream decode audio to PCM using ffmpeg pipe, yielding small chunks as they're decoded.
         This avoids buffering the entire decoded audio in memory.
@@ -17,69 +39,91 @@ class SpeechToTextService:
         Args:
             audio_content: Audio file content in any format (webm, mp3, wav, etc.)
             chunk_size: Size of PCM chunks to yield (default 4800 bytes = ~150ms at 16kHz)
+            input_format: Optional format hint (file extension)
             
         Yields:
             PCM audio chunks (mono, 16-bit, 16 kHz)
         """
-        try:
-            # Use ffmpeg to decode audio to raw PCM via pipe
-            # -i pipe:0 = read from stdin
-            # -f s16le = signed 16-bit little-endian PCM
-            # -acodec pcm_s16le = PCM codec
-            # -ar 16000 = 16 kHz sample rate
-            # -ac 1 = mono (1 channel)
-            # pipe:1 = write to stdout
-            process = subprocess.Popen(
-                [
-                    'ffmpeg',
-                    '-i', 'pipe:0',  # Input from stdin
-                    '-f', 's16le',   # Output format: signed 16-bit little-endian
-                    '-acodec', 'pcm_s16le',  # PCM codec
-                    '-ar', '16000',  # Sample rate: 16 kHz
-                    '-ac', '1',      # Channels: mono
-                    'pipe:1'         # Output to stdout
-                ],
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-            
-            # Write input audio to ffmpeg stdin in a separate thread
-            def write_input():
-                try:
-                    process.stdin.write(audio_content)
-                    process.stdin.close()
-                except Exception as e:
-                    print(f"[PCM Stream] Error writing to ffmpeg: {e}")
-            
-            writer_thread = threading.Thread(target=write_input)
-            writer_thread.start()
-            
-            # Read PCM output in chunks and yield immediately
-            total_bytes = 0
-            while True:
-                chunk = process.stdout.read(chunk_size)
-                if not chunk:
-                    break
-                total_bytes += len(chunk)
-                yield chunk
-            
-            # Wait for writer thread and process to complete
-            writer_thread.join()
-            process.wait()
-            
-            # Check for errors
-            if process.returncode != 0:
-                stderr_output = process.stderr.read().decode('utf-8', errors='ignore')
-                raise Exception(f"ffmpeg failed with return code {process.returncode}: {stderr_output}")
-            
-            print(f"[PCM Stream] Decoded {total_bytes} bytes of PCM audio")
-            print(f"[PCM Stream] Duration: ~{total_bytes / 32000:.2f} seconds")
-            
-        except Exception as e:
-            raise Exception(f"Failed to stream decode audio to PCM: {str(e)}")
+        return decode_to_pcm(audio_content, input_format=input_format, block_size=chunk_size)
+
+    @staticmethod
+    def _iter_pcm_blocks(pcm: bytes, chunk_size: int = 4800):
+        """Split an in-memory PCM buffer into request-sized blocks."""
+        view = memoryview(pcm)
+        for offset in range(0, len(view), chunk_size):
+            yield bytes(view[offset:offset + chunk_size])
+
+    def _build_streaming_config(self, interim_results: bool = False, word_time_offsets: bool = False) -> speech.StreamingRecognitionConfig:
+        """
+        Return the streaming recognition config used for every request.
+
+        Args:
+            interim_results:   Ask the API for non-final hypotheses as well.
+            word_time_offsets: Include per-word timings (needed to de-duplicate
+                               the overlap between rolled-over sessions).
+        """
+        # Configure for PCM streaming
+        config = speech.RecognitionConfig(
+            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+            sample_rate_hertz=PCM_SAMPLE_RATE,
+            audio_channel_count=1,
+            language_code=self.LANGUAGE_CODE,
+            # Enable medical conversation model
+            model=self.MODEL,
+            use_enhanced=True,
+            enable_automatic_punctuation=True,
+            enable_word_time_offsets=word_time_offsets,
+        )
+        
+        return speech.StreamingRecognitionConfig(
+            config=config,
+            interim_results=interim_results
+        )
+
+    def _recognize_pcm_stream(self, pcm_blocks) -> str:
+        """
+        Run one streaming recognition session over an iterable of PCM blocks and
+        return the joined final transcript.
+        """
+        streaming_config = self._build_streaming_config()
+
+        # Generator that wraps PCM blocks as they become available
+        def generate_audio_requests():
+            for pcm_chunk in pcm_blocks:
+                yield speech.StreamingRecognizeRequest(audio_content=pcm_chunk)
+
+        requests = generate_audio_requests()
+        responses = self.client.streaming_recognize(streaming_config, requests)
+
+        print(f"[Speech-to-Text] Streaming recognition started, processing responses...")
+
+        # Collect transcript text from streaming responses
+        transcript_parts = []
+        result_count = 0
+
+        for response in responses:
+            result_count += 1
+
+            # Only process final results (not interim)
+            for result in response.results:
+                if result.is_final and result.alternatives:
+                    alternative = result.alternatives[0]
+                    transcript_text = alternative.transcript
+                    print(f"[Speech-to-Text] Final result {result_count}: {transcript_text[:100] if transcript_text else 'EMPTY'}")
+
+                    if transcript_text:
+                        transcript_parts.append(transcript_text)
+
+        print(f"[Speech-to-Text] Streaming completed")
+        print(f"[Speech-to-Text] Total results processed: {result_count}")
+
+        # Join all transcript parts with space
+        full_transcript = " ".join(transcript_parts)
+        print(f"[Speech-to-Text] Full transcript length: {len(full_transcript)} characters")
+
+        return full_transcript
     
-    def transcribe_audio_chunk(self, audio_content: bytes, use_gcs: bool = False, gcs_uri: str = None) -> str:
+    def transcribe_audio_chunk(self, audio_content: bytes, use_gcs: bool = False, gcs_uri: str = None, input_format: str = None) -> str:
         """
         Transcribe an audio chunk using Google Cloud Speech-to-Text API with streaming
         Configured for medical conversations without speaker diarization
@@ -89,6 +133,7 @@ class SpeechToTextService:
             audio_content: Audio file content in bytes (any format)
             use_gcs: Not used (kept for backward compatibility)
             gcs_uri: Not used (kept for backward compatibility)
+            input_format: Optional format hint (file extension)
             
         Returns:
             String containing the transcribed text
@@ -97,64 +142,199 @@ class SpeechToTextService:
         print(f"[Speech-to-Text] Starting streaming decode and recognition")
         print(f"[Speech-to-Text] Input audio size: {len(audio_content)} bytes")
         
-        # Configure for PCM streaming
-        config = speech.RecognitionConfig(
-            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-            sample_rate_hertz=16000,
-            audio_channel_count=1,
-            language_code="en-US",
-            # Enable medical conversation model
-            model="medical_conversation",
-            use_enhanced=True,
-            enable_automatic_punctuation=True
-        )
-        
-        streaming_config = speech.StreamingRecognitionConfig(
-            config=config,
-            interim_results=False
-        )
-        
+        key = make_cache_key('chunk', self.config_fingerprint(), input_format or '', audio_content)
         try:
-            # Generator that streams PCM chunks as they're decoded from ffmpeg
-            def generate_audio_requests():
-                """
-                Stream decode audio to PCM and yield StreamingRecognizeRequest objects.
-                This pipes audio through ffmpeg and sends PCM chunks immediately to Google STT.
-                """
-                for pcm_chunk in self._stream_decode_to_pcm(audio_content, chunk_size=4800):
-                    yield speech.StreamingRecognizeRequest(audio_content=pcm_chunk)
-            
             # Stream the audio to Google STT as it's being decoded
-            requests = generate_audio_requests()
-            responses = self.client.streaming_recognize(streaming_config, requests)
-            
-            print(f"[Speech-to-Text] Streaming recognition started, processing responses...")
-            
-            # Collect transcript text from streaming responses
-            transcript_parts = []
-            result_count = 0
-            
+            return self.inflight.do(key, lambda: self._recognize_pcm_stream(
+                self._stream_decode_to_pcm(audio_content, chunk_size=4800, input_format=input_format)
+            ))
+        except Exception as e:
+            raise Exception(f"Speech-to-text transcription failed: {str(e)}")
+
+    def transcribe_audio_chunk_timed(self, audio_content: bytes, input_format: str = None) -> tuple[str, int]:
+        """
+        Like ``transcribe_audio_chunk``, but also report how much audio the chunk held.
+
+        Args:
+            audio_content: Audio file content in bytes (any format)
+            input_format: Optional format hint (file extension)
+
+        Returns:
+            (transcribed text, decoded duration in milliseconds)
+        """
+        def recognize() -> tuple[str, int]:
+            decoded = {'bytes': 0}
+
+            def counted_blocks():
+                for block in self._stream_decode_to_pcm(audio_content, chunk_size=4800, input_format=input_format):
+                    decoded['bytes'] += len(block)
+                    yield block
+
+            text = self._recognize_pcm_stream(counted_blocks())
+            return text, decoded['bytes'] * 1000 // PCM_BYTES_PER_SECOND
+
+        key = make_cache_key('chunk_timed', self.config_fingerprint(), input_format or '', audio_content)
+        try:
+            return self.inflight.do(key, recognize)
+        except Exception as e:
+            raise Exception(f"Speech-to-text transcription failed: {str(e)}")
+
+    def transcribe_pcm(self, pcm: bytes) -> str:
+        """
+        Transcribe already-decoded PCM audio (mono, 16-bit, 16 kHz) without
+        another ffmpeg pass.
+
+        Args:
+            pcm: Raw PCM audio bytes, e.g. a segment from ``utils.audio_pipeline``
+
+        Returns:
+            String containing the transcribed text
+        """
+        print(f"[Speech-to-Text] Starting PCM recognition (~{pcm_duration_seconds(len(pcm)):.2f} seconds)")
+
+        key = make_cache_key('pcm', self.config_fingerprint(), pcm)
+        try:
+            return self.inflight.do(key, lambda: self._recognize_pcm_stream(self._iter_pcm_blocks(pcm, chunk_size=4800)))
+        except Exception as e:
+            raise Exception(f"Speech-to-text transcription failed: {str(e)}")
+
+    def stream_recognize(
+        self,
+        pcm_blocks: Iterable[bytes],
+        interim_results: bool = False,
+        max_stream_seconds: float = None,
+        overlap_seconds: float = None,
+    ) -> Iterator[StreamingResult]:
+        """
+        Recognize one continuous PCM stream of any length.
+
+        The API caps a single streaming session at roughly five minutes, so the
+        stream is fed into one session until ``max_stream_seconds`` of audio
+        have been sent, then rolled over to a new session. The new session
+        first replays the last ``overlap_seconds`` of audio so words at the
+        boundary are not lost; final words that start before the end of what
+        the previous session already committed are dropped.
+
+        Args:
+            pcm_blocks:         Iterable of PCM blocks (mono, 16-bit, 16 kHz), consumed once.
+            interim_results:    Also yield non-final hypotheses.
+            max_stream_seconds: Audio per session before rollover (default ``STT_STREAM_MAX_SECONDS``).
+            overlap_seconds:    Audio replayed into the next session (default ``STT_STREAM_OVERLAP_SECONDS``).
+
+        Yields:
+            StreamingResult objects in order.
+        """
+        max_stream_seconds = max_stream_seconds if max_stream_seconds is not None else STT_STREAM_MAX_SECONDS
+        overlap_seconds = overlap_seconds if overlap_seconds is not None else STT_STREAM_OVERLAP_SECONDS
+
+        session_limit_bytes = int(max_stream_seconds * PCM_BYTES_PER_SECOND)
+        overlap_bytes = int(overlap_seconds * PCM_BYTES_PER_SECOND) // 2 * 2
+        streaming_config = self._build_streaming_config(interim_results=interim_results, word_time_offsets=True)
+
+        # Re-slice into request-sized blocks; callers may pass whole segments
+        source = (piece for block in pcm_blocks for piece in self._iter_pcm_blocks(block, chunk_size=4800))
+        pending = next(source, None)  # one block of look-ahead so we never open an empty session
+        carry = b''
+        session = 0
+        session_offset_ms = 0
+        committed_until_ms = 0
+
+        while pending is not None:
+            sent = {'bytes': 0}
+            tail = bytearray()
+
+            def generate_audio_requests():
+                nonlocal pending
+                if carry:
+                    sent['bytes'] += len(carry)
+                    tail.extend(carry)
+                    yield speech.StreamingRecognizeRequest(audio_content=carry)
+                while pending is not None and sent['bytes'] < session_limit_bytes:
+                    block = pending
+                    sent['bytes'] += len(block)
+                    tail.extend(block)
+                    if len(tail) > overlap_bytes:
+                        del tail[:len(tail) - overlap_bytes]
+                    yield speech.StreamingRecognizeRequest(audio_content=block)
+                    pending = next(source, None)
+
+            print(f"[Speech-to-Text] Opening streaming session {session + 1} at {session_offset_ms / 1000:.1f}s")
+            responses = self.client.streaming_recognize(streaming_config, generate_audio_requests())
+
             for response in responses:
-                result_count += 1
-                
-                # Only process final results (not interim)
                 for result in response.results:
-                    if result.is_final and result.alternatives:
-                        alternative = result.alternatives[0]
-                        transcript_text = alternative.transcript
-                        print(f"[Speech-to-Text] Final result {result_count}: {transcript_text[:100] if transcript_text else 'EMPTY'}")
-                        
-                        if transcript_text:
-                            transcript_parts.append(transcript_text)
-            
-            print(f"[Speech-to-Text] Streaming completed")
-            print(f"[Speech-to-Text] Total results processed: {result_count}")
-            
-            # Join all transcript parts with space
-            full_transcript = " ".join(transcript_parts)
-            print(f"[Speech-to-Text] Full transcript length: {len(full_transcript)} characters")
-            
-            return full_transcript
-        
+                    if not result.alternatives:
+                        continue
+                    alternative = result.alternatives[0]
+                    result_end_ms = session_offset_ms + int(result.result_end_time.total_seconds() * 1000)
+
+                    if not result.is_final:
+                        if interim_results and alternative.transcript:
+                            yield StreamingResult(alternative.transcript, False, session, result_end_ms)
+                        continue
+
+                    text, last_word_end_ms = self._dedupe_final_words(alternative, session_offset_ms, committed_until_ms)
+                    if last_word_end_ms is None:
+                        # No word timings: fall back to the result boundary
+                        if result_end_ms <= committed_until_ms:
+                            continue
+                        last_word_end_ms = result_end_ms
+                    committed_until_ms = max(committed_until_ms, last_word_end_ms)
+                    if text:
+                        yield StreamingResult(text, True, session, result_end_ms)
+
+            # Roll over: the next session replays the overlap tail
+            carry = bytes(tail) if pending is not None else b''
+            session_offset_ms += (sent['bytes'] - len(carry)) * 1000 // PCM_BYTES_PER_SECOND
+            session += 1
+
+        print(f"[Speech-to-Text] Long stream completed in {session} session(s), "
+              f"{committed_until_ms / 1000:.1f}s of audio committed")
+
+    @staticmethod
+    def _dedupe_final_words(alternative, session_offset_ms: int, committed_until_ms: int):
+        """
+        Drop words of a final result that were already committed by the
+        previous session (the replayed overlap).
+
+        Returns:
+            (transcript, absolute end of the last kept word in ms) — the end is
+            None when the API returned no word timings.
+        """
+        words = list(alternative.words)
+        if not words:
+            return alternative.transcript, None
+
+        kept = []
+        last_end_ms = committed_until_ms
+        for word in words:
+            start_ms = session_offset_ms + int(word.start_time.total_seconds() * 1000)
+            end_ms = session_offset_ms + int(word.end_time.total_seconds() * 1000)
+            if start_ms < committed_until_ms:
+                continue
+            kept.append(word.word)
+            last_end_ms = max(last_end_ms, end_ms)
+
+        if len(kept) == len(words):
+            return alternative.transcript, last_end_ms
+        return " ".join(kept), last_end_ms
+
+    def transcribe_pcm_stream(self, pcm_blocks: Iterable[bytes]) -> str:
+        """
+        Transcribe one continuous PCM stream (e.g. a full recording decoded
+        once) through long streaming sessions with automatic rollover.
+
+        Args:
+            pcm_blocks: Iterable of PCM blocks (mono, 16-bit, 16 kHz)
+
+        Returns:
+            String containing the transcribed text
+        """
+        try:
+            parts = [result.transcript for result in self.stream_recognize(pcm_blocks) if result.is_final]
         except Exception as e:
             raise Exception(f"Speech-to-text transcription failed: {str(e)}")
+
+        full_transcript = " ".join(parts)
+        print(f"[Speech-to-Text] Long stream transcript length: {len(full_transcript)} characters")
+        return full_transcript
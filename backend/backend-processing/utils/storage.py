@@ -1,6 +1,7 @@
 from google.cloud import storage
 import uuid
 from datetime import datetime, timedelta
+from config import GCS_UPLOAD_CHUNK_SIZE
 
 class StorageService:
     """Service for uploading files to Google Cloud Storage"""
@@ -67,6 +68,86 @@ class StorageService:
         blob.upload_from_string(file_content, content_type=content_type)
         return f"gs://{self.bucket.name}/{filename}"
     
+    def upload_stream(self, file_obj, filename: str, content_type: str, chunk_size: int = None) -> str:
+        """
+        Upload a file object to Google Cloud Storage without reading it into memory.
+
+        Uses a chunked resumable upload, so only one chunk (``GCS_UPLOAD_CHUNK_SIZE``)
+        is buffered at a time regardless of the file size. The stream is read
+        from its current position to EOF and never rewound.
+
+        Args:
+            file_obj: Readable binary file object (e.g. ``request.files[...].stream``)
+            filename: Filename/path in GCS
+            content_type: MIME type of the file
+            chunk_size: (Optional) Bytes per upload request; multiple of 256 KB
+
+        Returns:
+            GCS URI in format gs://bucket-name/path/to/file
+        """
+        blob = self.bucket.blob(filename, chunk_size=chunk_size or GCS_UPLOAD_CHUNK_SIZE)
+        blob.upload_from_file(file_obj, content_type=content_type, rewind=False)
+        print(f"[Storage] Streamed {blob.size or 0} bytes to {filename}")
+        return f"gs://{self.bucket.name}/{filename}"
+
+    def create_upload_session(self, filename: str, content_type: str, origin: str = None) -> str:
+        """
+        Start a resumable upload session so a client can upload directly to GCS.
+
+        The returned session URL is itself the credential: the client PUTs the
+        file (in one request, or in chunks with Content-Range headers) to it
+        without going through the API. Sessions expire after a week.
+
+        Args:
+            filename: Filename/path in GCS
+            content_type: MIME type the object will be stored with
+            origin: (Optional) Browser origin allowed to upload (CORS)
+
+        Returns:
+            Resumable upload session URL
+        """
+        blob = self.bucket.blob(filename)
+        return blob.create_resumable_upload_session(content_type=content_type, origin=origin)
+
+    def get_blob_name(self, gcs_uri: str) -> str:
+        """
+        Return the object path for a GCS URI in this bucket
+
+        Args:
+            gcs_uri: GCS URI in format gs://bucket-name/path/to/file (or a bare path)
+
+        Returns:
+            Object path within the bucket
+        """
+        # Format: gs://bucket-name/path/to/file
+        if gcs_uri.startswith("gs://"):
+            path = gcs_uri.split(f"gs://{self.bucket.name}/", 1)
+            if len(path) == 2:
+                return path[1]
+            raise ValueError(f"GCS URI does not match bucket: {gcs_uri}")
+        return gcs_uri
+
+    def get_file_info(self, gcs_uri: str):
+        """
+        Look up an uploaded object's metadata
+
+        Args:
+            gcs_uri: GCS URI in format gs://bucket-name/path/to/file
+
+        Returns:
+            Dict with name, size, contentType, md5Hash and generation, or None if it does not exist
+        """
+        blob = self.bucket.get_blob(self.get_blob_name(gcs_uri))
+        if blob is None:
+            return None
+        return {
+            'name': blob.name,
+            'size': blob.size,
+            'contentType': blob.content_type,
+            'md5Hash': blob.md5_hash,
+            'generation': blob.generation,
+        }
+
     def download_file(self, gcs_uri: str) -> bytes:
         """
         Download a file from Google Cloud Storage by its GCS URI
@@ -77,18 +158,7 @@ class StorageService:
         Returns:
             File content as bytes
         """
-        # Parse the GCS URI to extract the blob path
-        # Format: gs://bucket-name/path/to/file
-        if gcs_uri.startswith("gs://"):
-            path = gcs_uri.split(f"gs://{self.bucket.name}/", 1)
-            if len(path) == 2:
-                blob_name = path[1]
-            else:
-                raise ValueError(f"GCS URI does not match bucket: {gcs_uri}")
-        else:
-            blob_name = gcs_uri
-        
-        blob = self.bucket.blob(blob_name)
+        blob = self.bucket.blob(self.get_blob_name(gcs_uri))
         return blob.download_as_bytes()
 
     def delete_folder(self, folder_prefix: str) -> int:
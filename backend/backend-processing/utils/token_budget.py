@@ -0,0 +1,214 @@
+"""
+Token-budget planning for model calls.
+
+Before a call, ``TokenBudgetPlanner.plan`` sizes the prompt and decides:
+
+- the output budget (``max_output_tokens``), from a per-task prediction of
+  the response length. Full summaries (single pass, merge, rolling update)
+  always keep the 65,000-token ceiling: ``max_output_tokens`` is only a cap,
+  so a lower one saves no latency and a truncated summary is redone through
+  map-reduce,
+- the model tier: prompts up to ``VERTEX_FAST_MODEL_MAX_INPUT_TOKENS`` go to
+  ``VERTEX_AI_FAST_MODEL`` when one is configured,
+- the strategy: summaries whose prompt is over
+  ``SUMMARY_MAP_REDUCE_THRESHOLD_TOKENS`` are routed to map-reduce up front,
+  rather than after a long call fails with ``MaxTokensError``.
+
+Prompt size is estimated locally (``utils/tokens.py``, ~4 characters per
+token). ``TOKEN_COUNT_MODE`` controls when Vertex AI ``count_tokens`` is asked
+instead: ``estimate`` never, ``api`` always, ``auto`` only when the estimate
+is within ``TOKEN_COUNT_MARGIN`` of a threshold, where the exact count changes
+the decision. A failed count falls back to the estimate. After the call,
+``record`` logs predicted against actual usage from the response metadata.
+"""
+import math
+import threading
+from dataclasses import dataclass
+from typing import Callable
+from utils.tokens import estimate_tokens
+from config import (
+    TOKEN_COUNT_MODE, TOKEN_COUNT_MARGIN, VERTEX_AI_FAST_MODEL, VERTEX_FAST_MODEL_MAX_INPUT_TOKENS,
+    SUMMARY_MAP_REDUCE_THRESHOLD_TOKENS,
+)
+
+
+@dataclass(frozen=True)
+class TaskProfile:
+    """Expected response size of a task: ``base + ratio * input`` tokens."""
+    base_tokens: int
+    input_ratio: float
+    min_output_tokens: int
+    max_output_tokens: int
+    headroom: float = 2.0          # budget = prediction * headroom, clamped to [min, max]
+    map_reduce: bool = False       # route oversized prompts to map-reduce
+
+
+# Output ceiling of a complete summary (the model's limit, as before budgets were planned)
+FULL_SUMMARY_OUTPUT_TOKENS = 65000
+
+TASK_PROFILES = {
+    'summary': TaskProfile(2048, 0.1, FULL_SUMMARY_OUTPUT_TOKENS, FULL_SUMMARY_OUTPUT_TOKENS, map_reduce=True),
+    'summary_map': TaskProfile(1024, 0.15, 8192, 16384),
+    'summary_merge': TaskProfile(2048, 0.5, FULL_SUMMARY_OUTPUT_TOKENS, FULL_SUMMARY_OUTPUT_TOKENS),
+    'summary_update': TaskProfile(2048, 0.5, FULL_SUMMARY_OUTPUT_TOKENS, FULL_SUMMARY_OUTPUT_TOKENS),
+    'questions': TaskProfile(256, 0.0, 2048, 2048),
+    'question_update': TaskProfile(768, 0.0, 4096, 4096),
+}
+
+
+@dataclass
+class TokenBudget:
+    """The plan for one model call."""
+    task: str
+    model_name: str
+    input_tokens: int
+    counted: bool                  # True: counted by Vertex AI, False: estimated locally
+    predicted_output_tokens: int
+    max_output_tokens: int
+    strategy: str = 'single'       # 'single' or 'map_reduce'
+
+    def as_dict(self) -> dict:
+        return {
+            'task': self.task,
+            'model': self.model_name,
+            'inputTokens': self.input_tokens,
+            'inputTokensCounted': self.counted,
+            'predictedOutputTokens': self.predicted_output_tokens,
+            'maxOutputTokens': self.max_output_tokens,
+            'strategy': self.strategy,
+        }
+
+
+class TokenBudgetPlanner:
+    """Plan output budgets, model tiers and strategies from prompt size."""
+
+    def __init__(
+        self,
+        default_model: str,
+        count_fn: Callable[[str, str], int] = None,
+        mode: str = None,
+        margin: float = None,
+        fast_model: str = None,
+        fast_model_max_input_tokens: int = None,
+        map_reduce_threshold_tokens: int = None,
+    ):
+        """
+        Args:
+            default_model:               Model used unless the fast tier applies.
+            count_fn:                    ``(text, model_name) -> tokens`` via the API (None: estimate only).
+            mode:                        'estimate', 'api' or 'auto' (default TOKEN_COUNT_MODE).
+            margin:                      Relative distance to a threshold that triggers an exact count in auto mode.
+            fast_model:                  Model for small prompts (default VERTEX_AI_FAST_MODEL; empty disables).
+            fast_model_max_input_tokens: Largest prompt sent to the fast model.
+            map_reduce_threshold_tokens: Summary prompts above this use map-reduce.
+        """
+        self.default_model = default_model
+        self.count_fn = count_fn
+        self.mode = (mode or TOKEN_COUNT_MODE).lower()
+        self.margin = TOKEN_COUNT_MARGIN if margin is None else margin
+        self.fast_model = VERTEX_AI_FAST_MODEL if fast_model is None else fast_model
+        self.fast_model_max_input_tokens = (
+            fast_model_max_input_tokens if fast_model_max_input_tokens is not None else VERTEX_FAST_MODEL_MAX_INPUT_TOKENS
+        )
+        self.map_reduce_threshold_tokens = (
+            map_reduce_threshold_tokens if map_reduce_threshold_tokens is not None else SUMMARY_MAP_REDUCE_THRESHOLD_TOKENS
+        )
+        self._counters = {
+            'plans': 0, 'apiCounts': 0, 'countFailures': 0, 'fastModel': 0, 'mapReduce': 0,
+            'recorded': 0, 'predictedInputTokens': 0, 'actualInputTokens': 0, 'actualOutputTokens': 0,
+        }
+        self._lock = threading.Lock()
+
+    def _count(self, counter: str, amount: int = 1):
+        with self._lock:
+            self._counters[counter] += amount
+
+    def _thresholds(self, profile: TaskProfile) -> list[int]:
+        thresholds = []
+        if self.fast_model:
+            thresholds.append(self.fast_model_max_input_tokens)
+        if profile.map_reduce:
+            thresholds.append(self.map_reduce_threshold_tokens)
+        return thresholds
+
+    def count_tokens(self, text: str, profile: TaskProfile = None) -> tuple[int, bool]:
+        """
+        Size a prompt.
+
+        Returns:
+            (tokens, whether they were counted by the API rather than estimated)
+        """
+        estimate = estimate_tokens(text)
+        if self.count_fn is None or self.mode == 'estimate':
+            return estimate, False
+        if self.mode == 'auto':
+            near = any(
+                abs(estimate - threshold) <= threshold * self.margin
+                for threshold in self._thresholds(profile or TASK_PROFILES['summary'])
+            )
+            if not near:
+                return estimate, False
+        try:
+            tokens = int(self.count_fn(text, self.default_model))
+        except Exception as e:
+            self._count('countFailures')
+            print(f"[Token Budget] count_tokens failed, using estimate of {estimate}: {str(e)}")
+            return estimate, False
+        self._count('apiCounts')
+        return tokens, True
+
+    def plan(self, task: str, prompt: str) -> TokenBudget:
+        """Return the budget, model and strategy for sending ``prompt`` for ``task``."""
+        profile = TASK_PROFILES[task]
+        input_tokens, counted = self.count_tokens(prompt, profile)
+
+        predicted = math.ceil(profile.base_tokens + profile.input_ratio * input_tokens)
+        max_output = min(profile.max_output_tokens, max(profile.min_output_tokens, math.ceil(predicted * profile.headroom)))
+
+        model_name = self.default_model
+        if self.fast_model and input_tokens <= self.fast_model_max_input_tokens:
+            model_name = self.fast_model
+            self._count('fastModel')
+
+        strategy = 'single'
+        if profile.map_reduce and input_tokens > self.map_reduce_threshold_tokens:
+            strategy = 'map_reduce'
+            self._count('mapReduce')
+
+        self._count('plans')
+        budget = TokenBudget(
+            task=task,
+            model_name=model_name,
+            input_tokens=input_tokens,
+            counted=counted,
+            predicted_output_tokens=predicted,
+            max_output_tokens=max_output,
+            strategy=strategy,
+        )
+        print(f"[Token Budget] {task}: ~{input_tokens} input tokens ({'counted' if counted else 'estimated'}), "
+              f"predicted output ~{predicted}, budget {max_output}, model {model_name}, strategy {strategy}")
+        return budget
+
+    def record(self, budget: TokenBudget, usage_metadata, context: str):
+        """Log predicted against actual token usage for a finished call."""
+        if budget is None or usage_metadata is None:
+            return
+        actual_input = getattr(usage_metadata, 'prompt_token_count', 0) or 0
+        actual_output = getattr(usage_metadata, 'candidates_token_count', 0) or 0
+        with self._lock:
+            self._counters['recorded'] += 1
+            self._counters['predictedInputTokens'] += budget.input_tokens
+            self._counters['actualInputTokens'] += actual_input
+            self._counters['actualOutputTokens'] += actual_output
+        print(f"[Token Budget] {context}: input predicted {budget.input_tokens} / actual {actual_input}; "
+              f"output predicted {budget.predicted_output_tokens} / actual {actual_output} "
+              f"(budget {budget.max_output_tokens}, model {budget.model_name})")
+
+    def stats(self) -> dict:
+        """Return planning counters and the observed accuracy of input estimates."""
+        with self._lock:
+            stats = dict(self._counters)
+        if stats['predictedInputTokens']:
+            stats['actualToPredictedInputRatio'] = round(stats['actualInputTokens'] / stats['predictedInputTokens'], 3)
+        stats['mode'] = self.mode
+        return stats
@@ -0,0 +1,57 @@
+"""
+Token estimates for prompt text.
+
+Gemini tokenizes English text at roughly four characters per token; this is
+used wherever an estimate is good enough (logging, reduction metrics) and a
+``count_tokens`` round trip to Vertex AI would cost more than it is worth.
+"""
+import math
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens_for_characters(characters: int) -> int:
+    """Return an approximate token count for a number of characters."""
+    return math.ceil(max(0, characters) / CHARS_PER_TOKEN)
+
+
+def estimate_tokens(text: str) -> int:
+    """Return an approximate token count for text."""
+    return estimate_tokens_for_characters(len(text or ''))
+
+
+def split_text_windows(text: str, max_tokens: int, section_pattern=None) -> list[str]:
+    """
+    Split text into consecutive windows of at most ``max_tokens`` (estimated).
+
+    Windows break between lines; a single line longer than the budget is cut
+    into pieces. When ``section_pattern`` (a compiled regex) matches a line,
+    that line is treated as a section header and repeated, marked
+    "(continued)", at the top of any window that starts inside its section.
+
+    Returns:
+        The windows in order; joined with newlines they contain all of the text.
+    """
+    budget = max(1, max_tokens * CHARS_PER_TOKEN)
+    windows: list[str] = []
+    current: list[str] = []
+    size = 0
+    header = None
+
+    for line in (text or '').split('\n'):
+        if section_pattern is not None and section_pattern.match(line):
+            header = line
+        pieces = [line[i:i + budget] for i in range(0, len(line), budget)] or ['']
+        for piece in pieces:
+            if current and size + len(piece) + 1 > budget:
+                windows.append('\n'.join(current))
+                current, size = [], 0
+                if header is not None and piece != header:
+                    current.append(f"{header} (continued)")
+                    size = len(current[0]) + 1
+            current.append(piece)
+            size += len(piece) + 1
+
+    if any(part.strip() for part in current):
+        windows.append('\n'.join(current))
+    return windows
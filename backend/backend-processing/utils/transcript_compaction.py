@@ -0,0 +1,169 @@
+"""
+Deterministic transcript compaction before prompting.
+
+Raw Speech-to-Text output carries filler words, false starts ("I was I was
+going") and phrases duplicated where two chunks were joined. None of it helps
+the model, and all of it costs tokens and latency on every Vertex AI call.
+``compact_transcript`` removes it without touching medical content:
+
+- whitespace is normalized and empty lines are dropped,
+- standalone filler words (``TRANSCRIPT_FILLER_WORDS``) are removed,
+- immediately repeated word n-grams are collapsed to one copy,
+- a phrase repeated at the end of one line and the start of the next (a chunk
+  join) is kept only once.
+
+Number words and digits are never collapsed ("one one zero", "twenty twenty"),
+and acknowledgements such as "uh-huh" or "mm-hmm" are not fillers. The stored
+``rawTranscript`` is never compacted; only the text sent to the model is.
+"""
+import re
+from dataclasses import dataclass
+from config import TRANSCRIPT_COMPACTION_ENABLED, TRANSCRIPT_FILLER_WORDS, TRANSCRIPT_COMPACTION_MAX_NGRAM
+from utils.tokens import estimate_tokens_for_characters
+
+NUMBER_WORDS = frozenset((
+    'zero oh one two three four five six seven eight nine ten eleven twelve thirteen fourteen fifteen '
+    'sixteen seventeen eighteen nineteen twenty thirty forty fifty sixty seventy eighty ninety hundred '
+    'thousand million point half quarter'
+).split())
+
+_NON_WORD = re.compile(r"[^\w'-]")
+
+
+@dataclass
+class CompactionStats:
+    """What compaction removed from one transcript."""
+    original_characters: int = 0
+    compacted_characters: int = 0
+    fillers_removed: int = 0
+    repeated_words_removed: int = 0
+    join_words_removed: int = 0
+
+    @property
+    def compression_ratio(self) -> float:
+        """Compacted size as a fraction of the original (1.0 = nothing removed)."""
+        if not self.original_characters:
+            return 1.0
+        return self.compacted_characters / self.original_characters
+
+    def as_dict(self) -> dict:
+        removed = self.original_characters - self.compacted_characters
+        return {
+            'originalCharacters': self.original_characters,
+            'compactedCharacters': self.compacted_characters,
+            'compressionRatio': round(self.compression_ratio, 3),
+            'estimatedTokensRemoved': estimate_tokens_for_characters(removed),
+            'fillersRemoved': self.fillers_removed,
+            'repeatedWordsRemoved': self.repeated_words_removed,
+            'joinWordsRemoved': self.join_words_removed,
+        }
+
+
+def _word_key(word: str) -> str:
+    """Normalize a word for comparison: lower case, punctuation stripped."""
+    return _NON_WORD.sub('', word.lower()).strip("'-")
+
+
+def _is_numeric(key: str) -> bool:
+    return key in NUMBER_WORDS or any(ch.isdigit() for ch in key)
+
+
+def _collapse_repeats(words: list[str], max_ngram: int) -> tuple[list[str], int]:
+    """Drop the second copy of any immediately repeated word n-gram (n <= max_ngram)."""
+    out: list[str] = []
+    keys: list[str] = []
+    removed = 0
+    for word in words:
+        out.append(word)
+        keys.append(_word_key(word))
+        for n in range(min(max_ngram, len(keys) // 2), 0, -1):
+            tail = keys[-n:]
+            if tail == keys[-2 * n:-n] and all(tail) and not any(_is_numeric(k) for k in tail):
+                del out[-n:]
+                del keys[-n:]
+                removed += n
+                break
+    return out, removed
+
+
+def _join_overlap(previous: list[str], current: list[str], max_ngram: int, min_overlap: int = 2) -> int:
+    """Return how many leading words of ``current`` repeat the trailing words of ``previous``."""
+    prev_keys = [_word_key(w) for w in previous[-max_ngram:]]
+    cur_keys = [_word_key(w) for w in current[:max_ngram]]
+    for k in range(min(len(prev_keys), len(cur_keys)), min_overlap - 1, -1):
+        if prev_keys[-k:] == cur_keys[:k] and all(cur_keys[:k]):
+            return k
+    return 0
+
+
+def compact_transcript(
+    text: str,
+    filler_words: frozenset = None,
+    max_ngram: int = None,
+    enabled: bool = None,
+) -> tuple[str, CompactionStats]:
+    """
+    Compact a transcript for use in a prompt.
+
+    Args:
+        text:         Transcript, one chunk/segment per line.
+        filler_words: Words removed wherever they stand alone (default TRANSCRIPT_FILLER_WORDS).
+        max_ngram:    Longest repeated phrase collapsed (default TRANSCRIPT_COMPACTION_MAX_NGRAM).
+        enabled:      Set False to return the text unchanged (default TRANSCRIPT_COMPACTION_ENABLED).
+
+    Returns:
+        (compacted text, CompactionStats). The output is a pure function of
+        the input and settings.
+    """
+    text = text or ''
+    stats = CompactionStats(original_characters=len(text))
+    enabled = TRANSCRIPT_COMPACTION_ENABLED if enabled is None else enabled
+    if not enabled:
+        stats.compacted_characters = len(text)
+        return text, stats
+
+    filler_words = TRANSCRIPT_FILLER_WORDS if filler_words is None else filler_words
+    max_ngram = max_ngram or TRANSCRIPT_COMPACTION_MAX_NGRAM
+
+    lines: list[list[str]] = []
+    for raw_line in text.splitlines():
+        words = []
+        for word in raw_line.split():
+            if _word_key(word) in filler_words:
+                stats.fillers_removed += 1
+                continue
+            words.append(word)
+        words, removed = _collapse_repeats(words, max_ngram)
+        stats.repeated_words_removed += removed
+        if not words:
+            continue
+
+        if lines:
+            overlap = _join_overlap(lines[-1], words, max_ngram)
+            if overlap:
+                words = words[overlap:]
+                stats.join_words_removed += overlap
+                if not words:
+                    continue
+        lines.append(words)
+
+    compacted = '\n'.join(' '.join(words) for words in lines)
+    stats.compacted_characters = len(compacted)
+    return compacted, stats
+
+
+def compact_for_prompt(text: str, label: str = "Compaction") -> tuple[str, dict]:
+    """
+    Compact a transcript and log the result.
+
+    Returns:
+        (compacted text, stats dict for API responses)
+    """
+    compacted, stats = compact_transcript(text)
+    summary = stats.as_dict()
+    if stats.original_characters:
+        print(f"[{label}] Transcript compacted {stats.original_characters} -> {stats.compacted_characters} characters "
+              f"(ratio {summary['compressionRatio']}, ~{summary['estimatedTokensRemoved']} tokens saved; "
+              f"{stats.fillers_removed} fillers, {stats.repeated_words_removed} repeated words, "
+              f"{stats.join_words_removed} chunk-join words)")
+    return compacted, summary
@@ -0,0 +1,169 @@
+"""
+Concurrent chunk transcription engine.
+
+Runs speech-to-text over a sequence of audio chunks on a bounded worker pool,
+retries chunks that fail, and reassembles the transcript in the original
+chunk order. Wall-clock time grows with the slowest chunk rather than with
+the sum of all chunks.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from typing import Callable, Iterable
+from config import STT_MAX_CONCURRENCY, STT_CHUNK_MAX_RETRIES, STT_RETRY_BACKOFF_SECONDS
+
+
+@dataclass
+class ChunkTiming:
+    """Timing information for a single transcribed chunk."""
+    index: int
+    seconds: float
+    attempts: int
+    characters: int
+
+
+@dataclass
+class TranscriptionResult:
+    """Ordered transcript parts plus per-chunk timings for one transcription run."""
+    parts: list[str] = field(default_factory=list)
+    timings: list[ChunkTiming] = field(default_factory=list)
+    wall_seconds: float = 0.0
+
+    def join(self, separator: str = "\n") -> str:
+        """Join the non-empty transcript parts in chunk order."""
+        return separator.join(part for part in self.parts if part)
+
+    def timings_summary(self) -> dict:
+        """Return aggregate timing stats suitable for logging or API responses."""
+        durations = [t.seconds for t in self.timings]
+        return {
+            'chunks': len(self.timings),
+            'wallSeconds': round(self.wall_seconds, 3),
+            'sumChunkSeconds': round(sum(durations), 3),
+            'longestChunkSeconds': round(max(durations), 3) if durations else 0.0,
+            'retries': sum(t.attempts - 1 for t in self.timings),
+        }
+
+
+class ConcurrentTranscriber:
+    """
+    Transcribe many audio chunks concurrently with a bounded worker pool.
+
+    The chunk iterable is consumed lazily: at most ``2 * max_workers`` chunks
+    are held in memory at once, so callers can pass a generator of segments
+    without materializing the whole recording.
+    """
+
+    def __init__(
+        self,
+        transcribe_fn: Callable[[int, object], str],
+        max_workers: int = None,
+        max_retries: int = None,
+        retry_backoff_seconds: float = None,
+        label: str = "Transcribe",
+    ):
+        """
+        Args:
+            transcribe_fn:         Callable ``(index, chunk) -> str`` that transcribes one chunk.
+            max_workers:           Maximum number of chunks transcribed at once
+                                   (default ``STT_MAX_CONCURRENCY``).
+            max_retries:           Extra attempts per chunk after the first failure
+                                   (default ``STT_CHUNK_MAX_RETRIES``).
+            retry_backoff_seconds: Base delay before a retry, doubled on each attempt
+                                   (default ``STT_RETRY_BACKOFF_SECONDS``).
+            label:                 Log prefix used in progress messages.
+        """
+        self.transcribe_fn = transcribe_fn
+        self.max_workers = max(1, max_workers if max_workers is not None else STT_MAX_CONCURRENCY)
+        self.max_retries = max(0, max_retries if max_retries is not None else STT_CHUNK_MAX_RETRIES)
+        self.retry_backoff_seconds = (
+            retry_backoff_seconds if retry_backoff_seconds is not None else STT_RETRY_BACKOFF_SECONDS
+        )
+        self.label = label
+
+    def _transcribe_with_retry(self, index: int, chunk) -> tuple[str, ChunkTiming]:
+        """Transcribe one chunk, retrying with exponential backoff on failure."""
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                text = self.transcribe_fn(index, chunk) or ""
+                timing = ChunkTiming(
+                    index=index,
+                    seconds=time.monotonic() - started,
+                    attempts=attempt,
+                    characters=len(text),
+                )
+                print(f"[{self.label}] Chunk {index + 1} transcribed in {timing.seconds:.2f}s "
+                      f"(attempt {attempt}, {len(text)} characters)")
+                return text, timing
+            except Exception as e:
+                if attempt > self.max_retries:
+                    raise Exception(f"Chunk {index + 1} failed after {attempt} attempts: {str(e)}")
+                delay = self.retry_backoff_seconds * (2 ** (attempt - 1))
+                print(f"[{self.label}] Chunk {index + 1} attempt {attempt} failed: {str(e)}. "
+                      f"Retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def transcribe(self, chunks: Iterable) -> TranscriptionResult:
+        """
+        Transcribe every chunk and return the results in the original order.
+
+        Args:
+            chunks: Iterable of chunk payloads passed through to ``transcribe_fn``.
+
+        Returns:
+            TranscriptionResult with ordered parts and per-chunk timings.
+
+        Raises:
+            Exception: If any chunk still fails after all retries. Pending
+                       chunks are cancelled.
+        """
+        started = time.monotonic()
+        parts: dict[int, str] = {}
+        timings: dict[int, ChunkTiming] = {}
+        max_in_flight = self.max_workers * 2
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = {}
+            chunk_iter = enumerate(chunks)
+            exhausted = False
+
+            try:
+                while pending or not exhausted:
+                    # Top up the in-flight window from the (possibly lazy) chunk source
+                    while not exhausted and len(pending) < max_in_flight:
+                        try:
+                            index, chunk = next(chunk_iter)
+                        except StopIteration:
+                            exhausted = True
+                            break
+                        future = executor.submit(self._transcribe_with_retry, index, chunk)
+                        pending[future] = index
+
+                    if not pending:
+                        break
+
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        index = pending.pop(future)
+                        text, timing = future.result()
+                        parts[index] = text
+                        timings[index] = timing
+            except Exception:
+                for future in pending:
+                    future.cancel()
+                raise
+
+        ordered = sorted(parts)
+        result = TranscriptionResult(
+            parts=[parts[i] for i in ordered],
+            timings=[timings[i] for i in ordered],
+            wall_seconds=time.monotonic() - started,
+        )
+        summary = result.timings_summary()
+        print(f"[{self.label}] Transcribed {summary['chunks']} chunks with {self.max_workers} workers: "
+              f"wall={summary['wallSeconds']}s, sum={summary['sumChunkSeconds']}s, "
+              f"longest={summary['longestChunkSeconds']}s, retries={summary['retries']}")
+        return result
@@ -0,0 +1,241 @@
+"""
+Energy-based voice activity detection for PCM segmentation.
+
+Places segment boundaries inside pauses instead of at fixed offsets, so words
+are not cut in half, and drops stretches of silence (waiting-room time, the
+doctor stepping out) before they are sent to Speech-to-Text.
+"""
+import math
+import sys
+from array import array
+from collections import deque
+from dataclasses import dataclass
+from typing import Iterable, Iterator
+from utils.audio_pipeline import PcmSegment, PCM_SAMPLE_RATE, PCM_SAMPLE_WIDTH
+from config import STT_SEGMENTER, VAD_ENERGY_THRESHOLD, VAD_MIN_SPEECH_MS, VAD_MAX_SEGMENT_SECONDS
+
+try:
+    import audioop
+except ImportError:  # removed from the stdlib in Python 3.13
+    audioop = None
+
+
+def frame_rms(frame: bytes) -> int:
+    """Return the RMS energy of a 16-bit little-endian PCM frame."""
+    if not frame:
+        return 0
+    if audioop is not None:
+        return audioop.rms(frame, PCM_SAMPLE_WIDTH)
+
+    samples = array('h')
+    samples.frombytes(frame)
+    if sys.byteorder != 'little':
+        samples.byteswap()
+    return int(math.sqrt(sum(s * s for s in samples) / len(samples)))
+
+
+@dataclass
+class VadStats:
+    """Counters describing what the segmenter kept and skipped."""
+    total_ms: int = 0
+    emitted_ms: int = 0
+    segments: int = 0
+    dropped_segments: int = 0
+
+    @property
+    def skipped_seconds(self) -> float:
+        return max(0, self.total_ms - self.emitted_ms) / 1000
+
+    def as_dict(self) -> dict:
+        return {
+            'audioSeconds': round(self.total_ms / 1000, 2),
+            'transcribedSeconds': round(self.emitted_ms / 1000, 2),
+            'skippedSeconds': round(self.skipped_seconds, 2),
+            'segments': self.segments,
+            'droppedSegments': self.dropped_segments,
+        }
+
+
+class VoiceActivitySegmenter:
+    """
+    Split a PCM stream into speech segments using per-frame RMS energy.
+
+    A segment is opened at the first voiced frame (plus a short pre-roll), and
+    closed when either:
+      - it is longer than ``min_segment_seconds`` and a pause of ``pause_ms`` occurs,
+      - a pause lasts ``max_pause_ms`` (the rest of the silence is skipped), or
+      - it reaches ``max_segment_seconds``, in which case it is cut at the
+        quietest frame of the last ``cut_lookback_ms``.
+    Segments with less than ``min_speech_ms`` of voiced audio are dropped.
+
+    Segments are contiguous slices of the source, so ``start_ms``/``end_ms``
+    map back to positions in the original recording. ``stats`` is updated as
+    segments are produced and is complete once the generator is exhausted.
+    """
+
+    def __init__(
+        self,
+        energy_threshold: int = None,
+        min_speech_ms: int = None,
+        max_segment_seconds: float = None,
+        min_segment_seconds: float = 10.0,
+        frame_ms: int = 30,
+        pause_ms: int = 400,
+        max_pause_ms: int = 2000,
+        pre_roll_ms: int = 300,
+        cut_lookback_ms: int = 3000,
+        noise_multiplier: float = 3.0,
+    ):
+        self.energy_threshold = energy_threshold if energy_threshold is not None else VAD_ENERGY_THRESHOLD
+        self.min_speech_ms = min_speech_ms if min_speech_ms is not None else VAD_MIN_SPEECH_MS
+        max_segment_seconds = max_segment_seconds if max_segment_seconds is not None else VAD_MAX_SEGMENT_SECONDS
+
+        self.frame_ms = frame_ms
+        self.frame_bytes = PCM_SAMPLE_RATE * PCM_SAMPLE_WIDTH * frame_ms // 1000
+        self.min_segment_frames = int(min_segment_seconds * 1000 / frame_ms)
+        self.max_segment_frames = max(1, int(max_segment_seconds * 1000 / frame_ms))
+        self.pause_frames = max(1, pause_ms // frame_ms)
+        self.max_pause_frames = max(self.pause_frames, max_pause_ms // frame_ms)
+        self.pre_roll_frames = pre_roll_ms // frame_ms
+        self.cut_lookback_frames = max(1, cut_lookback_ms // frame_ms)
+        self.noise_multiplier = noise_multiplier
+        self.stats = VadStats()
+
+    def fingerprint(self) -> str:
+        """Return a string identifying the segmentation settings (used in cache keys)."""
+        return (f"vad|{self.energy_threshold}|{self.min_speech_ms}|{self.frame_ms}|{self.min_segment_frames}|"
+                f"{self.max_segment_frames}|{self.pause_frames}|{self.max_pause_frames}|{self.noise_multiplier}")
+
+    def _iter_frames(self, pcm_blocks: Iterable[bytes]) -> Iterator[bytes]:
+        """Regroup arbitrary PCM blocks into fixed-size analysis frames."""
+        buffer = bytearray()
+        for block in pcm_blocks:
+            buffer.extend(block)
+            while len(buffer) >= self.frame_bytes:
+                yield bytes(buffer[:self.frame_bytes])
+                del buffer[:self.frame_bytes]
+        if buffer:
+            yield bytes(buffer)
+
+    def segments(self, pcm_blocks: Iterable[bytes]) -> Iterator[PcmSegment]:
+        """
+        Consume PCM blocks and yield speech segments in order.
+
+        Args:
+            pcm_blocks: Iterable of PCM blocks (mono, 16-bit, 16 kHz)
+
+        Yields:
+            PcmSegment objects whose timestamps refer to the source audio.
+        """
+        self.stats = VadStats()
+        stats = self.stats
+        bytes_per_ms = PCM_SAMPLE_RATE * PCM_SAMPLE_WIDTH // 1000
+
+        noise_floor = None
+        pre_roll = deque(maxlen=self.pre_roll_frames)
+        frames: list[tuple[bytes, int, bool]] = []  # (pcm, rms, voiced) of the open segment
+        segment_start_ms = 0
+        position_ms = 0
+        silence_run = 0
+        index = 0
+
+        def close(count: int):
+            """Emit (or drop) the first ``count`` frames of the open segment."""
+            nonlocal index
+            kept = frames[:count]
+            speech_ms = sum(1 for _, _, voiced in kept if voiced) * self.frame_ms
+            pcm = b''.join(f for f, _, _ in kept)
+            if speech_ms < self.min_speech_ms:
+                stats.dropped_segments += 1
+                return None
+            segment = PcmSegment(index=index, start_ms=segment_start_ms, pcm=pcm)
+            index += 1
+            stats.segments += 1
+            stats.emitted_ms += len(pcm) // bytes_per_ms
+            return segment
+
+        for frame in self._iter_frames(pcm_blocks):
+            rms = frame_rms(frame)
+            threshold = self.energy_threshold
+            if noise_floor is not None:
+                threshold = max(threshold, noise_floor * self.noise_multiplier)
+            voiced = rms >= threshold
+            if not voiced:
+                # Track the background level so a noisy room doesn't read as speech
+                noise_floor = rms if noise_floor is None else 0.95 * noise_floor + 0.05 * rms
+
+            frame_duration_ms = len(frame) // bytes_per_ms
+            stats.total_ms += frame_duration_ms
+
+            if not frames:
+                if voiced:
+                    # Open a segment, including a little audio before the first voiced frame
+                    frames = [(f, 0, False) for f in pre_roll]
+                    segment_start_ms = position_ms - sum(len(f) for f in pre_roll) // bytes_per_ms
+                    pre_roll.clear()
+                    frames.append((frame, rms, True))
+                    silence_run = 0
+                else:
+                    pre_roll.append(frame)
+                position_ms += frame_duration_ms
+                continue
+
+            frames.append((frame, rms, voiced))
+            silence_run = 0 if voiced else silence_run + 1
+            position_ms += frame_duration_ms
+
+            if silence_run >= self.max_pause_frames:
+                # Long pause: close after a short tail and skip the rest of the silence
+                keep = len(frames) - silence_run + self.pause_frames
+                segment = close(keep)
+                if segment:
+                    yield segment
+                pre_roll.extend(f for f, _, _ in frames[keep:])
+                frames = []
+                silence_run = 0
+            elif len(frames) >= self.min_segment_frames and silence_run >= self.pause_frames:
+                # Natural pause after a reasonably sized segment
+                segment = close(len(frames))
+                if segment:
+                    yield segment
+                frames = []
+                silence_run = 0
+            elif len(frames) >= self.max_segment_frames:
+                # No pause in sight: cut at the quietest recent frame
+                lookback_start = max(1, len(frames) - self.cut_lookback_frames)
+                cut = min(range(lookback_start, len(frames)), key=lambda i: frames[i][1])
+                remainder = frames[cut:]
+                segment = close(cut)
+                if segment:
+                    yield segment
+                segment_start_ms = position_ms - sum(len(f) for f, _, _ in remainder) // bytes_per_ms
+                frames = remainder
+                silence_run = 0
+                for _, _, voiced_frame in reversed(frames):
+                    if voiced_frame:
+                        break
+                    silence_run += 1
+
+        if frames:
+            segment = close(len(frames) - max(0, silence_run - self.pause_frames))
+            if segment:
+                yield segment
+
+        print(f"[VAD] {stats.segments} speech segments, {stats.dropped_segments} dropped, "
+              f"skipped {stats.skipped_seconds:.1f}s of {stats.total_ms / 1000:.1f}s audio")
+
+
+def create_segmenter(mode: str = None):
+    """
+    Return the segmenter configured by ``STT_SEGMENTER``.
+
+    Args:
+        mode: 'vad' or 'fixed' (default: the ``STT_SEGMENTER`` setting)
+
+    Returns:
+        A VoiceActivitySegmenter for 'vad', or None for fixed-duration slicing.
+    """
+    mode = (mode or STT_SEGMENTER).lower()
+    if mode == 'vad':
+        return VoiceActivitySegmenter()
+    return None
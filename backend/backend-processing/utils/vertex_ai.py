@@ -1,8 +1,19 @@
 import vertexai
 from vertexai.preview.generative_models import GenerativeModel, GenerationConfig, HarmCategory, HarmBlockThreshold, FinishReason
+import copy
 import json
-import os
 import re
+from concurrent.futures import ThreadPoolExecutor
+from utils.cache import Cache, make_cache_key
+from utils.single_flight import SingleFlight
+from utils.schema_registry import get_schema_registry
+from utils.tokens import estimate_tokens, split_text_windows
+from utils.json_stream import JsonSectionParser
+from utils.json_repair import loads_lenient
+from utils.resilience import ResilientCaller
+from utils.token_budget import TokenBudget, TokenBudgetPlanner
+from config import SUMMARY_MAP_REDUCE_THRESHOLD_TOKENS, SUMMARY_WINDOW_TOKENS, SUMMARY_MAP_CONCURRENCY
+from config import VERTEX_STRUCTURED_OUTPUT
 
 
 class MaxTokensError(Exception):
@@ -13,9 +24,55 @@ class MaxTokensError(Exception):
 class VertexAIService:
     """Service for interacting with Vertex AI (Gemini)"""
     
-    def __init__(self, project_id: str, location: str, model_name: str = "gemini-1.5-pro"):
+    SOAP_TEMPERATURE = 0.3
+
+    # Labelled input sections assembled by /process ("=== Audio Transcript ===")
+    SECTION_HEADER = re.compile(r'^=== .+ ===$')
+
+    QUESTIONS_RESPONSE_SCHEMA = {'type': 'ARRAY', 'items': {'type': 'STRING'}}
+    QUESTION_UPDATE_RESPONSE_SCHEMA = {
+        'type': 'OBJECT',
+        'properties': {
+            'digest': {'type': 'STRING'},
+            'questions': {'type': 'ARRAY', 'items': {'type': 'STRING'}},
+        },
+        'required': ['digest', 'questions'],
+        'property_ordering': ['digest', 'questions'],
+    }
+
+    def __init__(self, project_id: str, location: str, model_name: str = "gemini-1.5-pro", response_cache: Cache = None):
+        """
+        Args:
+            project_id:     GCP project.
+            location:       Vertex AI region.
+            model_name:     Gemini model name.
+            response_cache: Optional cache of SOAP responses, keyed by the
+                            assembled prompt, model name and generation config.
+        """
         vertexai.init(project=project_id, location=location)
+        self.model_name = model_name
         self.model = GenerativeModel(model_name)
+        self._models = {model_name: self.model}
+        self.response_cache = response_cache
+        # Identical prompts sent concurrently (client retries) share one model call
+        self.inflight = SingleFlight('vertex')
+        self.structured_output = VERTEX_STRUCTURED_OUTPUT
+        self.json_repairs = 0
+        # Deadlines, retries, hedging and circuit breaker around every model request
+        self.caller = ResilientCaller('Vertex AI')
+        # Output budget, model tier and strategy are planned from the prompt size
+        self.token_budget = TokenBudgetPlanner(model_name, count_fn=self._count_tokens)
+
+    def _get_model(self, model_name: str) -> GenerativeModel:
+        """Return the GenerativeModel for a model name, creating it on first use."""
+        model = self._models.get(model_name)
+        if model is None:
+            model = self._models[model_name] = GenerativeModel(model_name)
+        return model
+
+    def _count_tokens(self, text: str, model_name: str) -> int:
+        """Count prompt tokens with the Vertex AI tokenizer (one round trip)."""
+        return self._get_model(model_name).count_tokens(text).total_tokens
 
     # ── shared safety settings for medical content ──────────────────────
     
@@ -53,14 +110,124 @@ class VertexAIService:
         # If no code block, return as-is
         return text
 
+    def _parse_json_text(self, text: str, context: str, structured: bool):
+        """
+        Parse the model's JSON text. Structured-output responses are bare JSON;
+        free-form ones are first unwrapped from a markdown fence. Near-valid
+        JSON (trailing commas, an unterminated tail) is repaired instead of
+        failing the whole generation.
+
+        Raises:
+            json.JSONDecodeError: If the text cannot be parsed or repaired.
+        """
+        json_text = text.strip() if structured else self._extract_json_from_response(text)
+        if not json_text:
+            raise Exception("No JSON content found in response")
+        parsed, repaired = loads_lenient(json_text, context)
+        if repaired:
+            self.json_repairs += 1
+        return parsed
+
+    # ── response validation ─────────────────────────────────────────────
+
+    @staticmethod
+    def _check_finish_reason(candidate, context: str):
+        """
+        Raise if a candidate stopped for any reason other than STOP.
+
+        Raises:
+            MaxTokensError: If the response was truncated by the token limit.
+            Exception:      For SAFETY, RECITATION, OTHER, etc.
+        """
+        if not hasattr(candidate, 'finish_reason') or candidate.finish_reason == FinishReason.STOP:
+            return
+
+        finish_reason_name = (
+            candidate.finish_reason.name
+            if hasattr(candidate.finish_reason, 'name')
+            else str(candidate.finish_reason)
+        )
+
+        # Build optional safety info string
+        safety_info = ""
+        if hasattr(candidate, 'safety_ratings'):
+            safety_info = "\nSafety Ratings: " + str([
+                f"{rating.category.name}: {rating.probability.name}"
+                for rating in candidate.safety_ratings
+            ])
+
+        if candidate.finish_reason == FinishReason.MAX_TOKENS:
+            raise MaxTokensError(
+                f"Hit max tokens during {context}. "
+                f"Finish reason: {finish_reason_name}{safety_info}"
+            )
+
+        partial_preview = ""
+        if hasattr(candidate.content, 'parts') and candidate.content.parts:
+            partial_preview = f"\nPartial content: {candidate.content.parts[0].text[:200]}"
+
+        raise Exception(
+            f"{context} incomplete. "
+            f"Finish reason: {finish_reason_name}{safety_info}{partial_preview}"
+        )
+
     # ── common generate-and-parse pipeline ──────────────────────────────
-    
+
+    def _is_structured(self, response_schema: dict) -> bool:
+        """Whether a call with this response schema uses structured output."""
+        return response_schema is not None and self.structured_output
+
+    def _generation_config(self, temperature: float, max_output_tokens: int, response_schema: dict = None):
+        """
+        Return the GenerationConfig for a call. With a response schema and
+        structured output enabled, the model is asked for JSON matching it.
+        """
+        if self._is_structured(response_schema):
+            return GenerationConfig(
+                temperature=temperature,
+                max_output_tokens=max_output_tokens,
+                response_mime_type='application/json',
+                response_schema=response_schema,
+            )
+        return GenerationConfig(
+            temperature=temperature,
+            max_output_tokens=max_output_tokens,
+        )
+
+    def _inflight_key(self, prompt: str, temperature: float, budget: TokenBudget, response_schema: dict = None) -> str:
+        """Return the single-flight key identifying a model call."""
+        schema = json.dumps(response_schema, sort_keys=True) if self._is_structured(response_schema) else ''
+        return make_cache_key('generate', budget.model_name, temperature, budget.max_output_tokens, schema, prompt)
+
     def _generate_json_response(
         self,
         prompt: str,
         temperature: float,
-        max_output_tokens: int,
+        budget: TokenBudget,
+        context: str,
+        response_schema: dict = None,
+    ):
+        """
+        Generate and parse a JSON response, coalescing concurrent identical calls.
+
+        A call with the same model, prompt and generation config as one that
+        is still running waits for that call instead of starting another.
+        Every caller receives its own copy of the parsed result. Arguments,
+        return value and exceptions are those of ``_call_model_for_json``.
+        """
+        key = self._inflight_key(prompt, temperature, budget, response_schema)
+        result = self.inflight.do(
+            key, lambda: self._call_model_for_json(prompt, temperature, budget, context, response_schema),
+        )
+        return copy.deepcopy(result)
+
+    def _call_model_for_json(
+        self,
+        prompt: str,
+        temperature: float,
+        budget: TokenBudget,
         context: str,
+        response_schema: dict = None,
     ):
         """
         Call the model, validate the response, extract JSON and return the
@@ -69,9 +236,12 @@ class VertexAIService:
         Args:
             prompt:            The full prompt to send.
             temperature:       Sampling temperature.
-            max_output_tokens: Token budget for the response.
+            budget:            Planned model and output token budget (``TokenBudgetPlanner.plan``).
             context:           Human-readable label used in error messages
                                (e.g. "question generation", "SOAP processing").
+            response_schema:   Optional Vertex AI response schema. When given
+                               (and VERTEX_STRUCTURED_OUTPUT is on) the model
+                               returns bare JSON of that shape.
 
         Returns:
             Parsed JSON (dict or list).
@@ -81,14 +251,13 @@ class VertexAIService:
             Exception:      For any other generation or parsing failure.
         """
         try:
-            response = self.model.generate_content(
+            model = self._get_model(budget.model_name)
+            response = self.caller.call(lambda: model.generate_content(
                 prompt,
-                generation_config=GenerationConfig(
-                    temperature=temperature,
-                    max_output_tokens=max_output_tokens,
-                ),
+                generation_config=self._generation_config(temperature, budget.max_output_tokens, response_schema),
                 safety_settings=self._get_safety_settings(),
-            )
+            ), key=budget.task)
+            self.token_budget.record(budget, getattr(response, 'usage_metadata', None), context)
 
             # ── validate candidates ──────────────────────────────────
             if not response.candidates:
@@ -97,46 +266,85 @@ class VertexAIService:
             candidate = response.candidates[0]
 
             # ── check finish reason ──────────────────────────────────
-            if hasattr(candidate, 'finish_reason') and candidate.finish_reason != FinishReason.STOP:
-                finish_reason_name = (
-                    candidate.finish_reason.name
-                    if hasattr(candidate.finish_reason, 'name')
-                    else str(candidate.finish_reason)
-                )
-
-                # Build optional safety info string
-                safety_info = ""
-                if hasattr(candidate, 'safety_ratings'):
-                    safety_info = "\nSafety Ratings: " + str([
-                        f"{rating.category.name}: {rating.probability.name}"
-                        for rating in candidate.safety_ratings
-                    ])
-
-                if candidate.finish_reason == FinishReason.MAX_TOKENS:
-                    raise MaxTokensError(
-                        f"Hit max tokens during {context}. "
-                        f"Finish reason: {finish_reason_name}{safety_info}"
-                    )
-
-                # For SAFETY, RECITATION, OTHER, etc.
-                partial_preview = ""
-                if hasattr(candidate.content, 'parts') and candidate.content.parts:
-                    partial_preview = f"\nPartial content: {candidate.content.parts[0].text[:200]}"
-
-                raise Exception(
-                    f"{context} incomplete. "
-                    f"Finish reason: {finish_reason_name}{safety_info}{partial_preview}"
-                )
+            self._check_finish_reason(candidate, context)
 
             # ── extract text ─────────────────────────────────────────
             if not response or not hasattr(response, 'text') or not response.text:
                 raise Exception("Model returned empty response")
 
-            json_text = self._extract_json_from_response(response.text)
-            if not json_text:
-                raise Exception("No JSON content found in response")
+            return self._parse_json_text(response.text, context, self._is_structured(response_schema))
+
+        except (MaxTokensError, json.JSONDecodeError):
+            raise  # let callers handle these specifically
+        except Exception as e:
+            raise Exception(f"Failed during {context}: {str(e)}")
 
-            return json.loads(json_text)
+    def _stream_json_response(
+        self,
+        prompt: str,
+        temperature: float,
+        budget: TokenBudget,
+        context: str,
+        on_section,
+        response_schema: dict = None,
+    ):
+        """
+        Like ``_call_model_for_json``, but streams the response and calls
+        ``on_section(key, value)`` for each top-level member of the JSON
+        object as soon as it is complete. The return value is the whole
+        response parsed at the end, exactly as in the non-streaming call.
+
+        The whole stream is one attempt of the call layer (never hedged).
+        Only the current attempt delivers sections, so a timed-out attempt
+        still running in the background cannot interleave with its retry.
+        """
+        attempts = {'current': 0}
+
+        def consume():
+            attempts['current'] += 1
+            attempt = attempts['current']
+            parser = JsonSectionParser()
+            pieces = []
+            last_candidate = None
+            usage = None
+            stream = self._get_model(budget.model_name).generate_content(
+                prompt,
+                generation_config=self._generation_config(temperature, budget.max_output_tokens, response_schema),
+                safety_settings=self._get_safety_settings(),
+                stream=True,
+            )
+            for chunk in stream:
+                usage = getattr(chunk, 'usage_metadata', None) or usage
+                if not chunk.candidates:
+                    continue
+                last_candidate = chunk.candidates[0]
+                try:
+                    text = chunk.text
+                except ValueError:
+                    text = ''  # e.g. the final chunk carrying only the finish reason
+                if not text:
+                    continue
+                pieces.append(text)
+                for key, value in parser.feed(text):
+                    if attempts['current'] == attempt:
+                        on_section(key, value)
+            return ''.join(pieces), last_candidate, usage
+
+        try:
+            try:
+                full_text, last_candidate, usage = self.caller.call(consume, hedge=False, key=budget.task)
+            finally:
+                attempts['current'] = None  # abandoned attempts stop delivering
+            self.token_budget.record(budget, usage, context)
+
+            # ── validate the final chunk ─────────────────────────────
+            if last_candidate is None:
+                raise Exception("Model response was blocked or had no candidates")
+            self._check_finish_reason(last_candidate, context)
+
+            if not full_text:
+                raise Exception("Model returned empty response")
+            return self._parse_json_text(full_text, context, self._is_structured(response_schema))
 
         except (MaxTokensError, json.JSONDecodeError):
             raise  # let callers handle these specifically
@@ -146,9 +354,9 @@ class VertexAIService:
     @staticmethod
     def _create_summary_prompt(input_text: str, schema_version: str) -> str:
         """
-        Build the summary prompt by loading the prompt template and JSON schema
-        for the given schema version, then substituting the ``{{input}}`` and
-        ``{{schema}}`` placeholders.
+        Build the summary prompt for the given schema version from the schema
+        registry (templates are loaded and pre-split once, so this is a single
+        join with no disk access).
 
         Args:
             input_text:     The raw input text (transcript / notes / combined).
@@ -159,39 +367,9 @@ class VertexAIService:
             Fully assembled prompt string ready to send to the model.
 
         Raises:
-            FileNotFoundError: If the schema version folder or files don't exist.
+            FileNotFoundError: If the schema version doesn't exist or failed validation.
         """
-        # Resolve paths relative to *this* file  (utils/ → ../summarySchema/<ver>/)
-        base_dir = os.path.join(
-            os.path.dirname(__file__), '..', 'summarySchema', schema_version
-        )
-        prompt_path = os.path.join(base_dir, 'prompt.txt')
-        schema_path = os.path.join(base_dir, 'schema.json')
-
-        if not os.path.isfile(prompt_path):
-            raise FileNotFoundError(
-                f"Prompt template not found for schema version {schema_version}: {prompt_path}"
-            )
-        if not os.path.isfile(schema_path):
-            raise FileNotFoundError(
-                f"Schema file not found for schema version {schema_version}: {schema_path}"
-            )
-
-        with open(prompt_path, 'r', encoding='utf-8') as f:
-            prompt_template = f.read()
-
-        with open(schema_path, 'r', encoding='utf-8') as f:
-            schema_content = f.read()
-
-        # Substitute placeholders using .replace() so that literal { } in the
-        # schema JSON and prompt text are preserved (no f-string escaping needed).
-        prompt = (
-            prompt_template
-            .replace('{{input}}', input_text)
-            .replace('{{schema}}', schema_content)
-        )
-
-        return prompt
+        return get_schema_registry().build_prompt(schema_version, input_text)
 
     # ── public methods ──────────────────────────────────────────────────
     
@@ -224,7 +402,7 @@ These questions should be:
 The objective is just to find points from the transcript that might need further clarification. If there are no such clarifying questions, DO NOT return anything.
 
 Raw Input:
-{{input}}
+{transcript}
 
 Return ONLY a JSON array of question strings, nothing else. Format: ["question 1", "question 2", "question 3"]
 """
@@ -233,8 +411,9 @@ Return ONLY a JSON array of question strings, nothing else. Format: ["question 1
             questions = self._generate_json_response(
                 prompt=prompt,
                 temperature=0.2,
-                max_output_tokens=2048,
+                budget=self.token_budget.plan('questions', prompt),
                 context="question generation",
+                response_schema=self.QUESTIONS_RESPONSE_SCHEMA,
             )
 
             # Ensure we have a list and limit to 3 questions
@@ -251,30 +430,178 @@ Return ONLY a JSON array of question strings, nothing else. Format: ["question 1
             )
         except Exception as e:
             raise Exception(f"Failed to generate questions: {str(e)}")
+
+    def update_questions(self, digest: str, questions: list, transcript_delta: str, digest_max_words: int = 250) -> dict:
+        """
+        Incremental question generation for a transcript that keeps growing.
+
+        Instead of the whole transcript, the model receives a compact digest
+        of the conversation so far, the questions already suggested and only
+        the new part of the transcript. It returns an updated digest and the
+        current 0-3 questions, so input size stays flat over a long recording.
+
+        Args:
+            digest:           Digest returned by the previous call ('' on the first call).
+            questions:        Questions returned by the previous call.
+            transcript_delta: Transcript text added since the previous call.
+            digest_max_words: Length limit for the updated digest.
+
+        Returns:
+            Dict with ``digest`` (str) and ``questions`` (list of at most 3 strings).
+        """
+        previous = "\n".join(f"- {question}" for question in questions) or "(none yet)"
+        prompt = f"""You are a medical assistant following a medical appointment while it is being recorded. You help the patient gain clarity by suggesting 0-3 critical follow-up questions to ask their doctor.
+
+Assume at least two speakers (doctor and patient); treat the doctor's words as ground truth for medical information.
+
+You are given:
+1. A digest of the conversation so far (empty at the start).
+2. The questions suggested so far.
+3. The NEW part of the transcript since the digest was written.
+
+Tasks:
+- Update the digest so it covers the whole conversation so far: symptoms, history, findings, diagnoses, medications, tests, plans and anything left unclear. Keep the doctor's wording for medical terms, keep numbers and doses exact, and stay under {digest_max_words} words. Do not add anything that was not said.
+- Return the 0-3 most relevant questions for the conversation as a whole. Keep earlier questions that are still open, and drop those the new part answered. Do not hallucinate outside the conversation; if nothing needs clarification, return no questions.
+
+Digest so far:
+{digest or "(empty)"}
+
+Questions so far:
+{previous}
+
+New transcript:
+{transcript_delta}
+
+Return ONLY a JSON object: {{"digest": "...", "questions": ["question 1", "question 2"]}}
+"""
+
+        try:
+            result = self._generate_json_response(
+                prompt=prompt,
+                temperature=0.2,
+                budget=self.token_budget.plan('question_update', prompt),
+                context="incremental question generation",
+                response_schema=self.QUESTION_UPDATE_RESPONSE_SCHEMA,
+            )
+            if not isinstance(result, dict):
+                raise Exception("Expected a JSON object with digest and questions")
+            updated_questions = result.get('questions')
+            return {
+                'digest': str(result.get('digest') or digest),
+                'questions': updated_questions[:3] if isinstance(updated_questions, list) else [],
+            }
+
+        except MaxTokensError:
+            print("Warning: Hit max tokens during incremental question generation. Keeping previous questions.")
+            return {'digest': digest, 'questions': list(questions)}
+        except json.JSONDecodeError as e:
+            raise Exception(
+                f"Failed to parse JSON response during incremental question generation. Error: {str(e)}"
+            )
+        except Exception as e:
+            raise Exception(f"Failed to update questions: {str(e)}")
     
-    def process_transcript_to_soap(self, input_text: str, schema_version: str = "1.3") -> dict:
+    @staticmethod
+    def _summary_response_schema(schema_version: str) -> dict:
+        """Return the structured-output response schema for a summary schema version."""
+        return get_schema_registry().response_schema(schema_version)
+
+    def _soap_cache_key(self, prompt: str, budget: TokenBudget) -> str:
+        """Return the response cache key for a fully assembled SOAP prompt and its planned budget."""
+        generation_config = json.dumps({
+            'temperature': self.SOAP_TEMPERATURE,
+            'maxOutputTokens': budget.max_output_tokens,
+            'structuredOutput': self.structured_output,
+        }, sort_keys=True)
+        return make_cache_key('soap', budget.model_name, generation_config, prompt)
+
+    def process_transcript_to_soap(self, input_text: str, schema_version: str = "1.3", force_regenerate: bool = False,
+                                   on_section=None) -> dict:
         """
         Process raw input into a structured medical summary using the prompt
         template and JSON schema defined by *schema_version*.
 
+        Identical prompts (same input, schema version, model and generation
+        config) are answered from ``response_cache`` when one is configured.
+
         Args:
-            input_text:      The raw, unprocessed input (transcript / notes / combined).
-            schema_version:  Schema version folder to load (default ``"1.3"``).
+            input_text:       The raw, unprocessed input (transcript / notes / combined).
+            schema_version:   Schema version folder to load (default ``"1.3"``).
+            force_regenerate: Skip the cache lookup and call the model (the
+                              new response still replaces the cached one).
+            on_section:       Optional ``callback(key, value)``. With it, a
+                              single-pass summary is streamed and each top-level
+                              section is delivered as soon as it is generated.
+                              Sections not delivered early (cache hit, map-reduce)
+                              are delivered when the summary is complete.
+                              Callback errors are logged and ignored.
 
         Returns:
             Dictionary with the structured summary.
         """
 
         prompt = self._create_summary_prompt(input_text, schema_version)
+        response_schema = self._summary_response_schema(schema_version)
+        budget = self.token_budget.plan('summary', prompt)
+
+        delivered = set()
+
+        def deliver(key, value):
+            delivered.add(key)
+            try:
+                on_section(key, value)
+            except Exception as e:
+                print(f"[SOAP] Section callback failed for {key}: {str(e)}")
+
+        def deliver_remaining(soap_notes):
+            if on_section is not None and isinstance(soap_notes, dict):
+                for key, value in soap_notes.items():
+                    if key not in delivered:
+                        deliver(key, value)
+            return soap_notes
+
+        cache_key = None
+        if self.response_cache is not None:
+            cache_key = self._soap_cache_key(prompt, budget)
+            if force_regenerate:
+                print(f"[SOAP Cache] Forced regeneration, skipping lookup for {cache_key[:12]}")
+            else:
+                cached = self.response_cache.get(cache_key)
+                if cached is not None:
+                    return deliver_remaining(json.loads(cached))
 
         try:
-            soap_notes = self._generate_json_response(
-                prompt=prompt,
-                temperature=0.3,
-                max_output_tokens=65000,
-                context="SOAP processing",
-            )
-            return soap_notes
+            if budget.strategy == 'map_reduce':
+                print(f"[SOAP] Prompt is ~{budget.input_tokens} tokens (threshold {SUMMARY_MAP_REDUCE_THRESHOLD_TOKENS}), "
+                      f"using map-reduce summarization")
+                soap_notes = self._summarize_map_reduce(input_text, schema_version)
+            else:
+                try:
+                    if on_section is not None:
+                        # Concurrent identical requests share the stream; followers get the final result
+                        key = self._inflight_key(prompt, self.SOAP_TEMPERATURE, budget, response_schema)
+                        soap_notes = copy.deepcopy(self.inflight.do(key, lambda: self._stream_json_response(
+                            prompt=prompt,
+                            temperature=self.SOAP_TEMPERATURE,
+                            budget=budget,
+                            context="SOAP processing",
+                            on_section=deliver,
+                            response_schema=response_schema,
+                        )))
+                    else:
+                        soap_notes = self._generate_json_response(
+                            prompt=prompt,
+                            temperature=self.SOAP_TEMPERATURE,
+                            budget=budget,
+                            context="SOAP processing",
+                            response_schema=response_schema,
+                        )
+                except MaxTokensError:
+                    print(f"[SOAP] Single-pass summary hit the output token limit, retrying with map-reduce")
+                    soap_notes = self._summarize_map_reduce(input_text, schema_version)
+            if cache_key is not None:
+                self.response_cache.set(cache_key, json.dumps(soap_notes))
+            return deliver_remaining(soap_notes)
 
         except MaxTokensError:
             raise Exception(
@@ -287,3 +614,199 @@ Return ONLY a JSON array of question strings, nothing else. Format: ["question 1
             )
         except Exception as e:
             raise Exception(f"Failed to process transcript to SOAP: {str(e)}")
+
+    # ── rolling summary for appointments being recorded ─────────────────
+
+    def update_partial_summary(self, partial_summary: dict, transcript_delta: str, schema_version: str) -> dict:
+        """
+        Fold a new part of a live transcript into the partial summary built so far.
+
+        Args:
+            partial_summary:  Summary of the transcript up to now ({} on the first update).
+            transcript_delta: Transcript added since the partial summary was made.
+            schema_version:   Summary schema version of the partial summary.
+
+        Returns:
+            The updated partial summary (same schema).
+        """
+        schema_text = get_schema_registry().schema_text(schema_version)
+        current = json.dumps(partial_summary, ensure_ascii=False) if partial_summary else "(nothing yet)"
+        prompt = f"""You are a medical assistant summarizing ONE medical appointment while it is still being recorded. Below is the summary of the conversation so far and the next part of the transcript.
+
+Update the summary so it covers the whole conversation up to the end of the new part. Rules:
+- Assume at least two speakers (doctor and patient); treat the doctor's words as ground truth.
+- Add new facts from the new part; keep everything in the current summary that the new part does not change.
+- When the new part corrects or updates something (a dose, a diagnosis, a plan), replace the old entry; do not list both.
+- Keep the doctor's wording for diagnoses, medications, doses and instructions. Do not add any fact that was not said.
+- The appointment is not over: write "title" and "summary" for what has been discussed so far.
+
+Current summary:
+{current}
+
+New part of the transcript:
+{transcript_delta}
+
+Return ONLY a valid JSON object with this structure:
+{schema_text}
+"""
+        return self._generate_json_response(
+            prompt=prompt,
+            temperature=self.SOAP_TEMPERATURE,
+            budget=self.token_budget.plan('summary_update', prompt),
+            context="rolling summary update",
+            response_schema=self._summary_response_schema(schema_version),
+        )
+
+    def reconcile_summary(self, partial_summary: dict, summarized_tail: str, unsummarized_tail: str,
+                          schema_version: str) -> dict:
+        """
+        Finish a rolling summary: fold in the transcript it has not seen yet and
+        reconcile the whole summary, instead of summarizing the visit from scratch.
+
+        Args:
+            partial_summary:   Rolling summary built during the recording.
+            summarized_tail:   The last minutes of transcript already reflected in it (context).
+            unsummarized_tail: Transcript after the rolling summary's watermark.
+            schema_version:    Summary schema version.
+
+        Returns:
+            The final summary (same schema).
+        """
+        schema_text = get_schema_registry().schema_text(schema_version)
+        prompt = f"""You are a medical assistant. The appointment has ended. Below is the summary built while it was being recorded, the last minutes of the transcript that summary already covers (for context only), and the end of the transcript it does not cover yet.
+
+Produce the final summary of the whole appointment. Rules:
+- Assume at least two speakers (doctor and patient); treat the doctor's words as ground truth.
+- Add the facts from the uncovered end of the transcript.
+- Reconcile: merge entries that describe the same item, and when the conversation changed something later (a dose, a diagnosis, a plan), keep only the final version.
+- Write "title" and "summary" for the appointment as a whole.
+- Keep the doctor's wording for diagnoses, medications, doses and instructions. Do not add any fact that was not said.
+
+Summary built during the recording:
+{json.dumps(partial_summary, ensure_ascii=False)}
+
+Last minutes already covered by that summary (context only):
+{summarized_tail or "(none)"}
+
+End of the transcript not yet covered:
+{unsummarized_tail or "(none)"}
+
+Return ONLY a valid JSON object with this structure:
+{schema_text}
+"""
+        return self._generate_json_response(
+            prompt=prompt,
+            temperature=self.SOAP_TEMPERATURE,
+            budget=self.token_budget.plan('summary_update', prompt),
+            context="summary reconciliation",
+            response_schema=self._summary_response_schema(schema_version),
+        )
+
+    # ── map-reduce summarization for long inputs ────────────────────────
+
+    def _extract_partial_summary(self, window: str, schema_version: str, part: int, total: int) -> dict:
+        """
+        Map step: extract the facts of one window of the input into the summary schema.
+
+        A window that still overflows the output budget is split in half and
+        each half extracted separately; the halves are merged.
+        """
+        schema_text = get_schema_registry().schema_text(schema_version)
+        prompt = f"""You are a medical assistant. The text below is part {part} of {total} of the input for ONE medical appointment (transcript, documents and/or notes), split only because it is long.
+
+Extract every medically relevant fact that appears in THIS part into the JSON structure below. Rules:
+- Use only facts stated in this part; do not infer anything from the other parts.
+- Leave fields empty when this part has nothing for them.
+- Keep the doctor's wording for diagnoses, medications, doses and instructions.
+- "title" and "summary" should describe this part only; they will be merged later.
+
+Input (part {part} of {total}):
+{window}
+
+Return ONLY a valid JSON object with this structure:
+{schema_text}
+"""
+        try:
+            return self._generate_json_response(
+                prompt=prompt,
+                temperature=self.SOAP_TEMPERATURE,
+                budget=self.token_budget.plan('summary_map', prompt),
+                context=f"summary extraction (part {part}/{total})",
+                response_schema=self._summary_response_schema(schema_version),
+            )
+        except MaxTokensError:
+            halves = split_text_windows(window, max(1, estimate_tokens(window) // 2), section_pattern=self.SECTION_HEADER)
+            if len(halves) < 2:
+                raise
+            print(f"[SOAP Map-Reduce] Part {part}/{total} overflowed, splitting it in {len(halves)}")
+            partials = [self._extract_partial_summary(half, schema_version, part, total) for half in halves]
+            return self._merge_partial_summaries(partials, schema_version)
+
+    def _merge_partial_summaries(self, partials: list[dict], schema_version: str) -> dict:
+        """
+        Reduce step: merge partial summaries (in input order) into one summary.
+
+        When the partials together exceed the window budget they are merged
+        in groups first, and the group results merged again.
+        """
+        if len(partials) == 1:
+            return partials[0]
+
+        serialized = [json.dumps(partial, ensure_ascii=False, separators=(',', ':')) for partial in partials]
+        if estimate_tokens(''.join(serialized)) > SUMMARY_WINDOW_TOKENS and len(partials) > 2:
+            groups, current, size = [], [], 0
+            for partial, text in zip(partials, serialized):
+                tokens = estimate_tokens(text)
+                if len(current) >= 2 and size + tokens > SUMMARY_WINDOW_TOKENS:
+                    groups.append(current)
+                    current, size = [], 0
+                current.append(partial)
+                size += tokens
+            groups.append(current)
+            if len(groups) > 1:
+                print(f"[SOAP Map-Reduce] Merging {len(partials)} partial summaries in {len(groups)} groups")
+                with ThreadPoolExecutor(max_workers=max(1, SUMMARY_MAP_CONCURRENCY)) as executor:
+                    merged = list(executor.map(lambda group: self._merge_partial_summaries(group, schema_version), groups))
+                return self._merge_partial_summaries(merged, schema_version)
+
+        schema_text = get_schema_registry().schema_text(schema_version)
+        numbered = "\n\n".join(f"Partial summary {i + 1}:\n{text}" for i, text in enumerate(serialized))
+        prompt = f"""You are a medical assistant. The partial summaries below were extracted, in order, from consecutive parts of ONE medical appointment. Merge them into a single summary of the whole appointment.
+
+Rules:
+- Combine entries that describe the same item (same diagnosis, medication, test, follow-up) into one; do not repeat points.
+- When partial summaries disagree, prefer the later one, since it reflects where the conversation ended up.
+- Write "title" and "summary" for the appointment as a whole.
+- Do not add any fact that is not in the partial summaries.
+
+{numbered}
+
+Return ONLY a valid JSON object with this structure:
+{schema_text}
+"""
+        return self._generate_json_response(
+            prompt=prompt,
+            temperature=self.SOAP_TEMPERATURE,
+            budget=self.token_budget.plan('summary_merge', prompt),
+            context="summary merge",
+            response_schema=self._summary_response_schema(schema_version),
+        )
+
+    def _summarize_map_reduce(self, input_text: str, schema_version: str) -> dict:
+        """
+        Summarize an input too large for one call: split it into windows of
+        ``SUMMARY_WINDOW_TOKENS``, extract partial summaries concurrently
+        (``SUMMARY_MAP_CONCURRENCY``), then merge them into one summary.
+        """
+        windows = split_text_windows(input_text, SUMMARY_WINDOW_TOKENS, section_pattern=self.SECTION_HEADER)
+        total = len(windows)
+        print(f"[SOAP Map-Reduce] Extracting {total} window(s) of up to ~{SUMMARY_WINDOW_TOKENS} tokens")
+
+        with ThreadPoolExecutor(max_workers=max(1, min(SUMMARY_MAP_CONCURRENCY, total))) as executor:
+            partials = list(executor.map(
+                lambda item: self._extract_partial_summary(item[1], schema_version, item[0] + 1, total),
+                enumerate(windows),
+            ))
+
+        print(f"[SOAP Map-Reduce] Merging {len(partials)} partial summaries")
+        return self._merge_partial_summaries(partials, schema_version)